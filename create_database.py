@@ -2,6 +2,9 @@
 """
 Create a pre-built SQLite database for VelocityVer app
 This creates the database with all tables and default data
+
+The schema comes from server/migrations.py, shared with the Flask server;
+only its client migrations are applied here (see migrations.py).
 """
 
 import sqlite3
@@ -9,6 +12,11 @@ import hashlib
 import uuid
 from datetime import datetime
 import os
+import sys
+
+# The schema is defined once, in server/migrations.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+import migrations
 
 def hash_password(password):
     """Hash password using SHA-256 (same as Flutter app)"""
@@ -29,152 +37,9 @@ def create_database():
     
     print("🗄️ Creating database tables...")
     
-    # Create tables
-    tables = [
-        '''CREATE TABLE roles (
-            id TEXT PRIMARY KEY,
-            name TEXT UNIQUE NOT NULL,
-            description TEXT,
-            permissions TEXT NOT NULL,
-            is_active INTEGER DEFAULT 1,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT
-        )''',
-        
-        '''CREATE TABLE faculties (
-            id TEXT PRIMARY KEY,
-            name TEXT UNIQUE NOT NULL,
-            code TEXT UNIQUE NOT NULL,
-            description TEXT,
-            dean_id TEXT,
-            is_active INTEGER DEFAULT 1,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT
-        )''',
-        
-        '''CREATE TABLE departments (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            code TEXT UNIQUE NOT NULL,
-            faculty_id TEXT NOT NULL,
-            description TEXT,
-            hod_id TEXT,
-            is_active INTEGER DEFAULT 1,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT,
-            FOREIGN KEY (faculty_id) REFERENCES faculties (id)
-        )''',
-        
-        '''CREATE TABLE levels (
-            id TEXT PRIMARY KEY,
-            name TEXT UNIQUE NOT NULL,
-            code TEXT UNIQUE NOT NULL,
-            description TEXT,
-            order_index INTEGER NOT NULL,
-            is_active INTEGER DEFAULT 1,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT
-        )''',
-        
-        '''CREATE TABLE years (
-            id TEXT PRIMARY KEY,
-            name TEXT UNIQUE NOT NULL,
-            code TEXT UNIQUE NOT NULL,
-            description TEXT,
-            order_index INTEGER NOT NULL,
-            is_active INTEGER DEFAULT 1,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT
-        )''',
-        
-        '''CREATE TABLE users (
-            id TEXT PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            role_id TEXT NOT NULL,
-            first_name TEXT NOT NULL,
-            last_name TEXT NOT NULL,
-            level_id TEXT,
-            year_id TEXT,
-            department_id TEXT,
-            faculty_id TEXT,
-            is_active INTEGER DEFAULT 1,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT,
-            FOREIGN KEY (role_id) REFERENCES roles (id)
-        )''',
-        
-        '''CREATE TABLE courses (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            code TEXT UNIQUE NOT NULL,
-            description TEXT,
-            level_id TEXT NOT NULL,
-            year_id TEXT NOT NULL,
-            department_id TEXT NOT NULL,
-            faculty_id TEXT NOT NULL,
-            lecturer_id TEXT,
-            is_active INTEGER DEFAULT 1,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT,
-            FOREIGN KEY (lecturer_id) REFERENCES users (id)
-        )''',
-        
-        '''CREATE TABLE files (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            path TEXT NOT NULL,
-            description TEXT,
-            size INTEGER NOT NULL,
-            mime_type TEXT NOT NULL,
-            uploaded_by TEXT NOT NULL,
-            course_id TEXT,
-            target_roles TEXT,
-            is_public INTEGER DEFAULT 0,
-            download_count INTEGER DEFAULT 0,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT,
-            FOREIGN KEY (uploaded_by) REFERENCES users (id),
-            FOREIGN KEY (course_id) REFERENCES courses (id)
-        )''',
-        
-        '''CREATE TABLE announcements (
-            id TEXT PRIMARY KEY,
-            title TEXT NOT NULL,
-            content TEXT NOT NULL,
-            author_id TEXT NOT NULL,
-            target_roles TEXT,
-            target_courses TEXT,
-            is_active INTEGER DEFAULT 1,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT,
-            FOREIGN KEY (author_id) REFERENCES users (id)
-        )''',
-        
-        '''CREATE TABLE user_courses (
-            id TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            course_id TEXT NOT NULL,
-            enrolled_at TEXT NOT NULL,
-            last_sync TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (course_id) REFERENCES courses (id),
-            UNIQUE(user_id, course_id)
-        )'''
-    ]
-    
-    for table in tables:
-        cursor.execute(table)
+    # The server's client-safe migrations only: no server tables, full-text
+    # indexes or change-log triggers, which would write into the app's sync queue
+    migrations.migrate(conn, client=True)
     
     print("✅ Tables created successfully")
     
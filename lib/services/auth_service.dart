@@ -19,10 +19,12 @@ class AuthService {
 
   // State
   User? _currentUser;
+  String? _authToken;
 
   // Constants
   static const String _currentUserKey = 'current_user';
   static const String _isLoggedInKey = 'is_logged_in';
+  static const String _authTokenKey = 'auth_token';
   static const String _defaultServerUrl = 'http://192.168.1.155:5000';
   static const Duration _serverTimeout = Duration(seconds: 10);
 
@@ -30,6 +32,9 @@ class AuthService {
   User? get currentUser => _currentUser;
   bool get isLoggedIn => _currentUser != null;
 
+  /// Session token from the last server login (null after a local login)
+  String? get authToken => _authToken;
+
   /// Initialize the auth service by loading any saved user data
   Future<void> initialize() async {
     await _loadCurrentUser();
@@ -41,6 +46,7 @@ class AuthService {
   Future<bool> login(String username, String password) async {
     try {
       debugPrint('🔐 AuthService: Starting login for $username');
+      _authToken = null;
 
       // Attempt server login first (prioritize online authentication)
       final serverUser = await _attemptServerLogin(username, password);
@@ -71,7 +77,9 @@ class AuthService {
   /// Log out the current user and clear stored data
   Future<void> logout() async {
     debugPrint('🚪 Logging out user: ${_currentUser?.username ?? 'unknown'}');
+    await _revokeServerSession();
     _currentUser = null;
+    _authToken = null;
     await _clearStoredUserData();
   }
 
@@ -287,6 +295,8 @@ class AuthService {
 
       if (response.statusCode == 200) {
         debugPrint('✅ Server authentication successful');
+        final token = jsonDecode(response.body)['token'];
+        _authToken = token is String && token.isNotEmpty ? token : null;
         return _createUserFromServerResponse(username, response);
       } else {
         debugPrint('❌ Server login failed: ${response.statusCode}');
@@ -408,6 +418,11 @@ class AuthService {
           jsonEncode(_currentUser!.toJson()),
         );
         await prefs.setBool(_isLoggedInKey, true);
+        if (_authToken != null) {
+          await prefs.setString(_authTokenKey, _authToken!);
+        } else {
+          await prefs.remove(_authTokenKey);
+        }
       }
     } catch (e) {
       debugPrint('❌ Error saving current user: $e');
@@ -425,6 +440,7 @@ class AuthService {
         if (userJson != null) {
           final userData = jsonDecode(userJson);
           _currentUser = User.fromJson(userData);
+          _authToken = prefs.getString(_authTokenKey);
 
           // Refresh user data from database to ensure it's current
           await _refreshUserFromDatabase();
@@ -459,12 +475,29 @@ class AuthService {
     try {
       final prefs = await SharedPreferences.getInstance();
       await prefs.remove(_currentUserKey);
+      await prefs.remove(_authTokenKey);
       await prefs.setBool(_isLoggedInKey, false);
     } catch (e) {
       debugPrint('❌ Error clearing stored user data: $e');
     }
   }
 
+  /// Invalidate the session token on the server (best effort)
+  Future<void> _revokeServerSession() async {
+    if (_authToken == null) return;
+    try {
+      final serverUrl = await _getServerUrl();
+      await http
+          .post(
+            Uri.parse('$serverUrl/api/auth/logout'),
+            headers: {'Authorization': 'Bearer $_authToken'},
+          )
+          .timeout(_serverTimeout);
+    } catch (e) {
+      debugPrint('⚠️ Could not end server session: $e');
+    }
+  }
+
   /// Get server URL from preferences
   Future<String> _getServerUrl() async {
     try {
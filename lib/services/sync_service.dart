@@ -86,7 +86,10 @@ class SyncService {
             )
             .timeout(const Duration(seconds: 10));
 
-        results[endpoint] = response.statusCode == 200;
+        // The scoped sync endpoints answer 401 without a session token,
+        // which still shows the endpoint is reachable
+        results[endpoint] =
+            response.statusCode == 200 || response.statusCode == 401;
         debugPrint('✅ $endpoint: ${response.statusCode}');
       } catch (e) {
         results[endpoint] = false;
@@ -421,13 +424,9 @@ class SyncService {
 
   // Get authentication token
   String _getAuthToken() {
-    // For now, use a simple token based on user ID
-    // In production, this should be a proper JWT token
-    final user = _authService.currentUser;
-    if (user != null) {
-      return 'user_${user.id}';
-    }
-    return '';
+    // Session token issued by /api/auth/login; the server scopes the sync
+    // endpoints to what this user may see and rejects requests without it
+    return _authService.authToken ?? '';
   }
 
   // Auto-sync when network becomes available
@@ -1,24 +1,52 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
 from flask_cors import CORS
 import sqlite3
 import os
 import hashlib
 import uuid
 import time
+import threading
 from datetime import datetime
 import json
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask import send_from_directory
 import uuid
 from datetime import datetime
+import migrations
+from response_cache import ResponseCache
+from singleflight import SingleFlight
+import row_json
+from upload_store import UploadStore
+from compression import init_compression
+from file_delivery import init_file_delivery, send_download
+import sync_format
+import change_log
+import sync_scope
+import sessions
+import sync_snapshot
+import sync_push
+import enrollment_service
+import chat_service
+import dashboard
+import list_query
+from user_import import UserImporter, ImportFileError
+import job_queue as job_queue_module
+from job_queue import JobQueue, PermanentJobError
+import search_index
+import download_events
+from download_events import DownloadRecorder
 
 app = Flask(__name__)
 CORS(app)
+compressed_body_cache = init_compression(app)
+init_file_delivery(app)
 
 # Configuration
 DATABASE_PATH = 'velocityver.db'
 UPLOAD_FOLDER = 'uploads'
+IMPORT_FOLDER = 'imports'
+SNAPSHOT_FOLDER = 'snapshots'
+MANIFEST_FOLDER = 'manifests'
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
@@ -27,281 +55,156 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Encoded responses of the reference-data endpoints (roles, faculties, ...)
+response_cache = ResponseCache()
+# Encoded dashboards; kept apart so per-user entries do not evict reference data
+dashboard_cache = ResponseCache(max_entries=1024)
+# Identical concurrent reads share one query and encode (singleflight.py)
+request_flight = SingleFlight()
+
 def get_db_connection():
     conn = sqlite3.connect(DATABASE_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_database():
-    """Initialize the database with tables and default data (only if needed)"""
+# Deferred work (imports, reindexing, cleanup); workers start in start_background_work()
+job_queue = JobQueue(get_db_connection, workers=2)
+# Download events are buffered and written in batches; flushing starts in start_background_work()
+download_recorder = DownloadRecorder(get_db_connection)
+
+# Sharded uploads and their per-course manifests (upload_store.py); files
+# found by a folder scan are hashed by a hash_uploads job
+upload_store = UploadStore(app.config['UPLOAD_FOLDER'], MANIFEST_FOLDER,
+                           hash_later=lambda course_id: job_queue.enqueue(
+                               'hash_uploads', {'course_id': course_id}, priority=-1))
+
+def fetch_rows(query, params=()):
+    """Run a read query and return (column names, rows)"""
     conn = get_db_connection()
+    cursor = conn.execute(query, params)
+    columns = [column[0] for column in cursor.description]
+    rows = cursor.fetchall()
+    conn.close()
+    return columns, rows
+
+def sync_filter(timestamp_column='updated_at'):
+    """WHERE condition for incremental sync, as (condition or None, params)
+
+    ?since_seq=<cursor> selects rows written after a change sequence number
+    (exact and index-driven). The legacy ?since=<ISO timestamp> is still
+    honoured for older clients.
+    """
+    since_seq = request.args.get('since_seq', type=int)
+    if since_seq is not None:
+        return 'change_seq > ?', [since_seq]
+
+    since = request.args.get('since', '')
+    if since:
+        return f'{timestamp_column} > ?', [since]
+
+    return None, []
+
+def fetch_sync_rows(query, params=()):
+    """Like fetch_rows(), plus the change cursor read from the same snapshot"""
+    conn = get_db_connection()
+    conn.execute('BEGIN')
+    cursor = conn.execute(query, params)
+    columns = [column[0] for column in cursor.description]
+    rows = cursor.fetchall()
+    change_cursor = change_log.current_cursor(conn)
+    conn.commit()
+    conn.close()
+    return columns, rows, change_cursor
+
+def scoped_sync_response(table, key='items', condition=None, order_by=None, timestamp_column='updated_at',
+                         listing=False):
+    """Sync response with the rows of table the caller may see (see sync_scope.py)
+
+    condition is an extra filter such as 'is_active = 1'. Callers without a
+    valid session token get 401. With listing, the request may also filter,
+    sort, project and page the rows (see list_query.py).
+    """
+    conn = get_db_connection()
+    scope = sync_scope.scope_for_request(conn, request)
+    data_version = change_log.current_cursor(conn)
+    conn.close()
+    if not scope.authenticated:
+        return jsonify({'error': 'Authentication required'}), 401
 
-    # Check if database already has data
-    try:
-        user_count = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
-        if user_count > 0:
-            print(f"✅ Database already initialized with {user_count} users")
-            conn.close()
-            return
-    except sqlite3.OperationalError:
-        # Tables don't exist yet, continue with initialization
-        print("🔄 Database tables don't exist, creating them...")
-        pass
-    
-    # Create tables (same structure as Flutter app)
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS roles (
-            id TEXT PRIMARY KEY,
-            name TEXT UNIQUE NOT NULL,
-            description TEXT,
-            permissions TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT
-        )
-    ''')
-    
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS faculties (
-            id TEXT PRIMARY KEY,
-            name TEXT UNIQUE NOT NULL,
-            description TEXT,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT
-        )
-    ''')
-    
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS departments (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            faculty_id TEXT NOT NULL,
-            description TEXT,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT,
-            FOREIGN KEY (faculty_id) REFERENCES faculties (id)
-        )
-    ''')
-    
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS levels (
-            id TEXT PRIMARY KEY,
-            name TEXT UNIQUE NOT NULL,
-            description TEXT,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT
-        )
-    ''')
-    
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS years (
-            id TEXT PRIMARY KEY,
-            name TEXT UNIQUE NOT NULL,
-            description TEXT,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT
-        )
-    ''')
-    conn.execute('''
-    CREATE TABLE IF NOT EXISTS enrollments (
-    id TEXT PRIMARY KEY,
-    student_id TEXT NOT NULL,
-    course_id TEXT NOT NULL,
-    enrolled_at TEXT DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (student_id) REFERENCES users(id),
-    FOREIGN KEY (course_id) REFERENCES courses(id)
-);
-''')
-    
-    conn.execute('''
-    -- Seed enrollments for student users only
-INSERT INTO enrollments (id, student_id, course_id, enrolled_at) VALUES
-  ('enroll_1', 'user_student', 'course_cs_101', CURRENT_TIMESTAMP),
-  ('enroll_2', 'user_student_cs_1', 'course_cs_101', CURRENT_TIMESTAMP),
-  ('enroll_3', 'user_student_cs_2', 'course_cs_102', CURRENT_TIMESTAMP),
-  ('enroll_4', 'user_student_ee_1', 'course_ee_101', CURRENT_TIMESTAMP),
-  ('enroll_5', 'user_student_math_1', 'course_math_101', CURRENT_TIMESTAMP);
-''')
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id TEXT PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            role_id TEXT NOT NULL,
-            first_name TEXT NOT NULL,
-            last_name TEXT NOT NULL,
-            level_id TEXT,
-            year_id TEXT,
-            department_id TEXT,
-            faculty_id TEXT,
-            profile_picture TEXT,
-            is_active INTEGER DEFAULT 1,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT,
-            FOREIGN KEY (role_id) REFERENCES roles (id)
-        )
-    ''')
-
-    # Add profile_picture column if it doesn't exist (for existing databases)
     try:
-        conn.execute('ALTER TABLE users ADD COLUMN profile_picture TEXT')
-    except sqlite3.OperationalError:
-        # Column already exists
-        pass
-    
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS courses (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            code TEXT UNIQUE NOT NULL,
-            description TEXT,
-            level_id TEXT NOT NULL,
-            year_id TEXT NOT NULL,
-            department_id TEXT NOT NULL,
-            faculty_id TEXT NOT NULL,
-            lecturer_id TEXT,
-            is_active INTEGER DEFAULT 1,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT,
-            FOREIGN KEY (lecturer_id) REFERENCES users (id)
-        )
-    ''')
-    
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS files (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            original_name TEXT NOT NULL,
-            file_path TEXT NOT NULL,
-            file_size INTEGER NOT NULL,
-            mime_type TEXT NOT NULL,
-            course_id TEXT NOT NULL,
-            uploaded_by TEXT NOT NULL,
-            description TEXT,
-            is_synced INTEGER DEFAULT 1,
-            local_path TEXT,
-            server_path TEXT,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT,
-            FOREIGN KEY (course_id) REFERENCES courses (id),
-            FOREIGN KEY (uploaded_by) REFERENCES users (id)
-        )
-    ''')
-    
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS announcements (
-            id TEXT PRIMARY KEY,
-            title TEXT NOT NULL,
-            content TEXT NOT NULL,
-            author_id TEXT NOT NULL,
-            target_roles TEXT,
-            target_courses TEXT,
-            is_active INTEGER DEFAULT 1,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT,
-            FOREIGN KEY (author_id) REFERENCES users (id)
-        )
-    ''')
-
-    # Chat system for admin-lecturer communication
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id TEXT PRIMARY KEY,
-            content TEXT NOT NULL,
-            sender_id TEXT NOT NULL,
-            receiver_id TEXT,
-            chat_room_id TEXT,
-            message_type TEXT DEFAULT 'text',
-            file_id TEXT,
-            file_name TEXT,
-            file_url TEXT,
-            is_read INTEGER DEFAULT 0,
-            is_delivered INTEGER DEFAULT 0,
-            read_at TEXT,
-            delivered_at TEXT,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT,
-            FOREIGN KEY (sender_id) REFERENCES users (id),
-            FOREIGN KEY (receiver_id) REFERENCES users (id),
-            FOREIGN KEY (chat_room_id) REFERENCES chat_rooms (id)
-        )
-    ''')
+        page = list_query.parse(table, request.args) if listing else None
+        columns, params = scope.columns(table, page.fields if page else None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    conditions = [condition] if condition else []
+    for extra_condition, extra_params in (scope.filter(table), sync_filter(timestamp_column)):
+        if extra_condition:
+            conditions.append(extra_condition)
+            params += extra_params
+    if page:
+        conditions += page.conditions
+        params += page.params
+        order_by = page.order_by
+
+    query = f'SELECT {columns} FROM {table}'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    if order_by:
+        query += f' ORDER BY {order_by}'
+    paged = page is not None and page.limit is not None
+    if paged:
+        # One row more than the page tells whether there is a next page
+        query += ' LIMIT ? OFFSET ?'
+        params += [page.limit + 1, page.offset]
+    fmt = sync_format.negotiate_format(request)
+
+    def build():
+        columns, rows, cursor = fetch_sync_rows(query, params)
+        extra = {'cursor': cursor}
+        if paged:
+            extra.update(limit=page.limit, offset=page.offset, has_more=len(rows) > page.limit)
+            rows = rows[:page.limit]
+        return encode_sync_body(key, columns, rows, fmt, extra)
+
+    # Callers whose scope yields the same query (e.g. students of the same
+    # courses) share one fetch and encode while the data is unchanged
+    body, mimetype = request_flight.do((query, tuple(params), key, fmt, data_version), build,
+                                       request.url_rule.rule)
+    response = Response(body, mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+def encode_sync_body(key, columns, rows, fmt, extra=None):
+    """Encode sync rows as (body, mimetype) in the negotiated format"""
+    if fmt == sync_format.JSON:
+        # Same JSON jsonify() produces, written straight from the row tuples
+        return row_json.encode_payload(key, columns, rows, extra), 'application/json'
+    return sync_format.encode_rows(key, columns, rows, fmt, extra)
+
+def rows_response(rows, key=None, extra=None, status=200):
+    """JSON response for a list of sqlite3.Row: an array of objects, or
+    {key: [...], **extra}"""
+    columns = rows[0].keys() if rows else []
+    if key is None:
+        body = row_json.encode_rows(columns, rows)
+    else:
+        body = row_json.encode_payload(key, columns, rows, extra)
+    return Response(body, status=status, mimetype='application/json')
 
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS chat_rooms (
-    id TEXT PRIMARY KEY,
-    name TEXT NOT NULL,
-    created_by TEXT NOT NULL, -- user_id of creator (admin or lecturer)
-    created_at TEXT NOT NULL,
-    updated_at TEXT NOT NULL
-);
-''')
-    conn.execute('''CREATE TABLE IF NOT EXISTS chat_participants (
-    id TEXT PRIMARY KEY,
-    room_id TEXT NOT NULL,
-    user_id TEXT NOT NULL,
-    joined_at TEXT NOT NULL,
-    FOREIGN KEY (room_id) REFERENCES chat_rooms(id),
-    FOREIGN KEY (user_id) REFERENCES users(id)
-);
-''')
-    conn.execute('''CREATE TABLE IF NOT EXISTS chat_messages (
-    id TEXT PRIMARY KEY,
-    room_id TEXT NOT NULL,
-    sender_id TEXT NOT NULL,
-    message TEXT NOT NULL,
-    created_at TEXT NOT NULL,
-    FOREIGN KEY (room_id) REFERENCES chat_rooms(id),
-    FOREIGN KEY (sender_id) REFERENCES users(id)
-);
-
-    ''')
-
-    # Student enrollment requests from lecturers to admins
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS enrollment_requests (
-            id TEXT PRIMARY KEY,
-            lecturer_id TEXT NOT NULL,
-            course_id TEXT NOT NULL,
-            student_ids TEXT NOT NULL,
-            request_type TEXT NOT NULL,
-            reason TEXT,
-            status TEXT DEFAULT 'pending',
-            admin_response TEXT,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            FOREIGN KEY (lecturer_id) REFERENCES users (id),
-            FOREIGN KEY (course_id) REFERENCES courses (id)
-        )
-    ''')
-    
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS user_courses (
-            id TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            course_id TEXT NOT NULL,
-            enrolled_at TEXT NOT NULL,
-            last_sync TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (course_id) REFERENCES courses (id),
-            UNIQUE(user_id, course_id)
-        )
-    ''')
-    
-    # Insert default data if not exists
-    now = datetime.now().isoformat()
-    
-    # Default roles with updated permissions based on requirements
+def _hash_missing_passwords(conn, users):
+    """Hash passwords only for seed users that are not in the database yet"""
+    placeholders = ','.join('?' for _ in users)
+    existing = {row[0] for row in conn.execute(
+        f'SELECT id FROM users WHERE id IN ({placeholders})', [user[0] for user in users]
+    )}
+    return [(user, generate_password_hash(user[3])) for user in users if user[0] not in existing]
+
+def _seed_default_data(conn, now):
+    """Insert the default reference data and demo accounts in batches.
+
+    Returns the number of seed rows per table for the startup summary.
+    """
     roles = [
         ('role_student', 'Student', 'Student role - view/download files from enrolled courses only',
          'view_enrolled_courses,download_files,view_targeted_announcements,edit_profile_basic'),
@@ -313,18 +216,12 @@ INSERT INTO enrollments (id, student_id, course_id, enrolled_at) VALUES
          'full_access,manage_admins,view_system_logs,backup_restore,view_analytics,dual_password_auth'),
     ]
 
-    print("🔧 Creating default roles...")
-    for role_id, name, description, permissions in roles:
-        conn.execute('''
-            INSERT OR IGNORE INTO roles (id, name, description, permissions, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (role_id, name, description, permissions, now, now))
-        print(f"   ✅ Role: {name}")
-
-    # Verify roles were created
-    role_count = conn.execute('SELECT COUNT(*) FROM roles').fetchone()[0]
-    print(f"📊 Total roles in database: {role_count}")
-    
+    conn.executemany('''
+        INSERT OR IGNORE INTO roles (id, name, description, permissions, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(role_id, name, description, permissions, now, now)
+          for role_id, name, description, permissions in roles])
+
     # Default users for testing
     default_users = [
         ('user_super_admin', 'superadmin', 'superadmin@velocityver.com', 'admin123', 'role_super_admin', 'Super', 'Admin'),
@@ -333,19 +230,13 @@ INSERT INTO enrollments (id, student_id, course_id, enrolled_at) VALUES
         ('user_student', 'student', 'student@velocityver.com', 'student123', 'role_student', 'Test', 'Student'),
     ]
 
-    print("👥 Creating default users...")
-    for user_id, username, email, password, role_id, first_name, last_name in default_users:
-        password_hash = generate_password_hash(password)
-        conn.execute('''
-            INSERT OR IGNORE INTO users (id, username, email, password_hash, role_id, first_name, last_name, is_active, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, username, email, password_hash, role_id, first_name, last_name, 1, now, now))
-        print(f"   ✅ User: {username}")
-
-    # Verify users were created
-    user_count = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
-    print(f"📊 Total users in database: {user_count}")
-    
+    conn.executemany('''
+        INSERT OR IGNORE INTO users (id, username, email, password_hash, role_id, first_name, last_name, is_active, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(user_id, username, email, password_hash, role_id, first_name, last_name, 1, now, now)
+          for (user_id, username, email, _, role_id, first_name, last_name), password_hash
+          in _hash_missing_passwords(conn, default_users)])
+
     # Nigerian University Academic Structure
     faculties = [
         ('fac_engineering', 'Faculty of Engineering'),
@@ -360,13 +251,10 @@ INSERT INTO enrollments (id, student_id, course_id, enrolled_at) VALUES
         ('fac_environmental', 'Faculty of Environmental Sciences'),
     ]
 
-    print("🏛️ Creating Nigerian university faculties...")
-    for fac_id, name in faculties:
-        conn.execute('''
-            INSERT OR IGNORE INTO faculties (id, name, created_at, updated_at)
-            VALUES (?, ?, ?, ?)
-        ''', (fac_id, name, now, now))
-        print(f"   ✅ Faculty: {name}")
+    conn.executemany('''
+        INSERT OR IGNORE INTO faculties (id, name, code, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(fac_id, name, fac_id[len('fac_'):].upper(), now, now) for fac_id, name in faculties])
 
     departments = [
         # Engineering Departments
@@ -433,27 +321,23 @@ INSERT INTO enrollments (id, student_id, course_id, enrolled_at) VALUES
         ('dept_public_law', 'Public Law', 'fac_law'),
     ]
 
-    print("🏢 Creating Nigerian university departments...")
-    for dept_id, name, faculty_id in departments:
-        conn.execute('''
-            INSERT OR IGNORE INTO departments (id, name, faculty_id, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (dept_id, name, faculty_id, now, now))
-        print(f"   ✅ Department: {name}")
-    
+    conn.executemany('''
+        INSERT OR IGNORE INTO departments (id, name, code, faculty_id, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(dept_id, name, dept_id[len('dept_'):].upper(), faculty_id, now, now)
+          for dept_id, name, faculty_id in departments])
+
     levels = [
         ('level_undergraduate', 'Undergraduate'),
         ('level_graduate', 'Graduate (Masters)'),
         ('level_postgraduate', 'Postgraduate (PhD)'),
     ]
 
-    print("🎓 Creating academic levels...")
-    for level_id, name in levels:
-        conn.execute('''
-            INSERT OR IGNORE INTO levels (id, name, created_at, updated_at)
-            VALUES (?, ?, ?, ?)
-        ''', (level_id, name, now, now))
-        print(f"   ✅ Level: {name}")
+    conn.executemany('''
+        INSERT OR IGNORE INTO levels (id, name, code, order_index, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(level_id, name, level_id[len('level_'):].upper(), order, now, now)
+          for order, (level_id, name) in enumerate(levels, start=1)])
 
     years = [
         ('year_1', 'Year 1 (100 Level)'),
@@ -464,13 +348,11 @@ INSERT INTO enrollments (id, student_id, course_id, enrolled_at) VALUES
         ('year_6', 'Year 6 (600 Level)'),
     ]
 
-    print("📅 Creating academic years...")
-    for year_id, name in years:
-        conn.execute('''
-            INSERT OR IGNORE INTO years (id, name, created_at, updated_at)
-            VALUES (?, ?, ?, ?)
-        ''', (year_id, name, now, now))
-        print(f"   ✅ Year: {name}")
+    conn.executemany('''
+        INSERT OR IGNORE INTO years (id, name, code, order_index, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(year_id, name, year_id[len('year_'):].upper(), order, now, now)
+          for order, (year_id, name) in enumerate(years, start=1)])
 
     # Create additional test users with proper academic assignments
     additional_users = [
@@ -491,17 +373,14 @@ INSERT INTO enrollments (id, student_id, course_id, enrolled_at) VALUES
         ('user_admin_3', 'admin_sci', 'admin.sci@admin.edu.ng', 'admin123', 'role_admin', 'Science', 'Admin', None, None, None, 'fac_science'),
     ]
 
-    print("👥 Creating additional test users...")
-    for user_data in additional_users:
-        user_id, username, email, password, role_id, first_name, last_name, level_id, year_id, dept_id, fac_id = user_data
-        password_hash = generate_password_hash(password)
-        conn.execute('''
-            INSERT OR IGNORE INTO users (id, username, email, password_hash, role_id, first_name, last_name,
-                                       level_id, year_id, department_id, faculty_id, is_active, profile_picture, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, username, email, password_hash, role_id, first_name, last_name,
-              level_id, year_id, dept_id, fac_id, 1, 'default_avatar.png', now, now))
-        print(f"   ✅ User: {username} ({role_id.replace('role_', '').title()})")
+    conn.executemany('''
+        INSERT OR IGNORE INTO users (id, username, email, password_hash, role_id, first_name, last_name,
+                                   level_id, year_id, department_id, faculty_id, is_active, profile_picture, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(user_id, username, email, password_hash, role_id, first_name, last_name,
+           level_id, year_id, dept_id, fac_id, 1, 'default_avatar.png', now, now)
+          for (user_id, username, email, _, role_id, first_name, last_name, level_id, year_id, dept_id, fac_id), password_hash
+          in _hash_missing_passwords(conn, additional_users)])
 
     # Create comprehensive course catalog
     courses = [
@@ -526,14 +405,10 @@ INSERT INTO enrollments (id, student_id, course_id, enrolled_at) VALUES
         ('course_gen_102', 'Nigerian Peoples and Culture', 'GST102', 'Introduction to Nigerian culture and history', 'level_undergraduate', 'year_1', 'dept_history', 'fac_arts', 'user_lecturer'),
     ]
 
-    print("📚 Creating course catalog...")
-    for course_data in courses:
-        course_id, name, code, description, level_id, year_id, dept_id, fac_id, lecturer_id = course_data
-        conn.execute('''
-            INSERT OR IGNORE INTO courses (id, name, code, description, level_id, year_id, department_id, faculty_id, lecturer_id, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (course_id, name, code, description, level_id, year_id, dept_id, fac_id, lecturer_id, now, now))
-        print(f"   ✅ Course: {code} - {name}")
+    conn.executemany('''
+        INSERT OR IGNORE INTO courses (id, name, code, description, level_id, year_id, department_id, faculty_id, lecturer_id, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [course + (now, now) for course in courses])
 
     # Create student enrollments
     enrollments = [
@@ -557,15 +432,16 @@ INSERT INTO enrollments (id, student_id, course_id, enrolled_at) VALUES
         # Sarah Wilson (Math Year 4) enrollments
         ('enroll_12', 'user_student_math_1', 'course_math_301'),
         ('enroll_13', 'user_student_math_1', 'course_cs_301'),  # Cross-department enrollment
+        ('enroll_14', 'user_student_math_1', 'course_math_101'),
+
+        # Demo student account
+        ('enroll_15', 'user_student', 'course_cs_101'),
     ]
 
-    print("📝 Creating student enrollments...")
-    for enroll_id, user_id, course_id in enrollments:
-        conn.execute('''
-            INSERT OR IGNORE INTO user_courses (id, user_id, course_id, enrolled_at, last_sync)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (enroll_id, user_id, course_id, now, now))
-        print(f"   ✅ Enrolled: {user_id} in {course_id}")
+    conn.executemany('''
+        INSERT OR IGNORE INTO user_courses (id, user_id, course_id, enrolled_at, last_sync)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(enroll_id, user_id, course_id, now, now) for enroll_id, user_id, course_id in enrollments])
 
     # Create sample announcements
     announcements = [
@@ -575,13 +451,10 @@ INSERT INTO enrollments (id, student_id, course_id, enrolled_at) VALUES
         ('ann_4', 'Mathematics Workshop', 'Special workshop on advanced calculus techniques for all mathematics students.', 'user_lecturer_math_1', 'Student', 'course_math_101,course_math_201,course_math_301'),
     ]
 
-    print("📢 Creating sample announcements...")
-    for ann_id, title, content, author_id, target_roles, target_courses in announcements:
-        conn.execute('''
-            INSERT OR IGNORE INTO announcements (id, title, content, author_id, target_roles, target_courses, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (ann_id, title, content, author_id, target_roles, target_courses, now, now))
-        print(f"   ✅ Announcement: {title}")
+    conn.executemany('''
+        INSERT OR IGNORE INTO announcements (id, title, content, author_id, target_roles, target_courses, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [announcement + (now, now) for announcement in announcements])
 
     # Create sample chat messages
     messages = [
@@ -590,85 +463,87 @@ INSERT INTO enrollments (id, student_id, course_id, enrolled_at) VALUES
         ('msg_3', 'Good morning Prof. Adams, please review the new student enrollment requests.', 'user_admin_2', 'user_lecturer_cs_1', None, 'text'),
     ]
 
-    print("💬 Creating sample chat messages...")
-    for msg_id, content, sender_id, receiver_id, chat_room_id, msg_type in messages:
-        conn.execute('''
-            INSERT OR IGNORE INTO messages (id, content, sender_id, receiver_id, chat_room_id, message_type, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (msg_id, content, sender_id, receiver_id, chat_room_id, msg_type, now, now))
-        print(f"   ✅ Message: {sender_id} → {receiver_id}")
+    conn.executemany('''
+        INSERT OR IGNORE INTO messages (id, content, sender_id, receiver_id, chat_room_id, message_type, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [message + (now, now) for message in messages])
+
+    return {
+        'Faculties': len(faculties),
+        'Departments': len(departments),
+        'Courses': len(courses),
+        'Users': len(default_users) + len(additional_users),
+        'Enrollments': len(enrollments),
+        'Announcements': len(announcements),
+        'Messages': len(messages),
+    }
 
-    # Add sync_metadata table
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS sync_metadata (
-            id TEXT PRIMARY KEY,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_sync TEXT,
-            table_name TEXT NOT NULL,
-            record_id TEXT NOT NULL,
-            action TEXT NOT NULL,
-            data TEXT,
-            synced_at TEXT,
-            is_synced INTEGER DEFAULT 0
-        )
-    ''')
-
-    print("✅ Database initialization completed with comprehensive seeded data!")
-    print(f"📊 Summary:")
-    faculty_count = conn.execute('SELECT COUNT(*) FROM faculties').fetchone()[0]
-    dept_count = conn.execute('SELECT COUNT(*) FROM departments').fetchone()[0]
-    course_count = conn.execute('SELECT COUNT(*) FROM courses').fetchone()[0]
-    user_count = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
-    enrollment_count = conn.execute('SELECT COUNT(*) FROM user_courses').fetchone()[0]
-    announcement_count = conn.execute('SELECT COUNT(*) FROM announcements').fetchone()[0]
-    message_count = conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
-
-    print(f"   🏛️  Faculties: {faculty_count}")
-    print(f"   🏢 Departments: {dept_count}")
-    print(f"   📚 Courses: {course_count}")
-    print(f"   👥 Users: {user_count}")
-    print(f"   📝 Enrollments: {enrollment_count}")
-    print(f"   📢 Announcements: {announcement_count}")
-    print(f"   💬 Messages: {message_count}")
+def init_database(show_summary=False):
+    """Initialize the database with tables and default data (only if needed)
 
-    conn.commit()
-    conn.close()
-def seed_chat_rooms():
+    An up-to-date database costs a single version lookup, so restart time does
+    not depend on how much data has accumulated. Schema changes live in
+    migrations.py. Pass show_summary=True to print exact row counts.
+    """
     conn = get_db_connection()
-    now = datetime.now().isoformat()
 
-    # Get all admins & lecturers
-    admins = conn.execute("SELECT id, first_name FROM users WHERE role = 'admin'").fetchall()
-    lecturers = conn.execute("SELECT id, first_name FROM users WHERE role = 'lecturer'").fetchall()
+    version = migrations.get_schema_version(conn)
+    if version >= migrations.LATEST_VERSION:
+        print(f"✅ Database schema is up to date (version {version})")
+        conn.close()
+        return
+
+    # Databases created before schema versioning already hold real data; they
+    # only need the schema brought up to date, not the demo seed.
+    try:
+        needs_seed = conn.execute('SELECT 1 FROM users LIMIT 1').fetchone() is None
+    except sqlite3.OperationalError:
+        needs_seed = True
 
-    # Create one chat room per lecturer with admin included
-    for lecturer in lecturers:
-        room_id = str(uuid.uuid4())
-        room_name = f"Chat with {lecturer['first_name']}"
-        
-        # Create the room
-        conn.execute('''
-            INSERT OR IGNORE INTO chat_rooms (id, name, created_by, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (room_id, room_name, lecturer['id'], now, now))
+    print(f"🔄 Upgrading database schema from version {version} to {migrations.LATEST_VERSION}...")
+    migrations.migrate(conn)
 
-        # Add lecturer as participant
-        conn.execute('''
-            INSERT OR IGNORE INTO chat_participants (id, room_id, user_id, joined_at)
-            VALUES (?, ?, ?, ?)
-        ''', (str(uuid.uuid4()), room_id, lecturer['id'], now))
+    seeded = {}
+    if needs_seed:
+        try:
+            seeded = _seed_default_data(conn, datetime.now().isoformat())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            conn.close()
+            raise
+        print("✅ Database initialization completed with comprehensive seeded data!")
+        print(f"📊 Seeded:")
+        for label, count in seeded.items():
+            print(f"   {label}: {count}")
 
-        # Add all admins as participants
-        for admin in admins:
-            conn.execute('''
-                INSERT OR IGNORE INTO chat_participants (id, room_id, user_id, joined_at)
-                VALUES (?, ?, ?, ?)
-            ''', (str(uuid.uuid4()), room_id, admin['id'], now))
+    seed_chat_rooms(conn)
+
+    if show_summary:
+        print(f"📊 Summary:")
+        for table in ('faculties', 'departments', 'courses', 'users', 'user_courses', 'announcements', 'messages'):
+            count = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            print(f"   {table}: {count}")
 
-    conn.commit()
     conn.close()
-    print("✅ Chat rooms seeded successfully")
+
+def seed_chat_rooms(conn=None):
+    """Create the lecturer-admin chat rooms that are missing (idempotent)"""
+    own_connection = conn is None
+    conn = conn or get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        created = chat_service.provision_staff_rooms(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_connection:
+            conn.close()
+    if created['rooms'] or created['participants']:
+        print(f"✅ Chat rooms seeded: {created['rooms']} rooms, {created['participants']} participants")
+    return created
 @app.route('/api/files/all', methods=['GET'])
 def get_all_files():
     """
@@ -784,9 +659,7 @@ def get_staff():
     ''').fetchall()
     conn.close()
 
-    return jsonify({
-        'items': [dict(user) for user in staff]
-    }), 200
+    return rows_response(staff, key='items')
 
 @app.route('/api/debug/login/<username>/<password>', methods=['GET'])
 def debug_login_response(username, password):
@@ -812,10 +685,12 @@ def debug_login_response(username, password):
                 'last_name': user['last_name'],
                 'permissions': user['permissions'].split(',') if user['permissions'] else []
             }
+            token = sessions.create(conn, user['id'])
+            conn.commit()
             conn.close()
 
             # This is exactly what the app should receive
-            response_data = {'user': user_data, 'token': user['id']}
+            response_data = {'user': user_data, 'token': token}
             print(f"📤 Login response data: {response_data}")
             return jsonify(response_data)
         else:
@@ -864,8 +739,10 @@ def login():
                     'last_name': user['last_name'],
                     'permissions': user['permissions'].split(',') if user['permissions'] else []
                 }
+                token = sessions.create(conn, user['id'])
+                conn.commit()
                 conn.close()
-                return jsonify({'user': user_data, 'token': user['id']})
+                return jsonify({'user': user_data, 'token': token})
             else:
                 print(f"❌ Invalid password for user: {username}")
         else:
@@ -877,25 +754,30 @@ def login():
         print(f"❌ Login error: {e}")
         return jsonify({'error': 'Login failed'}), 500
 
-# User management endpoints
-@app.route('/api/users', methods=['GET'])
-def get_users():
-    since = request.args.get('since', '')
+@app.route('/api/auth/logout', methods=['POST'])
+def logout():
+    """End the session whose token is in the Authorization header"""
     conn = get_db_connection()
-
-    query = 'SELECT * FROM users WHERE is_active = 1'
-    params = []
-
-    if since:
-        query += ' AND updated_at > ?'
-        params.append(since)
-
-    users = conn.execute(query, params).fetchall()
+    ended = sessions.revoke(conn, sync_scope.bearer_token(request))
+    conn.commit()
     conn.close()
+    return jsonify({'logged_out': ended})
 
-    return jsonify({
-        'items': [dict(user) for user in users]
-    })
+@job_queue.handler('purge_sessions')
+def run_purge_sessions(job):
+    conn = get_db_connection()
+    try:
+        removed = sessions.purge_expired(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    schedule_maintenance('purge_sessions', MAINTENANCE_INTERVAL)
+    return {'removed': removed}
+
+# User management endpoints
+@app.route('/api/users', methods=['GET'])
+def get_users():
+    return scoped_sync_response('users', condition='is_active = 1', listing=True)
 
 @app.route('/api/users', methods=['POST'])
 def create_user():
@@ -923,6 +805,7 @@ def create_user():
         ''', (user_id, data['username'], data['email'], password_hash, data['role_id'],
               data['first_name'], data['last_name'], data.get('level_id'), data.get('year_id'),
               data.get('department_id'), data.get('faculty_id'), profile_picture, now, now))
+        chat_service.provision_staff_rooms(conn, user_id, now)
         conn.commit()
         conn.close()
         return jsonify({'id': user_id, 'message': 'User created successfully'}), 201
@@ -930,6 +813,93 @@ def create_user():
         conn.close()
         return jsonify({'error': 'Username or email already exists'}), 409
 
+# Bulk user import
+#
+# Imports run on the job queue because hashing thousands of initial
+# passwords takes minutes; clients poll the status endpoint for progress.
+@job_queue.handler('user_import')
+def run_user_import(job):
+    conn = get_db_connection()
+    importer = UserImporter(conn, default_password_hash=job.payload.get('default_password_hash'),
+                            progress=job.report_progress)
+    try:
+        stats = importer.run(job.payload['path'])
+    except ImportFileError as e:
+        raise PermanentJobError(str(e))
+    finally:
+        conn.close()
+        os.remove(job.payload['path'])
+
+    if stats['imported']:
+        seed_chat_rooms()
+
+    stats['errors_file'] = None
+    if importer.errors:
+        stats['errors_file'] = os.path.join(IMPORT_FOLDER, f'{job.id}.errors.csv')
+        importer.write_errors(stats['errors_file'])
+    print(f"✅ User import {job.id}: {stats['imported']} imported, {stats['failed']} failed")
+    return stats
+
+@app.route('/api/users/import', methods=['POST'])
+def import_users():
+    """Start a bulk import from an uploaded CSV/XLSX file (multipart field 'file')"""
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({'error': 'file is required'}), 400
+    extension = os.path.splitext(secure_filename(file.filename))[1].lower()
+    if extension not in ('.csv', '.xlsx'):
+        return jsonify({'error': 'Only .csv and .xlsx files can be imported'}), 400
+
+    os.makedirs(IMPORT_FOLDER, exist_ok=True)
+    path = os.path.join(IMPORT_FOLDER, f"upload_{uuid.uuid4().hex}{extension}")
+    file.save(path)
+
+    # Job payloads are stored and listed by /api/jobs; only the hash goes in
+    default_password = request.form.get('default_password')
+    import_id = job_queue.enqueue('user_import', {
+        'path': path,
+        'filename': file.filename,
+        'default_password_hash': generate_password_hash(default_password) if default_password else None,
+    }, priority=5, max_attempts=1)
+
+    print(f"📥 User import {import_id} queued from {file.filename}")
+    return jsonify({'id': import_id, 'status': job_queue_module.QUEUED}), 202
+
+def _user_import_job(import_id):
+    job = job_queue.get(import_id)
+    return job if job and job['kind'] == 'user_import' else None
+
+@app.route('/api/users/import/<import_id>', methods=['GET'])
+def get_user_import(import_id):
+    job = _user_import_job(import_id)
+    if job is None:
+        return jsonify({'error': 'Import not found'}), 404
+
+    stats = job['result'] or job['progress'] or {}
+    return jsonify({
+        'id': import_id,
+        'filename': job['payload']['filename'],
+        'status': job['status'],
+        'processed': stats.get('processed', 0),
+        'imported': stats.get('imported', 0),
+        'failed': stats.get('failed', 0),
+        'elapsed': stats.get('elapsed', 0.0),
+        'has_errors_file': bool(stats.get('errors_file')),
+        'error': job['last_error'],
+        'created_at': job['created_at'],
+        'finished_at': job['finished_at'],
+    })
+
+@app.route('/api/users/import/<import_id>/errors', methods=['GET'])
+def get_user_import_errors(import_id):
+    """Rejected rows as CSV (row, username, email, error)"""
+    job = _user_import_job(import_id)
+    errors_path = ((job or {}).get('result') or {}).get('errors_file')
+    if not errors_path:
+        return jsonify({'error': 'No error file for this import'}), 404
+    return send_file(os.path.abspath(errors_path), mimetype='text/csv', as_attachment=True,
+                     download_name=f'{import_id}.errors.csv')
+
 @app.route('/api/users/<user_id>', methods=['PUT'])
 def update_user(user_id):
     """Update user information with role-based restrictions"""
@@ -987,29 +957,14 @@ def update_user(user_id):
 # Course management endpoints
 @app.route('/api/courses', methods=['GET'])
 def get_courses():
-    since = request.args.get('since', '')
-    conn = get_db_connection()
+    return scoped_sync_response('courses', condition='is_active = 1', listing=True)
 
-    query = 'SELECT * FROM courses WHERE is_active = 1'
-    params = []
-
-    if since:
-        query += ' AND updated_at > ?'
-        params.append(since)
-
-    courses = conn.execute(query, params).fetchall()
-    conn.close()
-
-    # Return all fields, including lecturer_id
-    return jsonify({
-        'items': [dict(course) for course in courses]
-    })
 @app.route('/api/lecturers', methods=['GET'])
 def get_lecturers():
     conn = get_db_connection()
     lecturers = conn.execute(
-        'SELECT id, first_name, last_name, email FROM users WHERE role = ?',
-        ('lecturer',)
+        'SELECT id, first_name, last_name, email FROM users WHERE role_id = ?',
+        ('role_lecturer',)
     ).fetchall()
     conn.close()
 
@@ -1047,22 +1002,7 @@ def create_course():
 # File management endpoints
 @app.route('/api/files', methods=['GET'])
 def get_files():
-    since = request.args.get('since', '')
-    conn = get_db_connection()
-
-    query = 'SELECT * FROM files'
-    params = []
-
-    if since:
-        query += ' WHERE updated_at > ?'
-        params.append(since)
-
-    files = conn.execute(query, params).fetchall()
-    conn.close()
-
-    return jsonify({
-        'files': [dict(file) for file in files]
-    })
+    return scoped_sync_response('files', key='files')
 @app.route('/api/lecturer/<user_id>/courses', methods=['GET'])
 def get_lecturer_courses(user_id):
     """
@@ -1088,7 +1028,7 @@ def get_lecturer_files(user_id):
     ).fetchall()
     conn.close()
 
-    return jsonify([dict(file) for file in files]), 200
+    return rows_response(files)
 @app.route('/api/lecturer/<user_id>/announcements', methods=['GET'])
 def get_lecturer_announcements(user_id):
     """
@@ -1101,20 +1041,15 @@ def get_lecturer_announcements(user_id):
     ).fetchall()
     conn.close()
 
-    return jsonify([dict(ann) for ann in announcements]), 200
+    return rows_response(announcements)
 
 # 2. Student courses
 @app.route('/api/student/<user_id>/courses', methods=['GET'])
 def get_student_courses(user_id):
     conn = get_db_connection()
-    courses = conn.execute('''
-        SELECT c.*
-        FROM courses c
-        JOIN enrollments e ON c.id = e.course_id
-        WHERE e.student_id = ?
-    ''', (user_id,)).fetchall()
+    courses = enrollment_service.student_courses(conn, user_id)
     conn.close()
-    return jsonify([dict(course) for course in courses]), 200
+    return rows_response(courses)
 
 
 # 3. Student announcements
@@ -1124,13 +1059,68 @@ def get_student_announcements(user_id):
     announcements = conn.execute('''
         SELECT a.*
         FROM announcements a
-        JOIN courses c ON a.course_id = c.id
-        JOIN enrollments e ON e.course_id = c.id
-        WHERE e.student_id = ?
+        WHERE a.is_active = 1
+          AND EXISTS (
+              SELECT 1 FROM user_courses uc
+              WHERE uc.user_id = ?
+                AND ',' || a.target_courses || ',' LIKE '%,' || uc.course_id || ',%'
+          )
         ORDER BY a.created_at DESC
     ''', (user_id,)).fetchall()
     conn.close()
-    return jsonify([dict(ann) for ann in announcements]), 200
+    return rows_response(announcements)
+
+
+def dashboard_response(user_id, role_id):
+    """Serve dashboard.build_dashboard as JSON, cached until the next write
+
+    Every write to a synced table moves the change-log cursor, so keying the
+    cache on the cursor invalidates dashboards without any explicit calls.
+    """
+    recent = request.args.get('recent', dashboard.DEFAULT_RECENT, type=int)
+    key = None
+    entry = None
+    if app.config.get('DASHBOARD_CACHE', True):
+        conn = get_db_connection()
+        cursor = change_log.current_cursor(conn)
+        conn.close()
+        key = (request.path, recent, cursor)
+        entry = dashboard_cache.get(key)
+    if entry is None:
+        def build():
+            conn = get_db_connection()
+            try:
+                data = dashboard.build_dashboard(conn, user_id, role_id, recent)
+            finally:
+                conn.close()
+            return None if data is None else row_json.dumps(data)
+
+        body = request_flight.do(key, build, request.url_rule.rule) if key else build()
+        if body is None:
+            return jsonify({'error': 'Dashboard not found for this user'}), 404
+        if key is None:
+            return Response(body, mimetype='application/json')
+        entry = dashboard_cache.put(key, body)
+
+    if request.if_none_match.contains_weak(entry.etag):
+        dashboard_cache.record_not_modified()
+        response = Response(status=304)
+    else:
+        response = Response(entry.body, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    return response
+
+
+@app.route('/api/lecturer/<user_id>/dashboard', methods=['GET'])
+def get_lecturer_dashboard(user_id):
+    """Courses taught with counts, recent files and recent announcements"""
+    return dashboard_response(user_id, 'role_lecturer')
+
+
+@app.route('/api/student/<user_id>/dashboard', methods=['GET'])
+def get_student_dashboard(user_id):
+    """Enrolled courses with counts, recent files and recent announcements"""
+    return dashboard_response(user_id, 'role_student')
 
 @app.route('/api/enrollments', methods=['POST'])
 def enroll_student():
@@ -1141,33 +1131,38 @@ def enroll_student():
     if not student_id or not course_id:
         return jsonify({'error': 'student_id and course_id required'}), 400
 
-    conn = get_db_connection()
-    try:
-        conn.execute('''
-            INSERT INTO enrollments (id, student_id, course_id, enrolled_at)
-            VALUES (?, ?, ?, ?)
-        ''', (str(uuid.uuid4()), student_id, course_id, datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
-        return jsonify({'message': 'Student enrolled successfully'}), 201
-    except sqlite3.IntegrityError:
-        conn.close()
-        return jsonify({'error': 'Student already enrolled in this course'}), 409
+    return _enroll_one(student_id, course_id)
 
 # 4. Student downloads
 @app.route('/api/files/downloaded', methods=['GET'])
 def get_downloaded_files():
     user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'user_id required'}), 400
+    limit = min(request.args.get('limit', 100, type=int), 500)
+    offset = request.args.get('offset', 0, type=int)
+
+    # Include this user's downloads that are still buffered
+    download_recorder.flush()
     conn = get_db_connection()
-    downloads = conn.execute('''
-        SELECT f.*
-        FROM downloads d
-        JOIN files f ON f.id = d.file_id
-        WHERE d.user_id = ?
-        ORDER BY d.downloaded_at DESC
-    ''', (user_id,)).fetchall()
+    downloads = download_events.user_downloads(conn, user_id, limit, offset)
     conn.close()
-    return jsonify([dict(file) for file in downloads]), 200
+    return rows_response(downloads)
+
+@app.route('/api/files/<file_id>/download-stats', methods=['GET'])
+def get_file_download_stats(file_id):
+    conn = get_db_connection()
+    stats = download_events.file_stats(conn, file_id)
+    conn.close()
+    return jsonify(stats), 200
+
+@app.route('/api/courses/<course_id>/download-stats', methods=['GET'])
+def get_course_download_stats(course_id):
+    limit = min(request.args.get('limit', 10, type=int), 100)
+    conn = get_db_connection()
+    stats = download_events.course_stats(conn, course_id, limit)
+    conn.close()
+    return jsonify(stats), 200
 
 
 # 5. Chat rooms by user
@@ -1226,18 +1221,17 @@ def upload_file():
     if not course_id or not uploaded_by:
         return jsonify({'error': 'course_id and uploaded_by are required'}), 400
 
-    # Create course-specific directory
-    course_dir = os.path.join(app.config['UPLOAD_FOLDER'], course_id)
-    os.makedirs(course_dir, exist_ok=True)
-
-    # Save file
+    # Save file into its shard of the course folder
     filename = secure_filename(file.filename)
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     unique_filename = f"{timestamp}_{filename}"
-    file_path = os.path.join(course_dir, unique_filename)
+    try:
+        file_path = upload_store.path_for(course_id, unique_filename)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     file.save(file_path)
-    file_size = os.path.getsize(file_path)
+    file_size = upload_store.add(course_id, unique_filename)['size']
 
     # Save to database
     now = datetime.now().isoformat()
@@ -1253,6 +1247,9 @@ def upload_file():
     conn.commit()
     conn.close()
 
+    # Text extraction for search happens off the request thread
+    job_queue.enqueue('index_file', {'file_id': file_id}, priority=1)
+
     return jsonify({
         'id': file_id,
         'message': 'File uploaded successfully',
@@ -1260,10 +1257,24 @@ def upload_file():
     }), 201
 @app.route('/api/courses/<course_id>/files', methods=['GET'])
 def get_course_files(course_id):
-    course_dir = os.path.join(app.config['UPLOAD_FOLDER'], course_id)
+    conn = get_db_connection()
+    data_version = change_log.current_cursor(conn)
+    conn.close()
+
+    def build():
+        return f"{app.json.dumps(course_files(course_id), separators=(',', ':'))}\n".encode('utf-8')
+
+    # Every device of a class asks for this at the start of a lecture
+    body = request_flight.do((request.path, data_version), build, request.url_rule.rule)
+    return Response(body, mimetype='application/json')
+
+def course_files(course_id):
+    """Files of a course that exist on disk (every file in its upload folder
+    if none are registered), checked against the course's upload manifest"""
+    manifest = upload_store.manifest(course_id)
 
-    if not os.path.exists(course_dir):
-        return jsonify([]), 200
+    if not manifest:
+        return []
 
     conn = get_db_connection()
     files_in_db = conn.execute(
@@ -1275,14 +1286,15 @@ def get_course_files(course_id):
 
     if files_in_db:
         for file_row in files_in_db:
-            file_path = file_row['file_path']
-            if os.path.exists(file_path):
+            stored = manifest.get(file_row['name'])
+            if stored is not None:
                 files_list.append({
                     'id': file_row['id'],
                     'name': file_row['name'],
                     'original_name': file_row['original_name'],
                     'file_path': file_row['file_path'],   # ✅ Added
                     'file_size': file_row['file_size'],
+                    'sha256': stored['sha256'],
                     'mime_type': file_row['mime_type'] or 'application/octet-stream',
                     'course_id': file_row['course_id'],
                     'uploaded_by': file_row['uploaded_by'] or 'system',
@@ -1291,53 +1303,67 @@ def get_course_files(course_id):
                     'updated_at': file_row['updated_at'],
                 })
     else:
-        for idx, filename in enumerate(os.listdir(course_dir), start=1):
-            file_path = os.path.join(course_dir, filename)
-            if os.path.isfile(file_path):
-                files_list.append({
-                    'id': f"local_{idx}",
-                    'name': filename,
-                    'original_name': filename,
-                    'file_path': file_path,   # ✅ Added for Flutter mapping
-                    'file_size': os.path.getsize(file_path),
-                    'mime_type': 'application/octet-stream',
-                    'course_id': course_id,
-                    'uploaded_by': 'system',
-                    'description': None,
-                    'created_at': None,
-                    'updated_at': None,
-                })
+        course_dir = upload_store.course_dir(course_id)
+        for idx, stored in enumerate(manifest.values(), start=1):
+            files_list.append({
+                'id': f"local_{idx}",
+                'name': stored['name'],
+                'original_name': stored['name'],
+                'file_path': os.path.join(course_dir, stored['path']),   # ✅ Added for Flutter mapping
+                'file_size': stored['size'],
+                'sha256': stored['sha256'],
+                'mime_type': 'application/octet-stream',
+                'course_id': course_id,
+                'uploaded_by': 'system',
+                'description': None,
+                'created_at': None,
+                'updated_at': None,
+            })
 
-    return jsonify(files_list), 200
+    return files_list
 @app.route('/api/courses/<course_id>/folder-files', methods=['GET'])
 def get_course_folder_files(course_id):
     """
-    Return all files directly from uploads/<course_id> folder.
+    Return all files of the uploads/<course_id> folder, from its manifest.
     """
-    course_dir = os.path.join(app.config['UPLOAD_FOLDER'], course_id)
-
-    if not os.path.exists(course_dir):
-        return jsonify([]), 200
-
     files_list = []
-    for idx, filename in enumerate(os.listdir(course_dir), start=1):
-        file_path = os.path.join(course_dir, filename)
-        if os.path.isfile(file_path):
-            files_list.append({
-                "id": f"local_{idx}",
-                "name": filename,
-                "file_size": os.path.getsize(file_path),
-                "download_url": f"/uploads/{course_id}/{filename}"  # <-- direct URL
-            })
+    for idx, stored in enumerate(upload_store.manifest(course_id).values(), start=1):
+        files_list.append({
+            "id": f"local_{idx}",
+            "name": stored['name'],
+            "file_size": stored['size'],
+            "sha256": stored['sha256'],
+            "modified_at": datetime.fromtimestamp(stored['mtime']).isoformat(),
+            "download_url": f"/uploads/{course_id}/{stored['name']}"  # <-- direct URL
+        })
 
     return jsonify(files_list), 200
+
+@job_queue.handler('hash_uploads')
+def run_hash_uploads(job):
+    """Hash the files a folder scan added to a course manifest"""
+    return {'hashed': upload_store.hash_missing(job.payload['course_id'])}
+
+def record_download(file_id, course_id, size):
+    """Count a download unless it resumes one already counted"""
+    if request.range is not None and request.range.ranges[0][0] != 0:
+        return
+    download_recorder.record(file_id, request.args.get('user_id'), course_id, size)
+
 @app.route('/uploads/<course_id>/<filename>')
 def serve_uploaded_file(course_id, filename):
-    return send_from_directory(
-        os.path.join(app.config['UPLOAD_FOLDER'], course_id),
-        filename,
-        as_attachment=True
-    )
+    file_path = upload_store.resolve(course_id, filename)
+    if file_path is None:
+        return jsonify({'error': 'File not found'}), 404
+
+    conn = get_db_connection()
+    file_record = conn.execute(
+        'SELECT id, file_size FROM files WHERE course_id = ? AND name = ?', (course_id, filename)
+    ).fetchone()
+    conn.close()
+    if file_record:
+        record_download(file_record['id'], course_id, file_record['file_size'])
+    return send_download(file_path, app.config['UPLOAD_FOLDER'])
 
 @app.route('/api/files/<file_id>/download', methods=['GET'])
 def download_file(file_id):
@@ -1356,14 +1382,10 @@ def download_file(file_id):
         if not os.path.exists(file_path):
             return jsonify({'error': 'File not found on disk'}), 404
 
-        directory, filename = os.path.split(file_path)
-        return send_from_directory(
-            directory,
-            filename,
-            as_attachment=True,
-            download_name=file_record['original_name'],
-            mimetype=file_record['mime_type'] or 'application/octet-stream'
-        )
+        record_download(file_record['id'], file_record['course_id'], file_record['file_size'])
+        return send_download(file_path, app.config['UPLOAD_FOLDER'],
+                             download_name=file_record['original_name'],
+                             mimetype=file_record['mime_type'])
 
     # ✅ Handle fallback local files
     if file_id.startswith("local_"):
@@ -1380,37 +1402,28 @@ def download_file(file_id):
                 all_files.append(os.path.join(root, f))
 
         if idx <= len(all_files):
-            file_path = all_files[idx - 1]
-            directory, filename = os.path.split(file_path)
-            return send_from_directory(
-                directory,
-                filename,
-                as_attachment=True,
-                download_name=filename
-            )
+            return send_download(all_files[idx - 1], uploads_dir)
 
     return jsonify({'error': 'File not found'}), 404
-# Announcement endpoints
-@app.route('/api/announcements', methods=['GET'])
-def get_announcements():
-    since = request.args.get('since', '')
-    conn = get_db_connection()
-
-    query = 'SELECT * FROM announcements WHERE is_active = 1'
-    params = []
 
-    if since:
-        query += ' AND updated_at > ?'
-        params.append(since)
-
-    query += ' ORDER BY created_at DESC'
-
-    announcements = conn.execute(query, params).fetchall()
+@app.route('/api/files/<file_id>', methods=['DELETE'])
+def delete_file(file_id):
+    """Delete a file's record and stored copy, and drop it from the course manifest"""
+    conn = get_db_connection()
+    file_record = conn.execute('SELECT name, course_id FROM files WHERE id = ?', (file_id,)).fetchone()
+    if file_record is None:
+        conn.close()
+        return jsonify({'error': 'File not found'}), 404
+    conn.execute('DELETE FROM files WHERE id = ?', (file_id,))
+    conn.commit()
     conn.close()
 
-    return jsonify({
-        'items': [dict(announcement) for announcement in announcements]
-    })
+    upload_store.delete(file_record['course_id'], file_record['name'])
+    return jsonify({'message': 'File deleted successfully'}), 200
+# Announcement endpoints
+@app.route('/api/announcements', methods=['GET'])
+def get_announcements():
+    return scoped_sync_response('announcements', condition='is_active = 1', order_by='created_at DESC')
 
 @app.route('/api/announcements', methods=['POST'])
 def create_announcement():
@@ -1439,27 +1452,59 @@ def create_announcement():
 
     return jsonify({'id': announcement_id, 'message': 'Announcement created successfully'}), 201
 
+# Reference-data endpoints
+#
+# Roles, faculties, departments, levels and years change rarely but are
+# fetched by every device on every sync, so their encoded responses are kept
+# in response_cache. Every write to a synced table moves the change-log
+# cursor, so keying the cache on the cursor drops stale entries without
+# explicit invalidation (see response_cache.py), and the cursor inside a
+# cached body is never behind.
+def cached_sync_response(build):
+    """Serve build(condition, params) -> (columns, rows, cursor) from the response cache
+
+    Entries are keyed on endpoint, since/since_seq, negotiated sync format
+    and the change-log cursor.
+    """
+    condition, params = sync_filter()
+    fmt = sync_format.negotiate_format(request)
+    conn = get_db_connection()
+    data_version = change_log.current_cursor(conn)
+    conn.close()
+    key = (request.path, condition, tuple(params), fmt, data_version)
+    entry = response_cache.get(key)
+    if entry is None:
+        def build_entry():
+            columns, rows, cursor = build(condition, params)
+            body, mimetype = encode_sync_body('items', columns, rows, fmt, {'cursor': cursor})
+            return response_cache.put(key, body, mimetype)
+
+        # Concurrent misses (right after a write) build the entry once
+        entry = request_flight.do(key, build_entry, request.url_rule.rule)
+
+    # Weak comparison: compression weakens the ETag of encoded responses
+    if request.if_none_match.contains_weak(entry.etag):
+        response_cache.record_not_modified()
+        response = Response(status=304)
+    else:
+        response = Response(entry.body, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    response.vary.add('Accept')
+    return response
+
+def _reference_rows(table, condition, params):
+    query = f'SELECT * FROM {table}'
+    if condition:
+        query += f' WHERE {condition}'
+
+    return fetch_sync_rows(query, params)
+
 # Roles endpoints
 @app.route('/api/roles', methods=['GET'])
 def get_roles():
     try:
         print(f"📡 GET /api/roles - Request from {request.remote_addr}")
-        since = request.args.get('since', '')
-        conn = get_db_connection()
-
-        query = 'SELECT * FROM roles'
-        params = []
-
-        if since:
-            query += ' WHERE updated_at > ?'
-            params.append(since)
-
-        roles = conn.execute(query, params).fetchall()
-        conn.close()
-
-        result = {'items': [dict(role) for role in roles]}
-        print(f"✅ Returning {len(result['items'])} roles")
-        return jsonify(result)
+        return cached_sync_response(lambda condition, params: _reference_rows('roles', condition, params))
     except Exception as e:
         print(f"❌ Error in get_roles: {e}")
         return jsonify({'error': str(e)}), 500
@@ -1467,125 +1512,330 @@ def get_roles():
 # Faculties endpoints
 @app.route('/api/faculties', methods=['GET'])
 def get_faculties():
-    since = request.args.get('since', '')
-    conn = get_db_connection()
-
-    query = 'SELECT * FROM faculties'
-    params = []
-
-    if since:
-        query += ' WHERE updated_at > ?'
-        params.append(since)
-
-    faculties = conn.execute(query, params).fetchall()
-    conn.close()
-
-    return jsonify({
-        'items': [dict(faculty) for faculty in faculties]
-    })
+    return cached_sync_response(lambda condition, params: _reference_rows('faculties', condition, params))
 
 # Departments endpoints
 @app.route('/api/departments', methods=['GET'])
 def get_departments():
-    since = request.args.get('since', '')
-    conn = get_db_connection()
-
-    query = 'SELECT * FROM departments'
-    params = []
-
-    if since:
-        query += ' WHERE updated_at > ?'
-        params.append(since)
-
-    departments = conn.execute(query, params).fetchall()
-    conn.close()
-
-    return jsonify({
-        'items': [dict(department) for department in departments]
-    })
+    return cached_sync_response(lambda condition, params: _reference_rows('departments', condition, params))
 
 # Levels endpoints
 @app.route('/api/levels', methods=['GET'])
 def get_levels():
-    since = request.args.get('since', '')
-    conn = get_db_connection()
-
-    query = 'SELECT * FROM levels'
-    params = []
-
-    if since:
-        query += ' WHERE updated_at > ?'
-        params.append(since)
-
-    levels = conn.execute(query, params).fetchall()
-    conn.close()
-
-    return jsonify({
-        'items': [dict(level) for level in levels]
-    })
+    return cached_sync_response(lambda condition, params: _reference_rows('levels', condition, params))
 
 # Years endpoints
 @app.route('/api/years', methods=['GET'])
 def get_years():
-    since = request.args.get('since', '')
-    conn = get_db_connection()
+    return cached_sync_response(lambda condition, params: _reference_rows('years', condition, params))
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Hit/miss statistics for the response and compressed-body caches, and
+    how many reads were coalesced with an identical concurrent one"""
+    stats = response_cache.stats()
+    stats['dashboards'] = dashboard_cache.stats()
+    stats['compression'] = compressed_body_cache.stats()
+    stats['coalescing'] = request_flight.stats()
+    return jsonify(stats)
 
-    query = 'SELECT * FROM years'
-    params = []
+# User courses endpoints
+@app.route('/api/user-courses', methods=['GET'])
+def get_user_courses():
+    # Enrollments are inserted or deleted, never updated, so the legacy
+    # timestamp filter uses enrolled_at; deletes arrive via /api/sync/changes
+    return scoped_sync_response('user_courses', timestamp_column='enrolled_at')
+
+# Devices that have not synced for this long get a full resync instead of deletes
+TOMBSTONE_RETENTION_DAYS = 90
+
+@job_queue.handler('prune_tombstones')
+def run_prune_tombstones(job):
+    days = job.payload.get('days', TOMBSTONE_RETENTION_DAYS)
+    # The change-log triggers stamp UTC times
+    cutoff = datetime.utcfromtimestamp(time.time() - days * 86400).isoformat()
+    conn = get_db_connection()
+    try:
+        removed = change_log.prune_tombstones_before(conn, cutoff)
+        conn.commit()
+    finally:
+        conn.close()
+    schedule_maintenance('prune_tombstones', MAINTENANCE_INTERVAL)
+    return {'removed': removed}
 
-    if since:
-        query += ' WHERE updated_at > ?'
-        params.append(since)
+# File search
+@job_queue.handler('index_file')
+def run_index_file(job):
+    conn = get_db_connection()
+    try:
+        status = search_index.index_file(conn, job.payload['file_id'])
+        conn.commit()
+    finally:
+        conn.close()
+    return {'file_id': job.payload['file_id'], 'status': status}
 
-    years = conn.execute(query, params).fetchall()
+@job_queue.handler('index_pending_files')
+def run_index_pending_files(job):
+    """Index files uploaded before search existed or changed since indexing"""
+    conn = get_db_connection()
+    try:
+        file_ids = search_index.unindexed_file_ids(conn)
+        statuses = {}
+        for number, file_id in enumerate(file_ids, start=1):
+            status = search_index.index_file(conn, file_id)
+            conn.commit()
+            statuses[status] = statuses.get(status, 0) + 1
+            if number % 50 == 0:
+                job.report_progress({'indexed': number, 'total': len(file_ids)})
+    finally:
+        conn.close()
+    return {'total': len(file_ids), 'statuses': statuses}
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    """Ranked full-text search over files, announcements, courses and users
+
+    ?q=<text> (required; every word also matches as a prefix). Results are
+    limited to what the caller's role may see (the session token in the
+    Authorization header; without one only courses are searched).
+    ?type=files,users,...
+    ?course_id=<id>[,<id>...] to narrow to courses, ?limit= (default 20,
+    max 100) and ?offset= per type.
+    """
+    text = request.args.get('q', '').strip()
+    if not text:
+        return jsonify({'error': 'q is required'}), 400
+    types = None
+    if request.args.get('type'):
+        types = request.args['type'].split(',')
+        unknown = set(types) - set(search_index.SEARCH_TYPES)
+        if unknown:
+            return jsonify({'error': f"Unknown type: {', '.join(sorted(unknown))}"}), 400
+    course_ids = None
+    if request.args.get('course_id'):
+        course_ids = [c for c in request.args['course_id'].split(',') if c]
+    limit = request.args.get('limit', search_index.DEFAULT_LIMIT, type=int)
+    offset = request.args.get('offset', 0, type=int)
+
+    started = time.perf_counter()
+    conn = get_db_connection()
+    scope = search_index.scope_for_user(conn, sync_scope.caller_id(conn, request))
+    results = search_index.search(conn, text, scope, types, limit, offset, course_ids)
     conn.close()
 
     return jsonify({
-        'items': [dict(year) for year in years]
+        'query': text,
+        'limit': max(1, min(limit, search_index.MAX_LIMIT)),
+        'offset': offset,
+        'results': results,
+        'took_ms': round((time.perf_counter() - started) * 1000, 2),
     })
 
-# User courses endpoints
-@app.route('/api/user-courses', methods=['GET'])
-def get_user_courses():
-    since = request.args.get('since', '')
+@app.route('/api/search/reindex', methods=['POST'])
+def reindex_files():
+    """Queue indexing of every file that is missing from the search index"""
+    job_id = job_queue.enqueue('index_pending_files', priority=-1)
+    return jsonify({'job_id': job_id, 'status': job_queue_module.QUEUED}), 202
+
+@app.route('/api/search/stats', methods=['GET'])
+def get_search_stats():
+    conn = get_db_connection()
+    stats = search_index.stats(conn)
+    conn.close()
+    return jsonify({'files': stats})
+
+@app.route('/api/jobs', methods=['GET'])
+def get_jobs():
+    """Recent background jobs, optionally filtered by ?status= and ?kind="""
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    return jsonify(job_queue.list(request.args.get('status'), request.args.get('kind'), limit))
+
+@app.route('/api/jobs/stats', methods=['GET'])
+def get_job_stats():
+    return jsonify(job_queue.stats())
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>/retry', methods=['POST'])
+def retry_job(job_id):
+    if not job_queue.retry(job_id):
+        return jsonify({'error': 'Only failed jobs can be retried'}), 409
+    return jsonify({'id': job_id, 'status': job_queue_module.QUEUED})
+
+# Finished jobs are kept this long, then removed with their import error files
+JOB_RETENTION_DAYS = 7
+MAINTENANCE_INTERVAL = 24 * 3600
+
+def schedule_maintenance(kind, delay=0):
+    """Queue a recurring cleanup job unless one is already queued or running
+
+    Every process start and every run calls this, so the unique enqueue keeps
+    one job per kind instead of one per restart or worker process.
+    """
+    job_queue.enqueue(kind, priority=-1, delay=delay, unique=True)
+
+@job_queue.handler('purge_jobs')
+def run_purge_jobs(job):
+    removed = job_queue.purge(JOB_RETENTION_DAYS)
+    errors_files = 0
+    if os.path.isdir(IMPORT_FOLDER):
+        for name in os.listdir(IMPORT_FOLDER):
+            if name.endswith('.errors.csv') and job_queue.get(name[:-len('.errors.csv')]) is None:
+                os.remove(os.path.join(IMPORT_FOLDER, name))
+                errors_files += 1
+    schedule_maintenance('purge_jobs', MAINTENANCE_INTERVAL)
+    return {'removed': removed, 'errors_files': errors_files}
+
+@app.route('/api/sync/snapshot', methods=['GET'])
+def get_sync_snapshot():
+    """gzip-compressed SQLite file with everything the caller may see
+
+    For a device's first sync; continue with /api/sync/changes?since_seq=
+    from the X-Sync-Cursor header (also stored in the snapshot_info table).
+    """
+    conn = get_db_connection()
+    scope = sync_scope.scope_for_request(conn, request)
+    conn.close()
+    if not scope.authenticated:
+        return jsonify({'error': 'Authentication required'}), 401
+
+    path, meta = sync_snapshot.get_snapshot(get_db_connection, scope, SNAPSHOT_FOLDER)
+    response = send_download(path, SNAPSHOT_FOLDER, download_name='velocityver-snapshot.db.gz',
+                             mimetype='application/gzip')
+    response.headers['X-Sync-Cursor'] = str(meta['cursor'])
+    response.headers['X-Snapshot-Built-At'] = meta['built_at']
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/api/sync/push', methods=['POST'])
+def push_sync_changes():
+    """Apply a device's queued create/update/delete operations in one transaction"""
     conn = get_db_connection()
+    scope = sync_scope.scope_for_request(conn, request)
+    if not scope.authenticated:
+        conn.close()
+        return jsonify({'error': 'Authentication required'}), 401
 
-    query = 'SELECT * FROM user_courses'
-    params = []
+    data = request.get_json(silent=True) or {}
+    try:
+        operations = sync_push.prepare(conn, scope, data.get('operations'))
+        results = sync_push.apply_operations(conn, scope, operations, datetime.now().isoformat())
+        cursor = change_log.current_cursor(conn)
+    except sync_push.PushError as e:
+        return jsonify({'error': str(e)}), e.code
+    except Exception as e:
+        print(f"❌ Error applying sync push: {e}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
 
-    if since:
-        query += ' WHERE last_sync > ?'
-        params.append(since)
+    failed = sum(1 for result in results if result['status'] == 'error')
+    print(f"📤 Sync push from {scope.user_id}: {len(results) - failed} applied, {failed} failed")
+    return jsonify({
+        'results': results,
+        'applied': len(results) - failed,
+        'failed': failed,
+        'cursor': cursor,
+    }), 200
+
+@job_queue.handler('purge_sync_push_keys')
+def run_purge_sync_push_keys(job):
+    cutoff = datetime.fromtimestamp(time.time() - job.payload.get('days', 30) * 86400).isoformat()
+    conn = get_db_connection()
+    try:
+        removed = sync_push.purge_keys(conn, cutoff)
+        conn.commit()
+    finally:
+        conn.close()
+    schedule_maintenance('purge_sync_push_keys', MAINTENANCE_INTERVAL)
+    return {'removed': removed}
+
+# Sequence-based delta sync (change log in sync_metadata, see change_log.py)
+@app.route('/api/sync/changes', methods=['GET'])
+def get_sync_changes():
+    """Inserts, updates and deletes after since_seq across all synced tables"""
+    try:
+        since_seq = int(request.args.get('since_seq', 0))
+        limit = int(request.args.get('limit', change_log.DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'since_seq and limit must be integers'}), 400
 
-    user_courses = conn.execute(query, params).fetchall()
+    conn = get_db_connection()
+    scope = sync_scope.scope_for_request(conn, request)
+    if not scope.authenticated:
+        conn.close()
+        return jsonify({'error': 'Authentication required'}), 401
+    changes = change_log.fetch_changes(conn, since_seq, limit, scope)
     conn.close()
 
-    return jsonify({
-        'items': [dict(uc) for uc in user_courses]
-    })
+    return jsonify(changes)
 
 # Chat system endpoints
 @app.route('/api/chat/rooms', methods=['GET'])
 def get_chat_rooms():
-    """Get chat rooms for current user"""
+    """Get chat rooms for current user, with unread counts"""
     try:
         user_id = request.args.get('user_id')
         if not user_id:
             return jsonify({'error': 'User ID required'}), 400
 
         conn = get_db_connection()
-        rooms = conn.execute('''
-            SELECT * FROM chat_rooms
-            WHERE participant_ids LIKE ? AND is_active = 1
-            ORDER BY last_activity DESC
-        ''', (f'%{user_id}%',)).fetchall()
+        rooms = chat_service.user_rooms(conn, user_id)
         conn.close()
 
-        return jsonify({'items': [dict(room) for room in rooms]})
+        return rows_response(rooms, key='items',
+                             extra={'unread_count': sum(room['unread_count'] for room in rooms)})
     except Exception as e:
         print(f"❌ Error getting chat rooms: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/chat/rooms/<user_id>', methods=['GET'])
+def get_user_chat_rooms(user_id):
+    """Chat rooms of user_id as a plain list (used by the admin chat screen)"""
+    conn = get_db_connection()
+    rooms = chat_service.user_rooms(conn, user_id)
+    conn.close()
+    return rows_response(rooms)
+
+@app.route('/api/chat/unread', methods=['GET'])
+def get_chat_unread():
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'User ID required'}), 400
+
+    conn = get_db_connection()
+    unread = chat_service.unread_total(conn, user_id)
+    conn.close()
+    return jsonify({'user_id': user_id, 'unread_count': unread}), 200
+
+@app.route('/api/chat/rooms/<room_id>/read', methods=['POST'])
+def mark_chat_room_read(room_id):
+    """Mark a room read up to message_id (default: the latest message)"""
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('user_id') or request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'User ID required'}), 400
+
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        result = chat_service.mark_read(conn, room_id, user_id, data.get('message_id'))
+        conn.commit()
+    except chat_service.NotAParticipant:
+        conn.rollback()
+        return jsonify({'error': 'Not a participant of this chat room'}), 404
+    except ValueError as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 400
+    finally:
+        conn.close()
+    return jsonify(result), 200
+
 @app.route('/api/chat/messages', methods=['GET'])
 def get_chat_messages():
     """Get messages for a chat room or between two users"""
@@ -1614,7 +1864,7 @@ def get_chat_messages():
             return jsonify({'error': 'chat_room_id or sender_id+receiver_id required'}), 400
 
         conn.close()
-        return jsonify({'items': [dict(message) for message in messages]})
+        return rows_response(messages, key='items')
     except Exception as e:
         print(f"❌ Error getting messages: {e}")
         return jsonify({'error': str(e)}), 500
@@ -1637,14 +1887,8 @@ def send_message():
               data.get('message_type', 'text'), data.get('file_id'),
               data.get('file_name'), data.get('file_url'), now, now))
 
-        # Update chat room last activity if applicable
-        if data.get('chat_room_id'):
-            conn.execute('''
-                UPDATE chat_rooms
-                SET last_message_id = ?, last_activity = ?, updated_at = ?
-                WHERE id = ?
-            ''', (message_id, now, now, data['chat_room_id']))
-
+        # The room's last message and its members' unread counters are
+        # updated by the trg_messages_chat_room trigger
         conn.commit()
         conn.close()
 
@@ -1654,91 +1898,242 @@ def send_message():
         print(f"❌ Error sending message: {e}")
         return jsonify({'error': str(e)}), 500
 
+_ENROLL_ERRORS = {
+    'not_found': ('Student not found', 404),
+    'not_student': ('Student not found', 404),
+    'already_enrolled': ('Student already enrolled in this course', 409),
+}
+
+def _enroll_one(student_id, course_id):
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        result = enrollment_service.enroll(conn, student_id, course_id, datetime.now().isoformat())
+        conn.commit()
+    except enrollment_service.CourseNotFound:
+        conn.rollback()
+        return jsonify({'error': 'Course not found'}), 404
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error enrolling student: {e}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+    if result['status'] in _ENROLL_ERRORS:
+        message, status_code = _ENROLL_ERRORS[result['status']]
+        return jsonify({'error': message}), status_code
+
+    print(f"✅ Student {student_id} enrolled in course {course_id}")
+    return jsonify({'id': result['id'], 'message': 'Student enrolled successfully'}), 201
+
 @app.route('/api/courses/<course_id>/enroll', methods=['POST'])
 def enroll_student_in_course(course_id):
     """Enroll a student in a course (Admin only)"""
-    try:
-        data = request.get_json()
-        student_id = data.get('student_id')
+    data = request.get_json(silent=True) or {}
+    student_id = data.get('student_id')
 
-        if not student_id:
-            return jsonify({'error': 'Student ID required'}), 400
+    if not student_id:
+        return jsonify({'error': 'Student ID required'}), 400
 
-        conn = get_db_connection()
+    return _enroll_one(student_id, course_id)
 
-        # Check if student exists and is actually a student
-        student = conn.execute('''
-            SELECT id, role_id FROM users WHERE id = ? AND role_id = 'role_student'
-        ''', (student_id,)).fetchone()
+@app.route('/api/courses/<course_id>/unenroll', methods=['DELETE'])
+def unenroll_student_from_course(course_id):
+    """Remove a student from a course (Admin only)"""
+    data = request.get_json(silent=True) or {}
+    student_id = data.get('student_id')
 
-        if not student:
-            conn.close()
-            return jsonify({'error': 'Student not found'}), 404
+    if not student_id:
+        return jsonify({'error': 'Student ID required'}), 400
 
-        # Check if course exists
-        course = conn.execute('SELECT id FROM courses WHERE id = ?', (course_id,)).fetchone()
-        if not course:
-            conn.close()
-            return jsonify({'error': 'Course not found'}), 404
-
-        # Check if already enrolled
-        existing = conn.execute('''
-            SELECT id FROM user_courses WHERE user_id = ? AND course_id = ?
-        ''', (student_id, course_id)).fetchone()
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        result = enrollment_service.unenroll(conn, student_id, course_id)
+        conn.commit()
+    except enrollment_service.CourseNotFound:
+        conn.rollback()
+        return jsonify({'error': 'Enrollment not found'}), 404
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error unenrolling student: {e}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
 
-        if existing:
-            conn.close()
-            return jsonify({'error': 'Student already enrolled in this course'}), 409
+    if result['status'] == 'not_enrolled':
+        return jsonify({'error': 'Enrollment not found'}), 404
 
-        # Create enrollment
-        enrollment_id = f"enroll_{int(time.time() * 1000)}"
-        now = datetime.now().isoformat()
+    print(f"✅ Student {student_id} unenrolled from course {course_id}")
+    return jsonify({'message': 'Student unenrolled successfully'})
 
-        conn.execute('''
-            INSERT INTO user_courses (id, user_id, course_id, enrolled_at, last_sync)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (enrollment_id, student_id, course_id, now, now))
+@app.route('/api/courses/<course_id>/students', methods=['GET'])
+def get_course_students(course_id):
+    """Students enrolled in a course"""
+    conn = get_db_connection()
+    students = enrollment_service.course_roster(conn, course_id)
+    conn.close()
+    return rows_response(students)
+
+def _bulk_summary(results):
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return summary
+
+@app.route('/api/courses/<course_id>/enroll/bulk', methods=['POST'])
+def bulk_enroll_students(course_id):
+    """Enroll many students in a course in one transaction (Admin only)"""
+    data = request.get_json(silent=True) or {}
+    student_ids = enrollment_service.parse_student_ids(data.get('student_ids'))
+    if not student_ids:
+        return jsonify({'error': 'student_ids required'}), 400
 
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        results = enrollment_service.bulk_enroll(conn, course_id, student_ids, datetime.now().isoformat())
         conn.commit()
+    except enrollment_service.CourseNotFound:
+        conn.rollback()
+        return jsonify({'error': 'Course not found'}), 404
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error bulk enrolling students: {e}")
+        return jsonify({'error': str(e)}), 500
+    finally:
         conn.close()
 
-        print(f"✅ Student {student_id} enrolled in course {course_id}")
-        return jsonify({'id': enrollment_id, 'message': 'Student enrolled successfully'}), 201
+    summary = _bulk_summary(results)
+    print(f"✅ Bulk enroll in {course_id}: {summary}")
+    return jsonify({'course_id': course_id, 'summary': summary, 'results': results})
+
+@app.route('/api/courses/<course_id>/unenroll/bulk', methods=['DELETE'])
+def bulk_unenroll_students(course_id):
+    """Remove many students from a course in one transaction (Admin only)"""
+    data = request.get_json(silent=True) or {}
+    student_ids = enrollment_service.parse_student_ids(data.get('student_ids'))
+    if not student_ids:
+        return jsonify({'error': 'student_ids required'}), 400
 
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        results = enrollment_service.bulk_unenroll(conn, course_id, student_ids)
+        conn.commit()
+    except enrollment_service.CourseNotFound:
+        conn.rollback()
+        return jsonify({'error': 'Course not found'}), 404
     except Exception as e:
-        print(f"❌ Error enrolling student: {e}")
+        conn.rollback()
+        print(f"❌ Error bulk unenrolling students: {e}")
         return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
 
-@app.route('/api/courses/<course_id>/unenroll', methods=['DELETE'])
-def unenroll_student_from_course(course_id):
-    """Remove a student from a course (Admin only)"""
-    try:
-        data = request.get_json()
-        student_id = data.get('student_id')
+    summary = _bulk_summary(results)
+    print(f"✅ Bulk unenroll from {course_id}: {summary}")
+    return jsonify({'course_id': course_id, 'summary': summary, 'results': results})
 
-        if not student_id:
-            return jsonify({'error': 'Student ID required'}), 400
+@app.route('/api/enrollment-requests', methods=['GET'])
+def get_enrollment_requests():
+    """List enrollment requests, optionally filtered by ?status= and ?course_id="""
+    conditions = []
+    params = []
+    for column in ('status', 'course_id', 'lecturer_id'):
+        value = request.args.get(column)
+        if value:
+            conditions.append(f'{column} = ?')
+            params.append(value)
 
-        conn = get_db_connection()
+    query = 'SELECT * FROM enrollment_requests'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY created_at'
+
+    conn = get_db_connection()
+    requests_list = conn.execute(query, params).fetchall()
+    conn.close()
 
-        # Remove enrollment
-        result = conn.execute('''
-            DELETE FROM user_courses WHERE user_id = ? AND course_id = ?
-        ''', (student_id, course_id))
+    return rows_response(requests_list)
 
-        if result.rowcount == 0:
-            conn.close()
-            return jsonify({'error': 'Enrollment not found'}), 404
+@app.route('/api/enrollment-requests', methods=['POST'])
+def create_enrollment_request():
+    """Lecturer asks an admin to enroll/remove a set of students"""
+    data = request.get_json(silent=True) or {}
+    student_ids = enrollment_service.parse_student_ids(data.get('student_ids'))
+    request_type = (data.get('request_type') or 'enroll').lower()
+    if not data.get('lecturer_id') or not data.get('course_id') or not student_ids:
+        return jsonify({'error': 'lecturer_id, course_id and student_ids required'}), 400
+    if request_type not in enrollment_service.ENROLL_REQUEST_TYPES | enrollment_service.UNENROLL_REQUEST_TYPES:
+        return jsonify({'error': f"Unknown request_type '{request_type}'"}), 400
 
-        conn.commit()
-        conn.close()
+    request_id = f"enrollreq_{uuid.uuid4().hex}"
+    now = datetime.now().isoformat()
+    conn = get_db_connection()
+    conn.execute('''
+        INSERT INTO enrollment_requests (id, lecturer_id, course_id, student_ids, request_type,
+                                         reason, status, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, 'pending', ?, ?)
+    ''', (request_id, data['lecturer_id'], data['course_id'], ','.join(student_ids),
+          request_type, data.get('reason'), now, now))
+    conn.commit()
+    conn.close()
 
-        print(f"✅ Student {student_id} unenrolled from course {course_id}")
-        return jsonify({'message': 'Student unenrolled successfully'})
+    return jsonify({'id': request_id, 'message': 'Enrollment request created'}), 201
+
+@app.route('/api/enrollment-requests/<request_id>/process', methods=['POST'])
+def process_enrollment_request(request_id):
+    """Approve (and apply) or reject a pending enrollment request (Admin only)
+
+    Applying the student set and marking the request processed happen in the
+    same transaction, so a request is never left approved but half-applied.
+    """
+    data = request.get_json(silent=True) or {}
+    status = (data.get('status') or 'approved').lower()
+    if status not in ('approved', 'rejected'):
+        return jsonify({'error': "status must be 'approved' or 'rejected'"}), 400
 
+    now = datetime.now().isoformat()
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        enrollment_request = conn.execute(
+            'SELECT * FROM enrollment_requests WHERE id = ?', (request_id,)
+        ).fetchone()
+        if enrollment_request is None:
+            conn.rollback()
+            return jsonify({'error': 'Enrollment request not found'}), 404
+        if enrollment_request['status'] != 'pending':
+            conn.rollback()
+            return jsonify({'error': f"Request already {enrollment_request['status']}"}), 409
+
+        results = []
+        if status == 'approved':
+            results = enrollment_service.process_enrollment_request(conn, enrollment_request, now)
+
+        conn.execute('''
+            UPDATE enrollment_requests SET status = ?, admin_response = ?, updated_at = ?
+            WHERE id = ?
+        ''', (status, data.get('admin_response'), now, request_id))
+        conn.commit()
+    except enrollment_service.CourseNotFound:
+        conn.rollback()
+        return jsonify({'error': 'Course not found'}), 404
+    except ValueError as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"❌ Error unenrolling student: {e}")
+        conn.rollback()
+        print(f"❌ Error processing enrollment request: {e}")
         return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+    summary = _bulk_summary(results)
+    print(f"✅ Enrollment request {request_id} {status}: {summary}")
+    return jsonify({'id': request_id, 'status': status, 'summary': summary, 'results': results})
 
 @app.route('/admin/stats', methods=['GET'])
 def get_admin_stats():
@@ -1754,11 +2149,42 @@ def get_admin_stats():
     conn.close()
     return jsonify(stats)
 
-if __name__ == '__main__':
-    try:
+_background_started = False
+_background_lock = threading.Lock()
+
+def start_background_work():
+    """Bring the database up to date and start the job workers and the
+    download-event flusher, once per process
+
+    `python app.py` calls this at startup. WSGI servers such as gunicorn only
+    import the app, so the first request of each worker process calls it
+    (worker threads do not survive a fork). Set BACKGROUND_WORKERS = False in
+    the app config to leave them off.
+    """
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
         print("🔄 Checking database...")
-        init_database()
+        init_database(show_summary=os.environ.get('VELOCITYVER_DB_SUMMARY') == '1')
         print("✅ Database ready!")
+        job_queue.start()
+        job_queue.enqueue('index_pending_files', priority=-1, unique=True)
+        schedule_maintenance('purge_sync_push_keys')
+        schedule_maintenance('purge_jobs')
+        schedule_maintenance('prune_tombstones')
+        schedule_maintenance('purge_sessions')
+        download_recorder.start()
+        _background_started = True
+
+@app.before_request
+def ensure_background_work():
+    if not _background_started and app.config.get('BACKGROUND_WORKERS', True):
+        start_background_work()
+
+if __name__ == '__main__':
+    try:
+        start_background_work()
 
         print("=" * 60)
         print("🚀 VelocityVer Server Starting...")
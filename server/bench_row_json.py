@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark row_json against the dict(row) + jsonify path
+
+Encodes the same users rows bench_sync_format.py builds with:
+  - jsonify([dict(row) for row in rows])   (the original endpoint code)
+  - row_json with the stdlib encoder
+  - row_json with orjson (if the orjson package is installed)
+
+and checks that the stdlib encoder's output is identical to jsonify's.
+
+Usage:
+    python bench_row_json.py [--rows 10000] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+# Add the server directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import row_json
+from bench_sync_format import build_rows, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark row serialization')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    import app
+    columns, rows = build_rows(args.rows)
+
+    def original():
+        with app.app.app_context():
+            return app.jsonify([dict(row) for row in rows]).get_data()
+
+    cases = [('jsonify (original)', original)]
+    for backend in row_json.available_backends():
+        cases.append((f'row_json {backend}', lambda backend=backend: row_json.encode_rows(columns, rows, backend)))
+
+    print("=" * 72)
+    print(f"🧪 Row serialization benchmark: {args.rows} users rows, best of {args.repeat}")
+    print("=" * 72)
+    print(f"{'encoder':22} {'encode ms':>10} {'bytes':>12} {'speedup':>9}")
+    baseline = None
+    bodies = {}
+    for name, fn in cases:
+        elapsed, body = timed(fn, args.repeat)
+        baseline = baseline or elapsed
+        bodies[name] = body
+        print(f"{name:22} {elapsed * 1000:10.1f} {len(body):12,} {baseline / elapsed:8.1f}x")
+
+    original_body = bodies['jsonify (original)']
+    same = bodies[f'row_json {row_json.STDLIB}'] == original_body
+    print(f"\n{'✅' if same else '❌'} stdlib output identical to jsonify: {same}")
+    for name, body in bodies.items():
+        if json.loads(body) != json.loads(original_body):
+            print(f"❌ {name} decodes to different data")
+
+
+if __name__ == '__main__':
+    main()
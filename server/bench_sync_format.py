@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark the sync wire formats against the original jsonify path
+
+Builds an in-memory users table shaped like the server's, then compares
+encode time and payload size (raw and gzipped) for:
+  - jsonify([dict(row) for row in rows])   (the original endpoint code)
+  - JSON via encode_sync_body               (default sync format)
+  - columnar JSON
+  - MessagePack (if the msgpack package is installed)
+
+Usage:
+    python bench_sync_format.py [--rows 10000] [--repeat 5]
+"""
+
+import argparse
+import gzip
+import os
+import sqlite3
+import sys
+import time
+
+# Add the server directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import migrations
+import sync_format
+
+
+def build_rows(count):
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    migrations.migrate(conn)
+    now = '2025-01-01T08:00:00.000000'
+    conn.executemany('''
+        INSERT INTO users (id, username, email, password_hash, role_id, first_name, last_name,
+                           level_id, year_id, department_id, faculty_id, profile_picture,
+                           created_at, updated_at, last_sync)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(f'user_{i}', f'student{i}', f'student{i}@student.edu.ng', 'x' * 100, 'role_student',
+           f'First{i}', f'Last{i}', 'level_undergraduate', 'year_2', 'dept_computer_science',
+           'fac_engineering', 'default_avatar.png', now, now, now) for i in range(count)])
+    cursor = conn.execute('SELECT * FROM users')
+    columns = [column[0] for column in cursor.description]
+    return columns, cursor.fetchall()
+
+
+def timed(fn, repeat):
+    best = None
+    body = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark sync response encodings')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    import app
+    columns, rows = build_rows(args.rows)
+
+    def original():
+        with app.app.app_context():
+            return app.jsonify({'items': [dict(row) for row in rows]}).get_data()
+
+    cases = [('jsonify (original)', original)]
+    for fmt in sync_format.available_formats():
+        cases.append((fmt, lambda fmt=fmt: app.encode_sync_body('items', columns, rows, fmt)[0]))
+
+    print("=" * 72)
+    print(f"🧪 Sync format benchmark: {args.rows} users rows, best of {args.repeat}")
+    print("=" * 72)
+    print(f"{'format':22} {'encode ms':>10} {'bytes':>12} {'gzip bytes':>12}")
+    for name, fn in cases:
+        elapsed, body = timed(fn, args.repeat)
+        print(f"{name:22} {elapsed * 1000:10.1f} {len(body):12,} {len(gzip.compress(body)):12,}")
+
+
+if __name__ == '__main__':
+    main()
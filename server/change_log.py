@@ -0,0 +1,127 @@
+"""
+Sequence-based change feed over the sync_metadata change log
+
+Triggers created by migration 3 (see migrations.change_log_triggers) keep one
+sync_metadata row per synced record holding its latest action
+(insert/update/delete) and a monotonic sequence number. A client that
+remembers the last sequence it applied asks for everything after it and gets
+the current rows for inserts/updates plus tombstones for deletes, so deletes
+and deactivations reach devices without a full re-download.
+"""
+
+from migrations import SYNCED_TABLES
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 5000
+
+# Columns that are never sent to devices
+EXCLUDED_COLUMNS = {'users': {'password_hash'}}
+
+# Keep IN (...) lists under SQLite's default host parameter limit
+_ID_CHUNK = 500
+
+
+def current_cursor(conn):
+    """Latest sequence number handed out by the change-log triggers"""
+    row = conn.execute('SELECT value FROM sync_sequence WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+
+def _fetch_records(conn, table, ids, scope=None):
+    excluded = EXCLUDED_COLUMNS.get(table, set())
+    columns, column_params = scope.columns(table) if scope else ('*', [])
+    condition, condition_params = scope.filter(table) if scope else (None, [])
+    records = []
+    for start in range(0, len(ids), _ID_CHUNK):
+        chunk = ids[start:start + _ID_CHUNK]
+        placeholders = ','.join('?' for _ in chunk)
+        query = f'SELECT {columns} FROM {table} WHERE id IN ({placeholders})'
+        if condition:
+            query += f' AND {condition}'
+        for row in conn.execute(query, [*column_params, *chunk, *condition_params]):
+            records.append({key: row[key] for key in row.keys() if key not in excluded})
+    return records
+
+
+def fetch_changes(conn, since_seq, limit=DEFAULT_LIMIT, scope=None):
+    """Changes after since_seq, grouped per table
+
+    Returns {'cursor', 'has_more', 'full_resync', 'tables': {table: {'upserts', 'deletes'}}}.
+    full_resync is set when tombstones the client has not seen were pruned.
+    With a sync_scope.SyncScope, upserts are limited to the rows and columns
+    that scope may see. A changed row the scope may not see is sent as a
+    delete, since the device may hold it from before it left the scope
+    (enrollments and lecturer changes re-stamp the affected rows, see
+    migrations.scope_change_triggers). Deletes only carry ids.
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    pruned_through = conn.execute(
+        'SELECT pruned_through FROM sync_sequence WHERE id = 1'
+    ).fetchone()[0]
+    if 0 < since_seq < pruned_through:
+        return {'cursor': current_cursor(conn), 'has_more': False, 'full_resync': True, 'tables': {}}
+
+    entries = conn.execute('''
+        SELECT table_name, record_id, action, seq FROM sync_metadata
+        WHERE seq > ?
+        ORDER BY seq
+        LIMIT ?
+    ''', (since_seq, limit + 1)).fetchall()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    upsert_ids = {}
+    tables = {}
+    for entry in entries:
+        table = entry['table_name']
+        if table not in SYNCED_TABLES:
+            continue
+        changes = tables.setdefault(table, {'upserts': [], 'deletes': []})
+        if entry['action'] == 'delete':
+            changes['deletes'].append(entry['record_id'])
+        else:
+            upsert_ids.setdefault(table, []).append(entry['record_id'])
+
+    for table, ids in upsert_ids.items():
+        records = _fetch_records(conn, table, ids, scope)
+        tables[table]['upserts'] = records
+        if scope is not None:
+            visible = {record['id'] for record in records}
+            tables[table]['deletes'] += [record_id for record_id in ids if record_id not in visible]
+
+    return {
+        'cursor': entries[-1]['seq'] if entries else max(since_seq, 0),
+        'has_more': has_more,
+        'full_resync': False,
+        'tables': tables,
+    }
+
+
+def prune_tombstones(conn, through_seq):
+    """Drop delete tombstones up to through_seq; returns the number removed
+
+    Clients whose cursor is older than the pruned range are told to do a full
+    resync by fetch_changes(). Caller commits.
+    """
+    removed = conn.execute(
+        "DELETE FROM sync_metadata WHERE action = 'delete' AND seq <= ?", (through_seq,)
+    ).rowcount
+    conn.execute(
+        'UPDATE sync_sequence SET pruned_through = MAX(pruned_through, ?) WHERE id = 1',
+        (through_seq,)
+    )
+    return removed
+
+
+def prune_tombstones_before(conn, before):
+    """Drop delete tombstones recorded before the given ISO time; returns the number removed
+
+    Prunes through the newest such tombstone, so only devices that have not
+    synced since then need a full resync. Caller commits.
+    """
+    through_seq = conn.execute(
+        "SELECT MAX(seq) FROM sync_metadata WHERE action = 'delete' AND updated_at < ?", (before,)
+    ).fetchone()[0]
+    if through_seq is None:
+        return 0
+    return prune_tombstones(conn, through_seq)
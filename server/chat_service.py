@@ -0,0 +1,120 @@
+"""
+Chat rooms, membership and unread state
+
+A user's rooms are the chat_participants rows with their user_id. Each row
+carries the member's unread_count and last-read marker; the
+trg_messages_chat_room trigger (migration 11) bumps the counters and the
+room's last_message_id whenever a message is posted to a room, so reading
+the room list never has to count messages.
+
+Staff rooms (one per lecturer, shared with the admins) are provisioned with
+provision_staff_rooms(), on database setup and whenever users are created.
+"""
+
+from datetime import datetime
+
+# Every lecturer has one room shared with all admins, keyed by lecturer id
+LECTURER_ROOM_PREFIX = 'chat_lecturer_'
+CHAT_ADMIN_ROLES = ('role_admin',)
+
+
+class NotAParticipant(Exception):
+    pass
+
+
+def provision_staff_rooms(conn, user_id=None, now=None):
+    """Create the missing lecturer-admin rooms and memberships
+
+    With user_id, only the rooms that user belongs in: their own room for a
+    lecturer, every lecturer room for an admin. Room and participant ids are
+    derived from the user ids, so running this again adds nothing.
+    Returns {'rooms': created, 'participants': added}. Caller commits.
+    """
+    now = now or datetime.now().isoformat()
+    admin_roles = ', '.join(f"'{role}'" for role in CHAT_ADMIN_ROLES)
+    rooms = conn.execute(f'''
+        INSERT OR IGNORE INTO chat_rooms (id, name, created_by, created_at, updated_at, last_activity, is_active)
+        SELECT '{LECTURER_ROOM_PREFIX}' || l.id, 'Chat with ' || l.first_name, l.id, ?, ?, ?, 1
+        FROM users l
+        WHERE l.role_id = 'role_lecturer' AND l.is_active = 1 AND (? IS NULL OR l.id = ?)
+    ''', (now, now, now, user_id, user_id)).rowcount
+    participants = conn.execute(f'''
+        INSERT OR IGNORE INTO chat_participants (id, room_id, user_id, joined_at)
+        SELECT r.id || ':' || m.id, r.id, m.id, ?
+        FROM users l
+        JOIN chat_rooms r ON r.id = '{LECTURER_ROOM_PREFIX}' || l.id
+        JOIN users m ON m.id = l.id OR (m.role_id IN ({admin_roles}) AND m.is_active = 1)
+        WHERE l.role_id = 'role_lecturer' AND l.is_active = 1
+          AND (? IS NULL OR l.id = ? OR m.id = ?)
+    ''', (now, user_id, user_id, user_id)).rowcount
+    return {'rooms': rooms, 'participants': participants}
+
+
+def user_rooms(conn, user_id):
+    """Active rooms of user_id, most recently active first, with unread state
+    and a preview of the last message"""
+    return conn.execute('''
+        SELECT r.id, r.name, r.created_by, r.created_at, r.updated_at, r.is_active,
+               r.last_message_id, COALESCE(r.last_activity, r.created_at) AS last_activity,
+               (SELECT GROUP_CONCAT(cp.user_id) FROM chat_participants cp
+                WHERE cp.room_id = r.id) AS participant_ids,
+               p.unread_count, p.last_read_message_id, p.last_read_at,
+               m.content AS last_message_content, m.sender_id AS last_message_sender_id,
+               m.message_type AS last_message_type
+        FROM chat_participants p
+        JOIN chat_rooms r ON r.id = p.room_id
+        LEFT JOIN messages m ON m.id = r.last_message_id
+        WHERE p.user_id = ? AND COALESCE(r.is_active, 1) = 1
+        ORDER BY last_activity DESC
+    ''', (user_id,)).fetchall()
+
+
+def unread_total(conn, user_id):
+    return conn.execute('''
+        SELECT COALESCE(SUM(p.unread_count), 0)
+        FROM chat_participants p
+        JOIN chat_rooms r ON r.id = p.room_id
+        WHERE p.user_id = ? AND COALESCE(r.is_active, 1) = 1
+    ''', (user_id,)).fetchone()[0]
+
+
+def is_participant(conn, room_id, user_id):
+    return conn.execute(
+        'SELECT 1 FROM chat_participants WHERE room_id = ? AND user_id = ?', (room_id, user_id)
+    ).fetchone() is not None
+
+
+def mark_read(conn, room_id, user_id, message_id=None):
+    """Move user_id's last-read marker in room_id to message_id (default: the
+    latest message) and recount what is unread after it. Caller commits.
+
+    Raises NotAParticipant, or ValueError if message_id is not in the room.
+    """
+    if not is_participant(conn, room_id, user_id):
+        raise NotAParticipant(room_id)
+
+    if message_id is None:
+        marker = conn.execute('''
+            SELECT id, created_at FROM messages WHERE chat_room_id = ?
+            ORDER BY created_at DESC LIMIT 1
+        ''', (room_id,)).fetchone()
+    else:
+        marker = conn.execute('SELECT id, created_at FROM messages WHERE id = ? AND chat_room_id = ?',
+                              (message_id, room_id)).fetchone()
+        if marker is None:
+            raise ValueError(f"Message '{message_id}' is not in this room")
+
+    unread = 0
+    if marker is not None:
+        unread = conn.execute('''
+            SELECT COUNT(*) FROM messages
+            WHERE chat_room_id = ? AND created_at > ? AND sender_id != ?
+        ''', (room_id, marker['created_at'], user_id)).fetchone()[0]
+
+    conn.execute('''
+        UPDATE chat_participants
+        SET unread_count = ?, last_read_message_id = ?, last_read_at = ?
+        WHERE room_id = ? AND user_id = ?
+    ''', (unread, marker['id'] if marker else None, datetime.now().isoformat(), room_id, user_id))
+    return {'room_id': room_id, 'user_id': user_id, 'unread_count': unread,
+            'last_read_message_id': marker['id'] if marker else None}
@@ -0,0 +1,201 @@
+"""
+Response compression negotiated from Accept-Encoding
+
+init_compression(app) registers an after_request hook that compresses JSON
+and other text responses with the best encoding both sides support
+(zstd > br > gzip). gzip is always available; brotli and zstd are used when
+the optional `brotli` / `zstandard` packages are installed.
+
+- Bodies smaller than COMPRESS_MIN_SIZE are sent as-is.
+- Streamed responses (generators, file downloads) are compressed chunk by
+  chunk instead of being buffered.
+- Formats that are already compressed (pdf, docx, pptx, xlsx, images,
+  archives) are never recompressed, and zero-copy file downloads (see
+  file_delivery.py) are left alone.
+- Responses that carry an ETag (e.g. the cached reference-data endpoints)
+  have their compressed body cached per (ETag, encoding), so a cache hit
+  does not pay for compression again. The ETag is weakened, as with
+  nginx, because the encoded bytes differ from the identity body.
+"""
+
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_LEVEL = 6
+DEFAULT_CACHE_ENTRIES = 256
+
+# Content types that gain nothing from another compression pass
+COMPRESSED_MIMETYPE_PREFIXES = (
+    'image/', 'video/', 'audio/',
+    'application/pdf',
+    'application/zip',
+    'application/gzip',
+    'application/x-gzip',
+    'application/x-7z-compressed',
+    'application/x-rar-compressed',
+    'application/vnd.openxmlformats-officedocument.',
+    'application/vnd.ms-',
+    'application/msword',
+    'application/octet-stream',
+)
+COMPRESSED_EXTENSIONS = {
+    '.pdf', '.docx', '.pptx', '.xlsx', '.odt', '.zip', '.gz',
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.mp3', '.mp4',
+}
+
+
+def available_encodings():
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return encodings
+
+
+def negotiate_encoding(accept_encodings):
+    """Pick the preferred supported encoding from a parsed Accept-Encoding"""
+    best, best_quality = None, 0
+    for encoding in available_encodings():
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _compressor(encoding, level):
+    """Return (compress(chunk), finish()) for a streaming compressor"""
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        return compressor.compress, compressor.flush
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=min(level, 11))
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    return compressor.compress, compressor.flush
+
+
+def compress_bytes(data, encoding, level=DEFAULT_LEVEL):
+    compress, finish = _compressor(encoding, level)
+    return compress(data) + finish()
+
+
+def compress_stream(chunks, encoding, level=DEFAULT_LEVEL):
+    compress, finish = _compressor(encoding, level)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        compressed = compress(chunk)
+        if compressed:
+            yield compressed
+    yield finish()
+
+
+def is_precompressed(response, path=''):
+    if response.mimetype and response.mimetype.startswith(COMPRESSED_MIMETYPE_PREFIXES):
+        return True
+    filename = response.headers.get('Content-Disposition', '') or path
+    return any(filename.lower().rstrip('"').endswith(ext) for ext in COMPRESSED_EXTENSIONS)
+
+
+def _add_vary(response):
+    vary = {v.strip().lower() for v in response.headers.get('Vary', '').split(',') if v.strip()}
+    if 'accept-encoding' not in vary:
+        response.headers.add('Vary', 'Accept-Encoding')
+
+
+class CompressedBodyCache:
+    """Small LRU of compressed bodies keyed by (etag, encoding)"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def init_compression(app):
+    """Register response compression on a Flask app"""
+    from flask import request
+
+    app.config.setdefault('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE)
+    app.config.setdefault('COMPRESS_LEVEL', DEFAULT_LEVEL)
+    app.config.setdefault('COMPRESS_CACHE_ENTRIES', DEFAULT_CACHE_ENTRIES)
+    body_cache = CompressedBodyCache(app.config['COMPRESS_CACHE_ENTRIES'])
+    app.extensions['compression'] = body_cache
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or request.method == 'HEAD'
+                or 'Content-Encoding' in response.headers
+                or getattr(response, 'zero_copy', False)
+                or is_precompressed(response, request.path)):
+            return response
+
+        _add_vary(response)
+        encoding = negotiate_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        level = app.config['COMPRESS_LEVEL']
+        if response.is_streamed or response.direct_passthrough:
+            # Generators and file downloads: compress as the chunks go out
+            response.direct_passthrough = False
+            response.response = compress_stream(response.response, encoding, level)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < app.config['COMPRESS_MIN_SIZE']:
+                return response
+            etag, _ = response.get_etag()
+            compressed = body_cache.get((etag, encoding)) if etag else None
+            if compressed is None:
+                compressed = compress_bytes(body, encoding, level)
+                if etag:
+                    body_cache.put((etag, encoding), compressed)
+            if len(compressed) >= len(body):
+                return response
+            response.set_data(compressed)
+            if etag:
+                response.set_etag(etag, weak=True)
+
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    return body_cache
@@ -0,0 +1,80 @@
+"""
+Shared pytest fixtures: a migrated database with a small campus in it
+"""
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import migrations
+
+NOW = '2024-01-01T00:00:00'
+
+ROLES = [('role_admin', 'Admin'), ('role_lecturer', 'Lecturer'), ('role_student', 'Student')]
+USERS = [
+    ('user_admin', 'admin', 'role_admin', 'Ada', 'Admin'),
+    ('user_lect1', 'lect1', 'role_lecturer', 'Lola', 'Thermo'),
+    ('user_lect2', 'lect2', 'role_lecturer', 'Kunle', 'Circuit'),
+    ('user_stud1', 'stud1', 'role_student', 'Sade', 'First'),
+    ('user_stud2', 'stud2', 'role_student', 'Tayo', 'Second'),
+]
+COURSES = [
+    ('course_thermo', 'Thermodynamics', 'MEE301', 'user_lect1'),
+    ('course_circuit', 'Circuit Analysis', 'EEE201', 'user_lect2'),
+]
+ENROLLMENTS = [('uc_1', 'user_stud1', 'course_thermo'), ('uc_2', 'user_stud2', 'course_circuit')]
+FILES = [
+    ('file_thermo', 'entropy.txt', 'course_thermo', 'user_lect1', 'Entropy lecture notes'),
+    ('file_circuit', 'kirchhoff.txt', 'course_circuit', 'user_lect2', 'Kirchhoff laws worked examples'),
+]
+ANNOUNCEMENTS = [
+    ('ann_thermo', 'Thermodynamics quiz', 'Quiz on entropy next week', 'user_lect1', '', 'course_thermo'),
+    ('ann_all', 'Library hours', 'The library opens late during exams', 'user_admin', '', ''),
+]
+
+
+@pytest.fixture
+def campus(tmp_path):
+    """connect() for a fresh, fully migrated database holding the rows above"""
+    path = str(tmp_path / 'campus.db')
+
+    def connect():
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    conn = connect()
+    migrations.migrate(conn)
+    conn.executemany('INSERT INTO roles (id, name, permissions, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                     [(role_id, name, '', NOW, NOW) for role_id, name in ROLES])
+    conn.executemany('''
+        INSERT INTO users (id, username, email, password_hash, role_id, first_name, last_name,
+                           created_at, updated_at)
+        VALUES (?, ?, ?, 'x', ?, ?, ?, ?, ?)
+    ''', [(user_id, username, f'{username}@example.com', role_id, first, last, NOW, NOW)
+          for user_id, username, role_id, first, last in USERS])
+    conn.executemany('''
+        INSERT INTO courses (id, name, code, level_id, year_id, department_id, faculty_id,
+                             lecturer_id, created_at, updated_at)
+        VALUES (?, ?, ?, 'level_300', 'year_1', 'dept_eng', 'fac_eng', ?, ?, ?)
+    ''', [(*course, NOW, NOW) for course in COURSES])
+    conn.executemany('INSERT INTO user_courses (id, user_id, course_id, enrolled_at) VALUES (?, ?, ?, ?)',
+                     [(*enrollment, NOW) for enrollment in ENROLLMENTS])
+    conn.executemany('''
+        INSERT INTO files (id, name, original_name, file_path, file_size, mime_type, course_id,
+                           uploaded_by, description, created_at, updated_at)
+        VALUES (?, ?, ?, ?, 10, 'text/plain', ?, ?, ?, ?, ?)
+    ''', [(file_id, name, name, os.path.join(str(tmp_path), name), course_id, uploader, description, NOW, NOW)
+          for file_id, name, course_id, uploader, description in FILES])
+    conn.executemany('''
+        INSERT INTO announcements (id, title, content, author_id, target_roles, target_courses,
+                                   created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(*announcement, NOW, NOW) for announcement in ANNOUNCEMENTS])
+    conn.commit()
+    conn.close()
+    return connect
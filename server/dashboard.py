@@ -0,0 +1,114 @@
+"""
+Lecturer and student dashboards in one response
+
+A dashboard holds the user's courses with per-course file, student and
+announcement counts, the most recent files of those courses and the most
+recent announcements addressed to the user. All of it is read inside one
+read transaction, so the counts and lists agree with each other and with
+the change-log cursor returned alongside them (the endpoints use that
+cursor to cache the encoded response until the next write).
+
+Counts are correlated subqueries on (course_id, ...) indexes, and
+announcements addressed to a course are found through announcement_courses
+(migration 16) instead of LIKE over the comma-separated target_courses.
+"""
+
+import json
+
+import change_log
+from search_index import scope_for_user
+
+DEFAULT_RECENT = 10
+MAX_RECENT = 50
+
+_COURSE_COLUMNS = '''
+    c.id, c.name, c.code, c.description, c.level_id, c.year_id, c.department_id,
+    c.faculty_id, c.lecturer_id, c.created_at, c.updated_at,
+    (SELECT COUNT(*) FROM files f WHERE f.course_id = c.id) AS file_count,
+    (SELECT COUNT(*) FROM user_courses uc WHERE uc.course_id = c.id) AS student_count,
+    (SELECT COUNT(*) FROM announcement_courses ac
+     JOIN announcements a ON a.id = ac.announcement_id
+     WHERE ac.course_id = c.id AND a.is_active = 1) AS announcement_count
+'''
+
+_IN_COURSES = 'IN (SELECT value FROM json_each(?))'
+
+
+def _courses(conn, scope):
+    if scope.role_id == 'role_lecturer':
+        query = f'''
+            SELECT {_COURSE_COLUMNS}
+            FROM courses c
+            WHERE c.lecturer_id = ? AND c.is_active = 1
+            ORDER BY c.name
+        '''
+    else:
+        query = f'''
+            SELECT {_COURSE_COLUMNS},
+                   l.first_name || ' ' || l.last_name AS lecturer_name
+            FROM user_courses e
+            JOIN courses c ON c.id = e.course_id
+            LEFT JOIN users l ON l.id = c.lecturer_id
+            WHERE e.user_id = ? AND c.is_active = 1
+            ORDER BY c.name
+        '''
+    return [dict(row) for row in conn.execute(query, (scope.user_id,))]
+
+
+def _recent_files(conn, course_ids, recent):
+    return [dict(row) for row in conn.execute(f'''
+        SELECT f.id, f.name, f.original_name, f.file_size, f.mime_type, f.course_id,
+               c.name AS course_name, f.uploaded_by, f.description, f.created_at
+        FROM files f
+        JOIN courses c ON c.id = f.course_id
+        WHERE f.course_id {_IN_COURSES}
+        ORDER BY f.created_at DESC
+        LIMIT ?
+    ''', (json.dumps(course_ids), recent))]
+
+
+def _recent_announcements(conn, scope, course_ids, recent):
+    """Active announcements the user wrote, or that target their role (or
+    everyone) and either no course or one of their courses; the same rule
+    the sync scope applies"""
+    return [dict(row) for row in conn.execute(f'''
+        SELECT a.id, a.title, a.content, a.author_id,
+               u.first_name || ' ' || u.last_name AS author_name,
+               a.target_roles, a.target_courses, a.created_at, a.updated_at
+        FROM announcements a
+        LEFT JOIN users u ON u.id = a.author_id
+        WHERE a.is_active = 1
+          AND (a.author_id = ? OR (
+                (COALESCE(a.target_roles, '') = '' OR ',' || a.target_roles || ',' LIKE '%,' || ? || ',%')
+                AND (COALESCE(a.target_courses, '') = '' OR a.id IN (
+                    SELECT announcement_id FROM announcement_courses WHERE course_id {_IN_COURSES}))
+          ))
+        ORDER BY a.created_at DESC
+        LIMIT ?
+    ''', (scope.user_id, scope.role_name, json.dumps(course_ids), recent))]
+
+
+def build_dashboard(conn, user_id, role_id, recent=DEFAULT_RECENT):
+    """Dashboard of user_id, or None unless they are an active user with role_id"""
+    recent = max(1, min(int(recent), MAX_RECENT))
+    conn.execute('BEGIN')
+    try:
+        scope = scope_for_user(conn, user_id)
+        if scope.role_id != role_id:
+            return None
+        courses = _courses(conn, scope)
+        course_ids = [course['id'] for course in courses]
+        return {
+            'user_id': scope.user_id,
+            'courses': courses,
+            'recent_files': _recent_files(conn, course_ids, recent),
+            'recent_announcements': _recent_announcements(conn, scope, course_ids, recent),
+            'totals': {
+                'courses': len(courses),
+                'files': sum(course['file_count'] for course in courses),
+                'announcements': sum(course['announcement_count'] for course in courses),
+            },
+            'cursor': change_log.current_cursor(conn),
+        }
+    finally:
+        conn.rollback()
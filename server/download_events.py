@@ -0,0 +1,184 @@
+"""
+Download accounting without a database write per download
+
+Download endpoints call record(), which only appends the event to an
+in-memory buffer. A background thread flushes the buffer every
+FLUSH_INTERVAL seconds (or as soon as MAX_BATCH events are waiting) in one
+transaction that appends the events to the `downloads` table and bumps the
+file_download_stats / course_download_stats counters (migration 10).
+
+    download_events = DownloadRecorder(get_db_connection)
+    download_events.start()
+    download_events.record(file_id, user_id, course_id, size)
+
+Events still in the buffer when the process is killed are lost; stop()
+(also registered with atexit) flushes them on a normal shutdown. Readers
+that must see their own downloads call flush() first.
+"""
+
+import atexit
+import threading
+from datetime import datetime
+
+FLUSH_INTERVAL = 2.0
+MAX_BATCH = 500
+# Events kept for retry when the database is unavailable
+MAX_PENDING = 50_000
+
+
+class DownloadRecorder:
+    def __init__(self, connect, flush_interval=FLUSH_INTERVAL, max_batch=MAX_BATCH):
+        self.connect = connect
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._events = []
+        self._lock = threading.Lock()
+        # Serializes flushes so events are written in the order they happened
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def record(self, file_id, user_id=None, course_id=None, size=None):
+        event = (file_id, user_id, course_id, size, datetime.now().isoformat())
+        with self._lock:
+            self._events.append(event)
+            full = len(self._events) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._events)
+
+    def flush(self):
+        """Write buffered events; returns the number written"""
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+            if not events:
+                return 0
+            try:
+                self._write(events)
+            except Exception as e:
+                with self._lock:
+                    self._events[:0] = events[-MAX_PENDING:]
+                print(f"⚠️  Could not record {len(events)} downloads, will retry: {e}")
+                return 0
+            return len(events)
+
+    def _write(self, events):
+        conn = self.connect()
+        try:
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS pending_downloads ('
+                         'file_id TEXT, user_id TEXT, course_id TEXT, bytes INTEGER, downloaded_at TEXT)')
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM pending_downloads')
+            conn.executemany('INSERT INTO pending_downloads VALUES (?, ?, ?, ?, ?)', events)
+            # Counters first: unique downloaders are the users with no earlier
+            # download of the file, which the history insert below would hide
+            conn.execute('''
+                INSERT INTO file_download_stats (file_id, course_id, download_count,
+                                                 unique_downloaders, last_downloaded_at)
+                SELECT p.file_id, MAX(p.course_id), COUNT(*),
+                       COUNT(DISTINCT CASE WHEN NOT EXISTS (
+                           SELECT 1 FROM downloads d WHERE d.file_id = p.file_id AND d.user_id = p.user_id
+                       ) THEN p.user_id END),
+                       MAX(p.downloaded_at)
+                FROM pending_downloads p
+                WHERE true
+                GROUP BY p.file_id
+                ON CONFLICT (file_id) DO UPDATE SET
+                    course_id = COALESCE(excluded.course_id, course_id),
+                    download_count = download_count + excluded.download_count,
+                    unique_downloaders = unique_downloaders + excluded.unique_downloaders,
+                    last_downloaded_at = MAX(COALESCE(last_downloaded_at, ''), excluded.last_downloaded_at)
+            ''')
+            conn.execute('''
+                INSERT INTO course_download_stats (course_id, download_count, last_downloaded_at)
+                SELECT course_id, COUNT(*), MAX(downloaded_at)
+                FROM pending_downloads
+                WHERE course_id IS NOT NULL
+                GROUP BY course_id
+                ON CONFLICT (course_id) DO UPDATE SET
+                    download_count = download_count + excluded.download_count,
+                    last_downloaded_at = MAX(COALESCE(last_downloaded_at, ''), excluded.last_downloaded_at)
+            ''')
+            conn.execute('''
+                INSERT INTO downloads (file_id, user_id, course_id, bytes, downloaded_at)
+                SELECT file_id, user_id, course_id, bytes, downloaded_at FROM pending_downloads
+            ''')
+            conn.execute('DELETE FROM pending_downloads')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, name='download-events', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+
+def user_downloads(conn, user_id, limit=100, offset=0):
+    """Files user_id has downloaded, most recent first
+
+    Each file row keeps its own download_count (all users) and adds
+    user_download_count and last_downloaded_at for user_id.
+    """
+    return conn.execute('''
+        SELECT f.*, COUNT(*) AS user_download_count, MAX(d.downloaded_at) AS last_downloaded_at
+        FROM downloads d
+        JOIN files f ON f.id = d.file_id
+        WHERE d.user_id = ?
+        GROUP BY d.file_id
+        ORDER BY last_downloaded_at DESC
+        LIMIT ? OFFSET ?
+    ''', (user_id, limit, offset)).fetchall()
+
+
+def file_stats(conn, file_id):
+    row = conn.execute('SELECT * FROM file_download_stats WHERE file_id = ?', (file_id,)).fetchone()
+    if row is None:
+        return {'file_id': file_id, 'download_count': 0, 'unique_downloaders': 0,
+                'last_downloaded_at': None}
+    return dict(row)
+
+
+def course_stats(conn, course_id, limit=10):
+    """Totals for one course and its most downloaded files"""
+    totals = conn.execute('SELECT * FROM course_download_stats WHERE course_id = ?',
+                          (course_id,)).fetchone()
+    top_files = conn.execute('''
+        SELECT s.file_id, f.original_name, s.download_count, s.unique_downloaders, s.last_downloaded_at
+        FROM file_download_stats s
+        JOIN files f ON f.id = s.file_id
+        WHERE s.course_id = ?
+        ORDER BY s.download_count DESC
+        LIMIT ?
+    ''', (course_id, limit)).fetchall()
+    return {
+        'course_id': course_id,
+        'download_count': totals['download_count'] if totals else 0,
+        'last_downloaded_at': totals['last_downloaded_at'] if totals else None,
+        'top_files': [dict(row) for row in top_files],
+    }
@@ -0,0 +1,155 @@
+"""
+Course enrollment storage
+
+user_courses is the only enrollment table (migration 5 merged the legacy
+`enrollments` table into it and left a read-only view in its place). Every
+endpoint that reads or writes enrollments goes through this module. Lookups
+by student use the unique (user_id, course_id) index and course rosters use
+the reverse (course_id, user_id) index.
+
+Bulk operations load the whole set of student IDs into a temp table once and
+then validate and apply it with a handful of joins, instead of running a
+student check, course check, duplicate check and insert per student.
+Callers own the transaction (commit/rollback) so a bulk change is applied
+atomically.
+"""
+
+import uuid
+
+ENROLL_REQUEST_TYPES = {'enroll', 'add'}
+UNENROLL_REQUEST_TYPES = {'unenroll', 'remove'}
+
+
+class CourseNotFound(Exception):
+    pass
+
+
+def parse_student_ids(value):
+    """Accept a list or the comma-joined string stored in enrollment_requests"""
+    if isinstance(value, str):
+        value = value.split(',')
+    seen = []
+    for student_id in value or []:
+        student_id = str(student_id).strip()
+        if student_id and student_id not in seen:
+            seen.append(student_id)
+    return seen
+
+
+def _load_ids(conn, student_ids):
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS bulk_student_ids (user_id TEXT PRIMARY KEY)')
+    conn.execute('DELETE FROM bulk_student_ids')
+    conn.executemany('INSERT OR IGNORE INTO bulk_student_ids (user_id) VALUES (?)',
+                     [(student_id,) for student_id in student_ids])
+
+
+def _classify(conn, course_id):
+    """Per-student state relative to course_id, in one query"""
+    return conn.execute('''
+        SELECT b.user_id,
+               u.id IS NOT NULL AS user_exists,
+               u.role_id = 'role_student' AS is_student,
+               uc.id IS NOT NULL AS is_enrolled
+        FROM bulk_student_ids b
+        LEFT JOIN users u ON u.id = b.user_id
+        LEFT JOIN user_courses uc ON uc.user_id = b.user_id AND uc.course_id = ?
+    ''', (course_id,)).fetchall()
+
+
+def _require_course(conn, course_id):
+    if conn.execute('SELECT 1 FROM courses WHERE id = ?', (course_id,)).fetchone() is None:
+        raise CourseNotFound(course_id)
+
+
+def bulk_enroll(conn, course_id, student_ids, now):
+    """Enroll every valid student in course_id; returns per-student results"""
+    _require_course(conn, course_id)
+    _load_ids(conn, student_ids)
+
+    statuses = {}
+    for row in _classify(conn, course_id):
+        if not row['user_exists']:
+            statuses[row['user_id']] = 'not_found'
+        elif not row['is_student']:
+            statuses[row['user_id']] = 'not_student'
+        elif row['is_enrolled']:
+            statuses[row['user_id']] = 'already_enrolled'
+        else:
+            statuses[row['user_id']] = 'enrolled'
+
+    enrollment_ids = {student_id: f'enroll_{uuid.uuid4().hex}'
+                      for student_id in student_ids if statuses.get(student_id) == 'enrolled'}
+    conn.executemany('''
+        INSERT INTO user_courses (id, user_id, course_id, enrolled_at, last_sync)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(enrollment_id, student_id, course_id, now, now)
+          for student_id, enrollment_id in enrollment_ids.items()])
+
+    results = []
+    for student_id in student_ids:
+        result = {'student_id': student_id, 'status': statuses[student_id]}
+        if student_id in enrollment_ids:
+            result['id'] = enrollment_ids[student_id]
+        results.append(result)
+    return results
+
+
+def bulk_unenroll(conn, course_id, student_ids):
+    """Remove every listed student from course_id; returns per-student results"""
+    _require_course(conn, course_id)
+    _load_ids(conn, student_ids)
+
+    enrolled = {row['user_id'] for row in _classify(conn, course_id) if row['is_enrolled']}
+    conn.execute('''
+        DELETE FROM user_courses
+        WHERE course_id = ? AND user_id IN (SELECT user_id FROM bulk_student_ids)
+    ''', (course_id,))
+
+    return [{'student_id': student_id,
+             'status': 'unenrolled' if student_id in enrolled else 'not_enrolled'}
+            for student_id in student_ids]
+
+
+def process_enrollment_request(conn, request_row, now):
+    """Apply an approved enrollment request; returns per-student results"""
+    student_ids = parse_student_ids(request_row['student_ids'])
+    request_type = (request_row['request_type'] or '').lower()
+    if request_type in ENROLL_REQUEST_TYPES:
+        return bulk_enroll(conn, request_row['course_id'], student_ids, now)
+    if request_type in UNENROLL_REQUEST_TYPES:
+        return bulk_unenroll(conn, request_row['course_id'], student_ids)
+    raise ValueError(f"Unknown request_type '{request_row['request_type']}'")
+
+
+def enroll(conn, student_id, course_id, now):
+    """Enroll one student; returns the bulk_enroll result for that student"""
+    return bulk_enroll(conn, course_id, [student_id], now)[0]
+
+
+def unenroll(conn, student_id, course_id):
+    """Remove one student; returns the bulk_unenroll result for that student"""
+    return bulk_unenroll(conn, course_id, [student_id])[0]
+
+
+def student_courses(conn, student_id):
+    """Courses a student is enrolled in"""
+    return conn.execute('''
+        SELECT c.*
+        FROM user_courses uc
+        JOIN courses c ON c.id = uc.course_id
+        WHERE uc.user_id = ?
+        ORDER BY c.code
+    ''', (student_id,)).fetchall()
+
+
+def course_roster(conn, course_id):
+    """Students enrolled in a course, without password hashes"""
+    return conn.execute('''
+        SELECT u.id, u.username, u.email, u.role_id, u.first_name, u.last_name,
+               u.level_id, u.year_id, u.department_id, u.faculty_id, u.is_active,
+               u.profile_picture, u.created_at, u.updated_at, u.last_sync, uc.enrolled_at
+        FROM user_courses uc
+        JOIN users u ON u.id = uc.user_id
+        WHERE uc.course_id = ?
+        ORDER BY u.last_name, u.first_name
+    ''', (course_id,)).fetchall()
@@ -0,0 +1,132 @@
+"""
+File downloads without copying bytes through Python
+
+send_download() is the one place downloads are answered from, after the
+endpoint has looked the file up and decided the caller may have it. How the
+bytes then reach the client depends on app.config['DOWNLOAD_OFFLOAD']
+(environment variable VELOCITYVER_DOWNLOAD_OFFLOAD):
+
+- unset:        the server sends the file itself. Under gunicorn/uWSGI the
+                server's wsgi.file_wrapper already uses sendfile; under the
+                built-in development server SendfileMiddleware provides a
+                file wrapper that hands the file to os.sendfile() after the
+                headers are written. Range requests and TLS connections use
+                normal chunked reads.
+- 'x-accel':    nginx. The response carries X-Accel-Redirect pointing at
+                DOWNLOAD_ACCEL_PREFIX + the path below the upload folder;
+                configure that prefix as an `internal` location aliased to
+                the upload folder.
+- 'x-sendfile': Apache mod_xsendfile / lighttpd. The response carries
+                X-Sendfile with the absolute path.
+
+In the offload modes Python only authorizes and sets metadata; the proxy
+reads the file and handles Range requests.
+"""
+
+import os
+import ssl
+from urllib.parse import quote
+
+from werkzeug.wsgi import FileWrapper
+
+OFFLOAD_MODES = ('x-accel', 'x-sendfile')
+DEFAULT_ACCEL_PREFIX = '/protected-uploads'
+
+
+class SendfileWrapper:
+    """wsgi.file_wrapper that writes the file to the socket with os.sendfile()"""
+
+    zero_copy = True
+
+    def __init__(self, sock, file, buffer_size=8192):
+        self.sock = sock
+        self.file = file
+        self.buffer_size = buffer_size
+
+    def __iter__(self):
+        # An empty chunk makes the server send the status line and headers
+        yield b''
+        fd = self.file.fileno()
+        offset = self.file.tell()
+        remaining = os.fstat(fd).st_size - offset
+        while remaining > 0:
+            sent = os.sendfile(self.sock.fileno(), fd, offset, remaining)
+            if sent == 0:
+                break
+            offset += sent
+            remaining -= sent
+
+    def close(self):
+        self.file.close()
+
+
+class SendfileMiddleware:
+    """Offer SendfileWrapper as wsgi.file_wrapper when the server has none"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        sock = environ.get('werkzeug.socket')
+        if ('wsgi.file_wrapper' not in environ and sock is not None
+                and hasattr(os, 'sendfile')
+                and not isinstance(sock, ssl.SSLSocket)
+                and 'HTTP_RANGE' not in environ):
+            environ['wsgi.file_wrapper'] = lambda file, buffer_size=8192: SendfileWrapper(sock, file, buffer_size)
+        return self.wsgi_app(environ, start_response)
+
+
+def init_file_delivery(app):
+    app.config.setdefault('DOWNLOAD_OFFLOAD', os.environ.get('VELOCITYVER_DOWNLOAD_OFFLOAD') or None)
+    app.config.setdefault('DOWNLOAD_ACCEL_PREFIX',
+                          os.environ.get('VELOCITYVER_DOWNLOAD_ACCEL_PREFIX', DEFAULT_ACCEL_PREFIX))
+    if app.config['DOWNLOAD_OFFLOAD'] not in (None, *OFFLOAD_MODES):
+        raise ValueError(f"DOWNLOAD_OFFLOAD must be one of {OFFLOAD_MODES}, "
+                         f"not {app.config['DOWNLOAD_OFFLOAD']!r}")
+    app.wsgi_app = SendfileMiddleware(app.wsgi_app)
+
+
+def _offload_response(app, path, root, download_name, mimetype):
+    from flask import Response
+
+    mode = app.config['DOWNLOAD_OFFLOAD']
+    absolute = os.path.abspath(path)
+    response = Response(mimetype=mimetype)
+    if mode == 'x-accel':
+        relative = os.path.relpath(absolute, os.path.abspath(root))
+        if relative.startswith(os.pardir):
+            # Outside the location nginx knows about; send it ourselves
+            return None
+        prefix = app.config['DOWNLOAD_ACCEL_PREFIX'].rstrip('/')
+        response.headers['X-Accel-Redirect'] = f"{prefix}/{quote(relative.replace(os.sep, '/'))}"
+    else:
+        response.headers['X-Sendfile'] = absolute
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    # The body is empty; there is nothing to compress
+    response.zero_copy = True
+    return response
+
+
+def send_download(path, root, download_name=None, mimetype=None):
+    """Response delivering the file at path as an attachment
+
+    root is the upload folder the file lives under (used to build the
+    X-Accel-Redirect location). The caller must have checked that path
+    exists and that the requester may download it.
+    """
+    from flask import current_app, request, send_file
+
+    download_name = download_name or os.path.basename(path)
+    mimetype = mimetype or 'application/octet-stream'
+    if current_app.config.get('DOWNLOAD_OFFLOAD'):
+        response = _offload_response(current_app, path, root, download_name, mimetype)
+        if response is not None:
+            return response
+
+    response = send_file(os.path.abspath(path), mimetype=mimetype, as_attachment=True,
+                         download_name=download_name)
+    if request.environ.get('wsgi.file_wrapper') and not isinstance(response.response, FileWrapper):
+        # The server's own file wrapper sends with sendfile; compressing
+        # would read the file back through Python
+        response.zero_copy = True
+    return response
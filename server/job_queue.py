@@ -0,0 +1,322 @@
+"""
+Persistent background job queue stored in SQLite
+
+Request handlers enqueue slow work (imports, reindexing, fan-out, cleanup)
+and return right away; a small pool of worker threads runs it. Jobs survive
+restarts because they live in the `jobs` table (migration 7).
+
+    job_queue = JobQueue(get_db_connection, workers=2)
+
+    @job_queue.handler('user_import')
+    def run_user_import(job):
+        job.report_progress({'processed': 10})
+        return {'imported': 10}          # stored as the job result
+
+    job_id = job_queue.enqueue('user_import', {'path': ...}, priority=5)
+    job_queue.start()
+
+Higher priority runs first, then oldest first. A handler that raises is
+retried with exponential backoff (BACKOFF_BASE * 2 ** (attempt - 1) seconds,
+capped at BACKOFF_MAX) until max_attempts, then the job is marked failed.
+Raise PermanentJobError to fail a job without retrying.
+
+Several processes (e.g. gunicorn workers) can share one queue. A claimed job
+records its process in claimed_by and holds a lease until lease_expires_at;
+a heartbeat thread renews the leases of the process's running jobs every
+HEARTBEAT_INTERVAL seconds and requeues running jobs whose lease ran out,
+i.e. whose process died. enqueue(..., unique=True) skips the insert
+while a job of the same kind and payload is queued or running, so startup
+and recurring jobs are not queued once per process.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+STATUSES = (QUEUED, RUNNING, SUCCEEDED, FAILED)
+
+BACKOFF_BASE = 5
+BACKOFF_MAX = 600
+POLL_INTERVAL = 2.0
+LEASE_SECONDS = 60
+HEARTBEAT_INTERVAL = 20
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler to fail the job without further retries"""
+
+
+def backoff_delay(attempt):
+    return min(BACKOFF_BASE * 2 ** (attempt - 1), BACKOFF_MAX)
+
+
+class Job:
+    """The running job as seen by a handler"""
+
+    def __init__(self, queue, row):
+        self._queue = queue
+        self.id = row['id']
+        self.kind = row['kind']
+        self.payload = json.loads(row['payload'])
+        self.attempt = row['attempts']
+
+    def report_progress(self, progress):
+        self._queue._update(self.id, progress=json.dumps(progress))
+
+
+def job_to_dict(row):
+    """Job row as JSON-ready dict; payload values of password fields are masked"""
+    job = dict(row)
+    for key in ('payload', 'progress', 'result'):
+        if job.get(key) is not None:
+            job[key] = json.loads(job[key])
+    for key in job['payload']:
+        if 'password' in key and job['payload'][key]:
+            job['payload'][key] = '***'
+    return job
+
+
+class JobQueue:
+    def __init__(self, connect, workers=2, poll_interval=POLL_INTERVAL):
+        self.connect = connect
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.handlers = {}
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        # Set in start(), after any fork, so each process claims as itself
+        self.owner = None
+        self._current = threading.local()
+
+    def handler(self, kind):
+        """Decorator registering the function that runs jobs of this kind"""
+        def register(fn):
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    def _execute(self, sql, params=()):
+        conn = self.connect()
+        try:
+            cursor = conn.execute(sql, params)
+            rows = cursor.fetchall()
+            conn.commit()
+            return rows, cursor.rowcount
+        finally:
+            conn.close()
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = datetime.now().isoformat()
+        assignments = ', '.join(f'{column} = ?' for column in fields)
+        self._execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+    def enqueue(self, kind, payload=None, priority=0, max_attempts=3, delay=0, unique=False):
+        """Persist a job and wake a worker; returns the job id
+
+        With unique=True nothing is queued (and None is returned) while a job
+        of the same kind and payload is queued or running, other than the
+        job calling enqueue. The check and insert are one statement, so
+        processes starting together cannot both queue it.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        job_id = f"job_{uuid.uuid4().hex}"
+        now = datetime.now().isoformat()
+        encoded = json.dumps(payload or {})
+        values = (job_id, kind, encoded, priority, QUEUED, max_attempts, time.time() + delay, now, now)
+        if not unique:
+            self._execute('''
+                INSERT INTO jobs (id, kind, payload, priority, status, max_attempts, available_at,
+                                  created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', values)
+        else:
+            _, inserted = self._execute('''
+                INSERT INTO jobs (id, kind, payload, priority, status, max_attempts, available_at,
+                                  created_at, updated_at)
+                SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM jobs
+                    WHERE kind = ? AND payload = ? AND status IN (?, ?) AND id != ?
+                )
+            ''', (*values, kind, encoded, QUEUED, RUNNING, getattr(self._current, 'job_id', '')))
+            if not inserted:
+                return None
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        rows, _ = self._execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+        return job_to_dict(rows[0]) if rows else None
+
+    def list(self, status=None, kind=None, limit=100):
+        conditions = []
+        params = []
+        if status:
+            conditions.append('status = ?')
+            params.append(status)
+        if kind:
+            conditions.append('kind = ?')
+            params.append(kind)
+        query = 'SELECT * FROM jobs'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY created_at DESC LIMIT ?'
+        rows, _ = self._execute(query, (*params, limit))
+        return [job_to_dict(row) for row in rows]
+
+    def stats(self):
+        rows, _ = self._execute('SELECT kind, status, COUNT(*) AS count FROM jobs GROUP BY kind, status')
+        stats = {'by_status': dict.fromkeys(STATUSES, 0), 'by_kind': {},
+                 'workers': self.workers if self._threads else 0}
+        for row in rows:
+            stats['by_status'][row['status']] = stats['by_status'].get(row['status'], 0) + row['count']
+            stats['by_kind'].setdefault(row['kind'], {})[row['status']] = row['count']
+        return stats
+
+    def retry(self, job_id):
+        """Requeue a failed job immediately; returns False if it is not failed"""
+        _, updated = self._execute('''
+            UPDATE jobs SET status = ?, attempts = 0, available_at = ?, last_error = NULL,
+                            finished_at = NULL, updated_at = ?
+            WHERE id = ? AND status = ?
+        ''', (QUEUED, time.time(), datetime.now().isoformat(), job_id, FAILED))
+        if updated:
+            self._wakeup.set()
+        return bool(updated)
+
+    def purge(self, older_than_days=7):
+        """Delete finished jobs older than the given age; returns the number removed"""
+        cutoff = datetime.fromtimestamp(time.time() - older_than_days * 86400).isoformat()
+        _, removed = self._execute('''
+            DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?
+        ''', (SUCCEEDED, FAILED, cutoff))
+        return removed
+
+    def _claim(self):
+        """Atomically move the next runnable job to running, leased to this process"""
+        rows, _ = self._execute('''
+            UPDATE jobs SET status = ?, attempts = attempts + 1, claimed_by = ?, lease_expires_at = ?,
+                            started_at = ?, updated_at = ?
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE status = ? AND available_at <= ?
+                ORDER BY priority DESC, available_at
+                LIMIT 1
+            )
+            RETURNING *
+        ''', (RUNNING, self.owner, time.time() + LEASE_SECONDS, datetime.now().isoformat(),
+              datetime.now().isoformat(), QUEUED, time.time()))
+        return rows[0] if rows else None
+
+    def _finish(self, job_id, **fields):
+        """Record a job's outcome unless its lease was lost to another process"""
+        fields.update(lease_expires_at=None, updated_at=datetime.now().isoformat())
+        assignments = ', '.join(f'{column} = ?' for column in fields)
+        _, updated = self._execute(f'UPDATE jobs SET {assignments} WHERE id = ? AND claimed_by = ?',
+                                   (*fields.values(), job_id, self.owner))
+        if not updated:
+            print(f"⚠️  Job {job_id} lost its lease; its outcome was not recorded")
+
+    def _renew_leases(self):
+        self._execute('UPDATE jobs SET lease_expires_at = ? WHERE status = ? AND claimed_by = ?',
+                      (time.time() + LEASE_SECONDS, RUNNING, self.owner))
+
+    def requeue_expired(self):
+        """Requeue running jobs whose lease ran out; returns how many"""
+        _, requeued = self._execute('''
+            UPDATE jobs SET status = ?, claimed_by = NULL, lease_expires_at = NULL, updated_at = ?
+            WHERE status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)
+        ''', (QUEUED, datetime.now().isoformat(), RUNNING, time.time()))
+        if requeued:
+            print(f"🔁 Requeued {requeued} jobs whose worker stopped")
+            self._wakeup.set()
+        return requeued
+
+    def _heartbeat(self):
+        while not self._stopping.wait(HEARTBEAT_INTERVAL):
+            try:
+                self._renew_leases()
+                self.requeue_expired()
+            except Exception as e:
+                print(f"❌ Job queue heartbeat error: {e}")
+
+    def _run(self, row):
+        job = Job(self, row)
+        self._current.job_id = job.id
+        try:
+            result = self.handlers[job.kind](job)
+        except Exception as e:
+            retry = not isinstance(e, PermanentJobError) and row['attempts'] < row['max_attempts']
+            error = f"{type(e).__name__}: {e}"
+            if retry:
+                delay = backoff_delay(row['attempts'])
+                self._finish(job.id, status=QUEUED, claimed_by=None, last_error=error,
+                             available_at=time.time() + delay)
+                print(f"⚠️  Job {job.id} ({job.kind}) failed, retry {row['attempts']}/"
+                      f"{row['max_attempts'] - 1} in {delay}s: {error}")
+            else:
+                self._finish(job.id, status=FAILED, last_error=error,
+                             finished_at=datetime.now().isoformat())
+                print(f"❌ Job {job.id} ({job.kind}) failed: {error}")
+                if not isinstance(e, PermanentJobError):
+                    traceback.print_exc()
+            return
+        finally:
+            self._current.job_id = None
+
+        self._finish(job.id, status=SUCCEEDED, result=json.dumps(result),
+                     finished_at=datetime.now().isoformat())
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            try:
+                row = self._claim()
+            except Exception as e:
+                print(f"❌ Job queue error: {e}")
+                row = None
+            if row is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            if row['kind'] not in self.handlers:
+                self._finish(row['id'], status=FAILED, finished_at=datetime.now().isoformat(),
+                             last_error=f"No handler registered for job kind '{row['kind']}'")
+                continue
+            self._run(row)
+
+    def start(self):
+        """Requeue jobs left by processes that stopped and start the workers
+
+        Jobs still leased to a live process are left alone.
+        """
+        if self._threads:
+            return
+        self._stopping.clear()
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.requeue_expired()
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'job-worker-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        print(f"⚙️  Job queue started with {self.workers} workers")
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
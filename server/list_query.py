@@ -0,0 +1,137 @@
+"""
+Filtering, sorting, projection and paging for the list endpoints
+
+GET /api/users and GET /api/courses accept, on top of the sync parameters:
+
+    <column>=<value>[,<value>...]   filter on a whitelisted column
+    sort=<column>[,-<column>...]    order, '-' for descending
+    fields=<column>[,<column>...]   only return these columns (id is always included)
+    limit=<n>&offset=<n>            one page of rows (without them, every match)
+
+role=<role name> filters users by role name, e.g. ?role=student.
+
+Only whitelisted columns can be filtered, sorted or projected, so the query
+is built from known identifiers and every value is a bound parameter. The
+filter and sort columns are covered by the composite indexes of migration 17.
+Requests without any of these parameters keep the plain sync behaviour
+(every visible row, all columns) and other parameters are ignored, as they
+always were. Once a request uses them, an unknown parameter is rejected so
+a misspelled filter does not silently return every row.
+"""
+
+from sync_scope import USER_ADMIN_COLUMNS
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+LISTS = {
+    'users': {
+        'filters': ('role_id', 'faculty_id', 'department_id', 'level_id', 'year_id'),
+        # name=value filters on a column by a looked-up name: (column, table, name column)
+        'lookups': {'role': ('role_id', 'roles', 'name')},
+        'sort': ('last_name', 'first_name', 'username', 'role_id', 'created_at', 'updated_at'),
+        'default_sort': ('last_name', 'first_name'),
+        # Which of these the caller may see is decided by sync_scope
+        'fields': USER_ADMIN_COLUMNS + ('email',),
+    },
+    'courses': {
+        'filters': ('faculty_id', 'department_id', 'level_id', 'year_id', 'lecturer_id'),
+        'sort': ('name', 'code', 'level_id', 'created_at', 'updated_at'),
+        'default_sort': ('code',),
+        'fields': ('id', 'name', 'code', 'description', 'level_id', 'year_id', 'department_id',
+                   'faculty_id', 'lecturer_id', 'is_active', 'created_at', 'updated_at',
+                   'last_sync', 'change_seq'),
+    },
+}
+
+# Query parameters that are not column filters
+RESERVED_PARAMS = {'fields', 'sort', 'limit', 'offset', 'since', 'since_seq', 'user_id', 'format'}
+
+
+class ListQueryError(ValueError):
+    pass
+
+
+class ListQuery:
+    def __init__(self, fields, conditions, params, order_by, limit, offset):
+        self.fields = fields
+        self.conditions = conditions
+        self.params = params
+        self.order_by = order_by
+        self.limit = limit
+        self.offset = offset
+
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def _int_param(args, name, default):
+    value = args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ListQueryError(f'{name} must be an integer')
+    if number < 0:
+        raise ListQueryError(f'{name} must not be negative')
+    return number
+
+
+def parse(table, args):
+    """ListQuery for the request args of a list endpoint, or None if the
+    request uses none of the list parameters
+
+    Raises ListQueryError for unknown parameters, columns and malformed values.
+    """
+    spec = LISTS[table]
+    lookups = spec.get('lookups', {})
+    filter_names = [name for name in args if name in spec['filters'] or name in lookups]
+    if not filter_names and not any(name in args for name in ('fields', 'sort', 'limit', 'offset')):
+        return None
+    unknown = [name for name in args if name not in RESERVED_PARAMS and name not in filter_names]
+    if unknown:
+        raise ListQueryError(f"Cannot filter {table} by: {', '.join(sorted(unknown))}")
+
+    conditions = []
+    params = []
+    for name in filter_names:
+        values = _split(args.get(name, ''))
+        if not values:
+            continue
+        placeholders = ', '.join('?' for _ in values)
+        if name in lookups:
+            column, lookup_table, name_column = lookups[name]
+            conditions.append(f'{column} IN (SELECT id FROM {lookup_table} '
+                              f'WHERE LOWER({name_column}) IN ({placeholders}))')
+            values = [value.lower() for value in values]
+        elif len(values) == 1:
+            conditions.append(f'{name} = ?')
+        else:
+            conditions.append(f'{name} IN ({placeholders})')
+        params += values
+
+    order = []
+    for item in _split(args.get('sort', '')) or spec['default_sort']:
+        column = item.lstrip('-')
+        if column not in spec['sort']:
+            raise ListQueryError(f"Cannot sort {table} by: {column}")
+        order.append(f"{column} DESC" if item.startswith('-') else column)
+    # id breaks ties so pages do not overlap or skip rows
+    order.append('id')
+
+    fields = None
+    if 'fields' in args:
+        fields = _split(args['fields'])
+        unknown = [field for field in fields if field not in spec['fields']]
+        if unknown:
+            raise ListQueryError(f"Unknown {table} fields: {', '.join(unknown)}")
+        if 'id' not in fields:
+            fields.insert(0, 'id')
+
+    limit = offset = None
+    if 'limit' in args or 'offset' in args:
+        limit = max(1, min(_int_param(args, 'limit', DEFAULT_LIMIT), MAX_LIMIT))
+        offset = _int_param(args, 'offset', 0)
+    return ListQuery(fields, conditions, params, ', '.join(order), limit, offset)
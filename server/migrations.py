@@ -0,0 +1,1083 @@
+#!/usr/bin/env python3
+"""
+Numbered schema migrations for VelocityVer databases
+
+This module is the single source of truth for the SQLite schema. It is used
+by the Flask server (app.py) on startup and by create_database.py when it
+builds the bundled assets/velocityver.db.
+
+Only migrations marked client=True are applied to the app's bundled
+database (migrate(conn, client=True)): the base tables and columns the app
+reads and writes, using SQL that the SQLite of older Android releases
+supports. Server-only migrations (server tables, full-text indexes, and
+triggers that write into sync_metadata, the app's own upload queue) are
+skipped. A database built with client=True records only the client
+migrations and must not be migrated as a server database later. New
+migrations are server-only unless marked otherwise.
+
+Each migration is a list of steps applied in order:
+  - Statement:  plain DDL, written to be idempotent (IF NOT EXISTS)
+  - AddColumn:  ALTER TABLE ... ADD COLUMN, skipped if the column exists
+  - CreateIndex: CREATE [UNIQUE] INDEX IF NOT EXISTS
+  - Backfill:   an online data migration that updates rows in small batches,
+                committing after each batch so large tables are never locked
+                for long
+  - ChangeLogBackfill: records existing rows of a synced table in the change
+                log, also in committed batches
+
+Usage:
+    python migrations.py --db velocityver.db            # apply pending migrations
+    python migrations.py --db velocityver.db --dry-run  # report estimated cost only
+    python migrations.py --db app.db --client           # client migrations only
+"""
+
+import argparse
+import sqlite3
+import time
+from datetime import datetime
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def _table_exists(conn, table):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (table,)
+    ).fetchone() is not None
+
+
+def _column_exists(conn, table, column):
+    return any(row[1] == column for row in conn.execute(f'PRAGMA table_info({table})'))
+
+
+def _count_rows(conn, table, where=None):
+    """Row count used for cost estimates; 0 if the table does not exist yet"""
+    if not _table_exists(conn, table):
+        return 0
+    try:
+        return conn.execute(f'SELECT COUNT(*) FROM {table} WHERE {where or 1}').fetchone()[0]
+    except sqlite3.OperationalError:
+        # The WHERE clause references a column an earlier step will add
+        return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+class Statement:
+    """Idempotent DDL executed as-is"""
+
+    def __init__(self, sql):
+        self.sql = sql.strip()
+
+    def describe(self):
+        return ' '.join(self.sql.split())[:70]
+
+    def estimate(self, conn):
+        return {'step': self.describe(), 'kind': 'ddl', 'rows': 0}
+
+    def apply(self, conn, batch_size):
+        conn.execute(self.sql)
+
+
+class AddColumn:
+    """ALTER TABLE ... ADD COLUMN that is skipped when the column already exists"""
+
+    def __init__(self, table, column, definition):
+        self.table = table
+        self.column = column
+        self.definition = definition
+
+    def describe(self):
+        return f'add column {self.table}.{self.column} {self.definition}'
+
+    def estimate(self, conn):
+        # ADD COLUMN only rewrites the table definition, not the rows
+        return {'step': self.describe(), 'kind': 'ddl', 'rows': 0}
+
+    def apply(self, conn, batch_size):
+        if not _column_exists(conn, self.table, self.column):
+            conn.execute(f'ALTER TABLE {self.table} ADD COLUMN {self.column} {self.definition}')
+
+
+class CreateIndex:
+    """CREATE [UNIQUE] INDEX IF NOT EXISTS; cost is one scan of the table"""
+
+    def __init__(self, name, table, columns, unique=False):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.unique = unique
+
+    def describe(self):
+        return f"create {'unique ' if self.unique else ''}index {self.name} on {self.table}({self.columns})"
+
+    def estimate(self, conn):
+        return {'step': self.describe(), 'kind': 'index', 'rows': _count_rows(conn, self.table)}
+
+    def apply(self, conn, batch_size):
+        unique = 'UNIQUE ' if self.unique else ''
+        conn.execute(f'CREATE {unique}INDEX IF NOT EXISTS {self.name} ON {self.table} ({self.columns})')
+
+
+class Backfill:
+    """Online data migration: UPDATE table SET ... WHERE ... in committed batches
+
+    The WHERE clause must stop matching rows once they are updated, so an
+    interrupted backfill simply resumes where it left off on the next run.
+    """
+
+    def __init__(self, table, assignments, where, batch_size=None):
+        self.table = table
+        self.assignments = assignments
+        self.where = where
+        self.batch_size = batch_size
+
+    def describe(self):
+        return f'backfill {self.table} SET {self.assignments} WHERE {self.where}'
+
+    def estimate(self, conn):
+        return {'step': self.describe(), 'kind': 'backfill', 'rows': _count_rows(conn, self.table, self.where)}
+
+    def apply(self, conn, batch_size):
+        batch_size = self.batch_size or batch_size
+        while True:
+            conn.execute('BEGIN IMMEDIATE')
+            cursor = conn.execute(f'''
+                UPDATE {self.table} SET {self.assignments}
+                WHERE rowid IN (SELECT rowid FROM {self.table} WHERE {self.where} LIMIT ?)
+            ''', (batch_size,))
+            conn.execute('COMMIT')
+            if cursor.rowcount < batch_size:
+                break
+
+
+class ChangeLogBackfill:
+    """Record every existing row of a synced table in the change log, in batches
+
+    Rows get consecutive sequence numbers after the current sync_sequence
+    value. Rows already logged (by the triggers) are left alone.
+    """
+
+    def __init__(self, table, batch_size=None):
+        self.table = table
+        self.batch_size = batch_size
+
+    def describe(self):
+        return f'log existing {self.table} rows in sync_metadata'
+
+    def estimate(self, conn):
+        return {'step': self.describe(), 'kind': 'backfill', 'rows': _count_rows(conn, self.table)}
+
+    def apply(self, conn, batch_size):
+        batch_size = self.batch_size or batch_size
+        last_rowid = 0
+        while True:
+            conn.execute('BEGIN IMMEDIATE')
+            high = conn.execute(f'''
+                SELECT MAX(rowid) FROM (
+                    SELECT rowid FROM {self.table} WHERE rowid > ? ORDER BY rowid LIMIT ?
+                )
+            ''', (last_rowid, batch_size)).fetchone()[0]
+            if high is None:
+                conn.execute('COMMIT')
+                break
+            conn.execute(f'''
+                INSERT OR IGNORE INTO sync_metadata (id, table_name, record_id, action, seq, created_at, updated_at)
+                SELECT '{self.table}:' || id, '{self.table}', id, {_logged_action(self.table, 'insert', '')},
+                       (SELECT value FROM sync_sequence WHERE id = 1) + ROW_NUMBER() OVER (ORDER BY rowid),
+                       {_NOW}, {_NOW}
+                FROM {self.table} WHERE rowid > ? AND rowid <= ?
+            ''', (last_rowid, high))
+            conn.execute('''
+                UPDATE sync_sequence
+                SET value = MAX(value, (SELECT COALESCE(MAX(seq), 0) FROM sync_metadata))
+                WHERE id = 1
+            ''')
+            conn.execute('COMMIT')
+            last_rowid = high
+
+
+# Tables the Flutter client syncs. Every insert, update and delete on them is
+# recorded in sync_metadata with a monotonic sequence number from
+# sync_sequence, one row per record (the latest change wins), so clients can
+# sync by sequence and learn about deletes.
+SYNCED_TABLES = ('roles', 'faculties', 'departments', 'levels', 'years',
+                 'users', 'courses', 'files', 'announcements', 'user_courses')
+
+# Synced tables with an is_active flag; deactivating a row is a delete for clients
+SOFT_DELETE_TABLES = {'roles', 'faculties', 'departments', 'levels', 'years',
+                      'users', 'courses', 'announcements'}
+
+_NOW = "strftime('%Y-%m-%dT%H:%M:%f', 'now')"
+
+
+def _logged_action(table, action, ref='NEW.'):
+    if table in SOFT_DELETE_TABLES:
+        return f"CASE WHEN {ref}is_active = 0 THEN 'delete' ELSE '{action}' END"
+    return f"'{action}'"
+
+
+def change_log_triggers(table, stamp_rows=False):
+    """DROP/CREATE statements for the change-log triggers of one table
+
+    With stamp_rows, inserted and updated rows also get the sequence number
+    in their own change_seq column. The UPDATE trigger skips updates that
+    only set change_seq, which is how rows are stamped and backfilled.
+    """
+    steps = []
+    for event, ref, action in (('INSERT', 'NEW', _logged_action(table, 'insert')),
+                               ('UPDATE', 'NEW', _logged_action(table, 'update')),
+                               ('DELETE', 'OLD', "'delete'")):
+        name = f'trg_{table}_log_{event.lower()}'
+        when = ''
+        stamp = ''
+        if stamp_rows and event != 'DELETE':
+            stamp = f'''
+                UPDATE {table} SET change_seq = (SELECT value FROM sync_sequence WHERE id = 1)
+                WHERE rowid = NEW.rowid;'''
+            if event == 'UPDATE':
+                when = 'WHEN NEW.change_seq IS OLD.change_seq'
+        steps.append(Statement(f'DROP TRIGGER IF EXISTS {name}'))
+        steps.append(Statement(f'''
+            CREATE TRIGGER {name} AFTER {event} ON {table} {when}
+            BEGIN
+                UPDATE sync_sequence SET value = value + 1 WHERE id = 1;
+                INSERT OR REPLACE INTO sync_metadata (id, table_name, record_id, action, seq, created_at, updated_at)
+                SELECT '{table}:' || {ref}.id, '{table}', {ref}.id, {action}, value, {_NOW}, {_NOW}
+                FROM sync_sequence WHERE id = 1;{stamp}
+            END
+        '''))
+    return steps
+
+
+def fts_sync_triggers(table, columns):
+    """DROP/CREATE statements keeping the external-content table <table>_fts in
+    step with <table>; updates only reindex when an indexed column changes"""
+    fts = f'{table}_fts'
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'NEW.{column}' for column in columns)
+    old_values = ', '.join(f'OLD.{column}' for column in columns)
+    delete = (f"INSERT INTO {fts} ({fts}, rowid, {column_list}) "
+              f"VALUES ('delete', OLD.rowid, {old_values});")
+    insert = f"INSERT INTO {fts} (rowid, {column_list}) VALUES (NEW.rowid, {new_values});"
+    steps = []
+    for event, body in (('INSERT', insert),
+                        (f'UPDATE OF {column_list}', delete + insert),
+                        ('DELETE', delete)):
+        name = f"trg_{table}_fts_{event.split()[0].lower()}"
+        steps.append(Statement(f'DROP TRIGGER IF EXISTS {name}'))
+        steps.append(Statement(f'''
+            CREATE TRIGGER {name} AFTER {event} ON {table}
+            BEGIN
+                {body}
+            END
+        '''))
+    return steps
+
+
+# Entities searched through FTS5 indexes that are kept in sync by triggers
+SEARCHABLE_COLUMNS = {
+    'announcements': ('title', 'content'),
+    'courses': ('name', 'code', 'description'),
+    'users': ('username', 'first_name', 'last_name', 'email'),
+}
+
+
+def _split_list(expression):
+    """json_each() over the items of a comma-separated list column
+
+    The list is turned into a JSON array literal (backslashes and quotes
+    escaped), since WITH clauses are not allowed inside triggers.
+    """
+    escaped = f"""replace(replace(COALESCE({expression}, ''), '\\', '\\\\'), '"', '\\"')"""
+    return f"""json_each('["' || replace({escaped}, ',', '","') || '"]')"""
+
+
+def announcement_course_triggers():
+    """DROP/CREATE statements keeping announcement_courses in step with
+    announcements.target_courses"""
+    insert = (f"INSERT OR IGNORE INTO announcement_courses (course_id, announcement_id) "
+              f"SELECT TRIM(value), NEW.id FROM {_split_list('NEW.target_courses')} "
+              f"WHERE TRIM(value) != '';")
+    delete = "DELETE FROM announcement_courses WHERE announcement_id = OLD.id;"
+    steps = []
+    for event, body in (('INSERT', insert),
+                        ('UPDATE OF target_courses', delete + insert),
+                        ('DELETE', delete)):
+        name = f"trg_announcement_courses_{event.split()[0].lower()}"
+        steps.append(Statement(f'DROP TRIGGER IF EXISTS {name}'))
+        steps.append(Statement(f'''
+            CREATE TRIGGER {name} AFTER {event} ON announcements
+            BEGIN
+                {body}
+            END
+        '''))
+    return steps
+
+
+def _restamp(table, condition):
+    """Trigger statements giving the rows of table matching condition new,
+    distinct change sequence numbers, so delta sync sends them again
+
+    Used when a row's visibility changes without the row itself changing.
+    """
+    return f'''
+                UPDATE sync_metadata
+                SET seq = (SELECT value FROM sync_sequence WHERE id = 1) + r.n, updated_at = {_NOW}
+                FROM (SELECT '{table}:' || id AS key, ROW_NUMBER() OVER (ORDER BY id) AS n
+                      FROM {table} WHERE {condition}) AS r
+                WHERE sync_metadata.id = r.key;
+                UPDATE {table}
+                SET change_seq = COALESCE((SELECT seq FROM sync_metadata
+                                           WHERE id = '{table}:' || {table}.id), change_seq)
+                WHERE {condition};
+                UPDATE sync_sequence
+                SET value = value + (SELECT COUNT(*) FROM {table} WHERE {condition})
+                WHERE id = 1;'''
+
+
+def scope_change_triggers():
+    """DROP/CREATE statements re-stamping the rows whose visibility (see
+    sync_scope.py) changes with an enrollment or a course's lecturer"""
+    def course_rows(course, users):
+        return ''.join((
+            _restamp('files', f'course_id = {course}'),
+            _restamp('announcements', f'id IN (SELECT announcement_id FROM announcement_courses '
+                                      f'WHERE course_id = {course})'),
+            _restamp('users', f'id IN ({users})'),
+        ))
+
+    steps = []
+    for event, ref in (('INSERT', 'NEW'), ('DELETE', 'OLD')):
+        name = f'trg_user_courses_scope_{event.lower()}'
+        # The student gains or loses the course, its files, announcements and
+        # lecturer; the lecturer gains or loses the student
+        body = _restamp('courses', f'id = {ref}.course_id') + course_rows(
+            f'{ref}.course_id',
+            f'SELECT {ref}.user_id UNION SELECT lecturer_id FROM courses WHERE id = {ref}.course_id')
+        steps.append(Statement(f'DROP TRIGGER IF EXISTS {name}'))
+        steps.append(Statement(f'''
+            CREATE TRIGGER {name} AFTER {event} ON user_courses
+            BEGIN{body}
+            END
+        '''))
+
+    # The old and new lecturer swap the course's files, announcements,
+    # enrollments and students; its students swap lecturers
+    body = _restamp('user_courses', 'course_id = NEW.id') + course_rows(
+        'NEW.id',
+        'SELECT user_id FROM user_courses WHERE course_id = NEW.id '
+        'UNION SELECT OLD.lecturer_id UNION SELECT NEW.lecturer_id')
+    steps.append(Statement('DROP TRIGGER IF EXISTS trg_courses_scope_lecturer'))
+    steps.append(Statement(f'''
+        CREATE TRIGGER trg_courses_scope_lecturer AFTER UPDATE OF lecturer_id ON courses
+        WHEN NEW.lecturer_id IS NOT OLD.lecturer_id
+        BEGIN{body}
+        END
+    '''))
+    return steps
+
+
+class Migration:
+    def __init__(self, version, description, steps, client=False):
+        self.version = version
+        self.description = description
+        self.steps = steps
+        self.client = client
+
+
+MIGRATIONS = [
+    Migration(1, 'baseline schema', [
+        Statement('''
+            CREATE TABLE IF NOT EXISTS roles (
+                id TEXT PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL,
+                description TEXT,
+                permissions TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                last_sync TEXT
+            )
+        '''),
+        Statement('''
+            CREATE TABLE IF NOT EXISTS faculties (
+                id TEXT PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL,
+                description TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                last_sync TEXT
+            )
+        '''),
+        Statement('''
+            CREATE TABLE IF NOT EXISTS departments (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                faculty_id TEXT NOT NULL,
+                description TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                last_sync TEXT,
+                FOREIGN KEY (faculty_id) REFERENCES faculties (id)
+            )
+        '''),
+        Statement('''
+            CREATE TABLE IF NOT EXISTS levels (
+                id TEXT PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL,
+                description TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                last_sync TEXT
+            )
+        '''),
+        Statement('''
+            CREATE TABLE IF NOT EXISTS years (
+                id TEXT PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL,
+                description TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                last_sync TEXT
+            )
+        '''),
+        Statement('''
+            CREATE TABLE IF NOT EXISTS enrollments (
+                id TEXT PRIMARY KEY,
+                student_id TEXT NOT NULL,
+                course_id TEXT NOT NULL,
+                enrolled_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (student_id) REFERENCES users(id),
+                FOREIGN KEY (course_id) REFERENCES courses(id)
+            )
+        '''),
+        Statement('''
+            CREATE TABLE IF NOT EXISTS users (
+                id TEXT PRIMARY KEY,
+                username TEXT UNIQUE NOT NULL,
+                email TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                role_id TEXT NOT NULL,
+                first_name TEXT NOT NULL,
+                last_name TEXT NOT NULL,
+                level_id TEXT,
+                year_id TEXT,
+                department_id TEXT,
+                faculty_id TEXT,
+                profile_picture TEXT,
+                is_active INTEGER DEFAULT 1,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                last_sync TEXT,
+                FOREIGN KEY (role_id) REFERENCES roles (id)
+            )
+        '''),
+        # Databases created before profile pictures existed
+        AddColumn('users', 'profile_picture', 'TEXT'),
+        Statement('''
+            CREATE TABLE IF NOT EXISTS courses (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                code TEXT UNIQUE NOT NULL,
+                description TEXT,
+                level_id TEXT NOT NULL,
+                year_id TEXT NOT NULL,
+                department_id TEXT NOT NULL,
+                faculty_id TEXT NOT NULL,
+                lecturer_id TEXT,
+                is_active INTEGER DEFAULT 1,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                last_sync TEXT,
+                FOREIGN KEY (lecturer_id) REFERENCES users (id)
+            )
+        '''),
+        Statement('''
+            CREATE TABLE IF NOT EXISTS files (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                original_name TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                file_size INTEGER NOT NULL,
+                mime_type TEXT NOT NULL,
+                course_id TEXT NOT NULL,
+                uploaded_by TEXT NOT NULL,
+                description TEXT,
+                is_synced INTEGER DEFAULT 1,
+                local_path TEXT,
+                server_path TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                last_sync TEXT,
+                FOREIGN KEY (course_id) REFERENCES courses (id),
+                FOREIGN KEY (uploaded_by) REFERENCES users (id)
+            )
+        '''),
+        Statement('''
+            CREATE TABLE IF NOT EXISTS announcements (
+                id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                content TEXT NOT NULL,
+                author_id TEXT NOT NULL,
+                target_roles TEXT,
+                target_courses TEXT,
+                is_active INTEGER DEFAULT 1,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                last_sync TEXT,
+                FOREIGN KEY (author_id) REFERENCES users (id)
+            )
+        '''),
+        # Chat system for admin-lecturer communication
+        Statement('''
+            CREATE TABLE IF NOT EXISTS messages (
+                id TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                sender_id TEXT NOT NULL,
+                receiver_id TEXT,
+                chat_room_id TEXT,
+                message_type TEXT DEFAULT 'text',
+                file_id TEXT,
+                file_name TEXT,
+                file_url TEXT,
+                is_read INTEGER DEFAULT 0,
+                is_delivered INTEGER DEFAULT 0,
+                read_at TEXT,
+                delivered_at TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                last_sync TEXT,
+                FOREIGN KEY (sender_id) REFERENCES users (id),
+                FOREIGN KEY (receiver_id) REFERENCES users (id),
+                FOREIGN KEY (chat_room_id) REFERENCES chat_rooms (id)
+            )
+        '''),
+        Statement('''
+            CREATE TABLE IF NOT EXISTS chat_rooms (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                created_by TEXT NOT NULL, -- user_id of creator (admin or lecturer)
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        '''),
+        Statement('''
+            CREATE TABLE IF NOT EXISTS chat_participants (
+                id TEXT PRIMARY KEY,
+                room_id TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                joined_at TEXT NOT NULL,
+                FOREIGN KEY (room_id) REFERENCES chat_rooms(id),
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        '''),
+        Statement('''
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id TEXT PRIMARY KEY,
+                room_id TEXT NOT NULL,
+                sender_id TEXT NOT NULL,
+                message TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                FOREIGN KEY (room_id) REFERENCES chat_rooms(id),
+                FOREIGN KEY (sender_id) REFERENCES users(id)
+            )
+        '''),
+        # Student enrollment requests from lecturers to admins
+        Statement('''
+            CREATE TABLE IF NOT EXISTS enrollment_requests (
+                id TEXT PRIMARY KEY,
+                lecturer_id TEXT NOT NULL,
+                course_id TEXT NOT NULL,
+                student_ids TEXT NOT NULL,
+                request_type TEXT NOT NULL,
+                reason TEXT,
+                status TEXT DEFAULT 'pending',
+                admin_response TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                FOREIGN KEY (lecturer_id) REFERENCES users (id),
+                FOREIGN KEY (course_id) REFERENCES courses (id)
+            )
+        '''),
+        Statement('''
+            CREATE TABLE IF NOT EXISTS user_courses (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                course_id TEXT NOT NULL,
+                enrolled_at TEXT NOT NULL,
+                last_sync TEXT,
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                FOREIGN KEY (course_id) REFERENCES courses (id),
+                UNIQUE(user_id, course_id)
+            )
+        '''),
+        Statement('''
+            CREATE TABLE IF NOT EXISTS sync_metadata (
+                id TEXT PRIMARY KEY,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                last_sync TEXT,
+                table_name TEXT NOT NULL,
+                record_id TEXT NOT NULL,
+                action TEXT NOT NULL,
+                data TEXT,
+                synced_at TEXT,
+                is_synced INTEGER DEFAULT 0
+            )
+        '''),
+    ], client=True),
+
+    # Columns the bundled asset database (create_database.py) had and the
+    # server schema did not. UNIQUE cannot be added with ALTER TABLE, so codes
+    # get a unique index instead; NULL codes do not collide.
+    Migration(2, 'reconcile reference-data columns with the asset database', [
+        AddColumn('roles', 'is_active', 'INTEGER DEFAULT 1'),
+        AddColumn('faculties', 'code', 'TEXT'),
+        AddColumn('faculties', 'dean_id', 'TEXT'),
+        AddColumn('faculties', 'is_active', 'INTEGER DEFAULT 1'),
+        AddColumn('departments', 'code', 'TEXT'),
+        AddColumn('departments', 'hod_id', 'TEXT'),
+        AddColumn('departments', 'is_active', 'INTEGER DEFAULT 1'),
+        AddColumn('levels', 'code', 'TEXT'),
+        AddColumn('levels', 'order_index', 'INTEGER'),
+        AddColumn('levels', 'is_active', 'INTEGER DEFAULT 1'),
+        AddColumn('years', 'code', 'TEXT'),
+        AddColumn('years', 'order_index', 'INTEGER'),
+        AddColumn('years', 'is_active', 'INTEGER DEFAULT 1'),
+        AddColumn('files', 'target_roles', 'TEXT'),
+        AddColumn('files', 'is_public', 'INTEGER DEFAULT 0'),
+        AddColumn('files', 'download_count', 'INTEGER DEFAULT 0'),
+        Backfill('faculties', "code = UPPER(SUBSTR(id, 5))", "code IS NULL"),
+        Backfill('departments', "code = UPPER(SUBSTR(id, 6))", "code IS NULL"),
+        Backfill('levels', "code = UPPER(SUBSTR(id, 7)), order_index = COALESCE(order_index, rowid)", "code IS NULL"),
+        Backfill('years', "code = UPPER(SUBSTR(id, 6)), order_index = COALESCE(order_index, rowid)", "code IS NULL"),
+        CreateIndex('idx_faculties_code', 'faculties', 'code', unique=True),
+        CreateIndex('idx_departments_code', 'departments', 'code', unique=True),
+        CreateIndex('idx_levels_code', 'levels', 'code', unique=True),
+        CreateIndex('idx_years_code', 'years', 'code', unique=True),
+    ], client=True),
+    # Change log for delta sync: sync_metadata becomes a per-record index of
+    # the latest change, fed by triggers, including tombstones for deletes.
+    Migration(3, 'change log with tombstones in sync_metadata', [
+        Statement('''
+            CREATE TABLE IF NOT EXISTS sync_sequence (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                value INTEGER NOT NULL,
+                pruned_through INTEGER NOT NULL DEFAULT 0
+            )
+        '''),
+        Statement('INSERT OR IGNORE INTO sync_sequence (id, value, pruned_through) VALUES (1, 0, 0)'),
+        AddColumn('sync_metadata', 'seq', 'INTEGER'),
+        CreateIndex('idx_sync_metadata_seq', 'sync_metadata', 'seq', unique=True),
+        *[step for table in SYNCED_TABLES for step in change_log_triggers(table)],
+        *[ChangeLogBackfill(table) for table in SYNCED_TABLES],
+    ]),
+    # Every synced row carries the global sequence number of its last write,
+    # so the since endpoints can page by an exact, indexed cursor instead of
+    # comparing local-time ISO strings.
+    Migration(4, 'change_seq cursor column on synced tables', [
+        *[AddColumn(table, 'change_seq', 'INTEGER') for table in SYNCED_TABLES],
+        *[step for table in SYNCED_TABLES for step in change_log_triggers(table, stamp_rows=True)],
+        *[Backfill(table,
+                   f"change_seq = COALESCE((SELECT seq FROM sync_metadata WHERE id = '{table}:' || {table}.id), 0)",
+                   "change_seq IS NULL")
+          for table in SYNCED_TABLES],
+        *[CreateIndex(f'idx_{table}_change_seq', table, 'change_seq') for table in SYNCED_TABLES],
+    ]),
+    # Enrollments lived in two tables (`enrollments` for the /api/student
+    # endpoints, user_courses for everything else). Merge the legacy rows into
+    # user_courses, keeping the earliest enrollment per (student, course) and
+    # renaming ids that collide, then replace `enrollments` with a read-only
+    # view so older readers still see the same columns.
+    Migration(5, 'merge enrollments into user_courses', [
+        Statement('''
+            DELETE FROM user_courses
+            WHERE rowid NOT IN (SELECT MIN(rowid) FROM user_courses GROUP BY user_id, course_id)
+        '''),
+        Statement(f'''
+            INSERT INTO user_courses (id, user_id, course_id, enrolled_at, last_sync)
+            SELECT CASE WHEN EXISTS (SELECT 1 FROM user_courses WHERE id = e.id)
+                        THEN 'enrollments_' || e.id ELSE e.id END,
+                   e.student_id, e.course_id,
+                   COALESCE(strftime('%Y-%m-%dT%H:%M:%f', e.enrolled_at), {_NOW}), {_NOW}
+            FROM enrollments e
+            WHERE e.rowid IN (SELECT MIN(rowid) FROM enrollments GROUP BY student_id, course_id)
+              AND NOT EXISTS (SELECT 1 FROM user_courses uc
+                              WHERE uc.user_id = e.student_id AND uc.course_id = e.course_id)
+        '''),
+        Statement('DROP TABLE IF EXISTS enrollments'),
+        Statement('''
+            CREATE VIEW IF NOT EXISTS enrollments AS
+            SELECT id, user_id AS student_id, course_id, enrolled_at FROM user_courses
+        '''),
+        CreateIndex('idx_user_courses_user_course', 'user_courses', 'user_id, course_id', unique=True),
+        CreateIndex('idx_user_courses_course_user', 'user_courses', 'course_id, user_id'),
+    ]),
+    # user_import.py checks for taken usernames and emails case-insensitively
+    Migration(6, 'case-insensitive username and email lookups', [
+        CreateIndex('idx_users_username_lower', 'users', 'LOWER(username)'),
+        CreateIndex('idx_users_email_lower', 'users', 'LOWER(email)'),
+    ]),
+    # Persistent background job queue (see job_queue.py). available_at and
+    # lease_expires_at are Unix timestamps so retry backoff and leases can be
+    # compared without parsing dates.
+    Migration(7, 'background job queue', [
+        Statement('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL DEFAULT '{}',
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3,
+                available_at REAL NOT NULL,
+                progress TEXT,
+                result TEXT,
+                last_error TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                claimed_by TEXT,
+                lease_expires_at REAL
+            )
+        '''),
+        CreateIndex('idx_jobs_dequeue', 'jobs', 'status, priority DESC, available_at'),
+        CreateIndex('idx_jobs_kind', 'jobs', 'kind, created_at'),
+    ]),
+    # Full-text index over the extracted text of uploaded files (see
+    # search_index.py). file_search_docs tracks extraction per file and owns
+    # the FTS rowid, so re-indexing a file replaces its document in place.
+    Migration(8, 'full-text index over uploaded file contents', [
+        Statement('''
+            CREATE TABLE IF NOT EXISTS file_search_docs (
+                doc_id INTEGER PRIMARY KEY,
+                file_id TEXT UNIQUE NOT NULL,
+                course_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                extractor TEXT,
+                char_count INTEGER DEFAULT 0,
+                error TEXT,
+                indexed_at TEXT NOT NULL
+            )
+        '''),
+        CreateIndex('idx_file_search_docs_course', 'file_search_docs', 'course_id'),
+        Statement('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+                name, description, content,
+                tokenize = 'porter unicode61 remove_diacritics 2'
+            )
+        '''),
+        Statement('DROP TRIGGER IF EXISTS trg_files_search_delete'),
+        Statement('''
+            CREATE TRIGGER trg_files_search_delete AFTER DELETE ON files
+            BEGIN
+                DELETE FROM files_fts
+                WHERE rowid = (SELECT doc_id FROM file_search_docs WHERE file_id = OLD.id);
+                DELETE FROM file_search_docs WHERE file_id = OLD.id;
+            END
+        '''),
+    ]),
+    # External-content FTS5 indexes (no second copy of the text) over the
+    # other searchable entities, with 2- and 3-character prefix indexes for
+    # search-as-you-type. files_fts keeps its layout: prefix queries work on
+    # it without a prefix index and rebuilding it would re-extract every file.
+    Migration(9, 'full-text indexes over announcements, courses and users', [
+        *[step for table, columns in SEARCHABLE_COLUMNS.items() for step in (
+            Statement(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+                    {', '.join(columns)},
+                    content = '{table}', content_rowid = 'rowid',
+                    tokenize = 'porter unicode61 remove_diacritics 2', prefix = '2 3'
+                )
+            '''),
+            *fts_sync_triggers(table, columns),
+            Statement(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')"),
+        )],
+    ]),
+    # Download history plus per-file and per-course counters, written in
+    # batches by download_events.py. The counters are maintained on flush so
+    # popularity stats never have to scan the history.
+    Migration(10, 'download events and counters', [
+        Statement('''
+            CREATE TABLE IF NOT EXISTS downloads (
+                id INTEGER PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                user_id TEXT,
+                course_id TEXT,
+                bytes INTEGER,
+                downloaded_at TEXT NOT NULL
+            )
+        '''),
+        CreateIndex('idx_downloads_user', 'downloads', 'user_id, downloaded_at'),
+        CreateIndex('idx_downloads_file_user', 'downloads', 'file_id, user_id'),
+        # /uploads/<course_id>/<name> looks the file up to count the download
+        CreateIndex('idx_files_course_name', 'files', 'course_id, name'),
+        Statement('''
+            CREATE TABLE IF NOT EXISTS file_download_stats (
+                file_id TEXT PRIMARY KEY,
+                course_id TEXT,
+                download_count INTEGER NOT NULL DEFAULT 0,
+                unique_downloaders INTEGER NOT NULL DEFAULT 0,
+                last_downloaded_at TEXT
+            )
+        '''),
+        CreateIndex('idx_file_download_stats_course', 'file_download_stats', 'course_id, download_count DESC'),
+        Statement('''
+            CREATE TABLE IF NOT EXISTS course_download_stats (
+                course_id TEXT PRIMARY KEY,
+                download_count INTEGER NOT NULL DEFAULT 0,
+                last_downloaded_at TEXT
+            )
+        '''),
+        Statement('DROP TRIGGER IF EXISTS trg_files_download_stats_delete'),
+        Statement('''
+            CREATE TRIGGER trg_files_download_stats_delete AFTER DELETE ON files
+            BEGIN
+                DELETE FROM file_download_stats WHERE file_id = OLD.id;
+            END
+        '''),
+    ]),
+    # Chat room membership lives in chat_participants (one row per user and
+    # room), which also carries each member's unread counter and last-read
+    # marker. A trigger on messages keeps the room's last-message pointer
+    # and the counters current, so listing a user's rooms with unread badges
+    # is one indexed query.
+    Migration(11, 'chat participants with unread counters', [
+        AddColumn('chat_rooms', 'last_message_id', 'TEXT'),
+        AddColumn('chat_rooms', 'last_activity', 'TEXT'),
+        AddColumn('chat_rooms', 'is_active', 'INTEGER DEFAULT 1'),
+        AddColumn('chat_participants', 'unread_count', 'INTEGER NOT NULL DEFAULT 0'),
+        AddColumn('chat_participants', 'last_read_message_id', 'TEXT'),
+        AddColumn('chat_participants', 'last_read_at', 'TEXT'),
+        Statement('''
+            DELETE FROM chat_participants
+            WHERE rowid NOT IN (SELECT MIN(rowid) FROM chat_participants GROUP BY user_id, room_id)
+        '''),
+        CreateIndex('idx_chat_participants_user_room', 'chat_participants', 'user_id, room_id', unique=True),
+        CreateIndex('idx_chat_participants_room_user', 'chat_participants', 'room_id, user_id'),
+        CreateIndex('idx_messages_room_created', 'messages', 'chat_room_id, created_at'),
+        Backfill('chat_rooms', '''
+            last_message_id = (SELECT id FROM messages m WHERE m.chat_room_id = chat_rooms.id
+                               ORDER BY m.created_at DESC LIMIT 1),
+            last_activity = COALESCE((SELECT MAX(created_at) FROM messages m
+                                      WHERE m.chat_room_id = chat_rooms.id), created_at)
+        ''', 'last_activity IS NULL'),
+        Statement('''
+            UPDATE chat_participants
+            SET unread_count = (SELECT COUNT(*) FROM messages m
+                                WHERE m.chat_room_id = chat_participants.room_id
+                                  AND m.sender_id != chat_participants.user_id
+                                  AND COALESCE(m.is_read, 0) = 0)
+            WHERE last_read_at IS NULL
+        '''),
+        Statement('DROP TRIGGER IF EXISTS trg_messages_chat_room'),
+        Statement('''
+            CREATE TRIGGER trg_messages_chat_room AFTER INSERT ON messages
+            WHEN NEW.chat_room_id IS NOT NULL
+            BEGIN
+                UPDATE chat_rooms
+                SET last_message_id = NEW.id, last_activity = NEW.created_at, updated_at = NEW.created_at
+                WHERE id = NEW.chat_room_id
+                  AND (last_activity IS NULL OR last_activity <= NEW.created_at);
+                UPDATE chat_participants SET unread_count = unread_count + 1
+                WHERE room_id = NEW.chat_room_id AND user_id != NEW.sender_id;
+                UPDATE chat_participants
+                SET unread_count = 0, last_read_message_id = NEW.id, last_read_at = NEW.created_at
+                WHERE room_id = NEW.chat_room_id AND user_id = NEW.sender_id;
+            END
+        '''),
+    ], client=True),
+    # Permission-scoped sync (sync_scope.py) looks up the courses a lecturer
+    # teaches on every request.
+    Migration(12, 'index courses by lecturer', [
+        CreateIndex('idx_courses_lecturer', 'courses', 'lecturer_id'),
+    ], client=True),
+    # Enrollments and lecturer changes alter what users may see (sync_scope.py)
+    # without touching the rows themselves; re-stamp those rows so delta sync
+    # sends them, or a delete to whoever can no longer see them
+    Migration(13, 'change log entries for sync scope changes', [
+        *scope_change_triggers(),
+    ]),
+    # Login sessions (sessions.py); only token hashes are stored
+    Migration(14, 'login sessions', [
+        Statement('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                token_hash TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                expires_at TEXT NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        '''),
+        CreateIndex('idx_sessions_expires', 'sessions', 'expires_at'),
+    ]),
+    # Idempotency keys of /api/sync/push operations (see sync_push.py), so a
+    # device can safely resend a batch whose response it never received.
+    Migration(15, 'sync push idempotency keys', [
+        Statement('''
+            CREATE TABLE IF NOT EXISTS sync_push_keys (
+                user_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (user_id, key)
+            )
+        '''),
+        CreateIndex('idx_sync_push_keys_created', 'sync_push_keys', 'created_at'),
+    ]),
+    # announcements.target_courses is a comma-separated list, which can only
+    # be searched with LIKE. announcement_courses mirrors it as one row per
+    # (course, announcement), kept in step by triggers, so per-course
+    # announcement lookups and counts (dashboards) are index seeks.
+    Migration(16, 'announcement courses index and dashboard indexes', [
+        Statement('''
+            CREATE TABLE IF NOT EXISTS announcement_courses (
+                course_id TEXT NOT NULL,
+                announcement_id TEXT NOT NULL,
+                PRIMARY KEY (course_id, announcement_id)
+            ) WITHOUT ROWID
+        '''),
+        CreateIndex('idx_announcement_courses_announcement', 'announcement_courses', 'announcement_id'),
+        *announcement_course_triggers(),
+        Statement(f'''
+            INSERT OR IGNORE INTO announcement_courses (course_id, announcement_id)
+            SELECT TRIM(c.value), a.id FROM announcements a, {_split_list('a.target_courses')} c
+            WHERE TRIM(c.value) != ''
+        '''),
+        # Re-create the scope triggers of migration 13 to find a course's
+        # announcements through the new table
+        *scope_change_triggers(),
+        CreateIndex('idx_files_course_created', 'files', 'course_id, created_at'),
+        CreateIndex('idx_announcements_active_created', 'announcements', 'is_active, created_at'),
+        CreateIndex('idx_announcements_author', 'announcements', 'author_id, created_at'),
+    ]),
+    # Filtered and sorted admin lists of users and courses (list_query.py)
+    Migration(17, 'composite indexes for user and course lists', [
+        CreateIndex('idx_users_role_active_name', 'users', 'role_id, is_active, last_name, first_name'),
+        CreateIndex('idx_users_active_name', 'users', 'is_active, last_name, first_name'),
+        CreateIndex('idx_users_department_level', 'users', 'department_id, level_id, role_id'),
+        CreateIndex('idx_users_faculty_role', 'users', 'faculty_id, role_id'),
+        CreateIndex('idx_courses_department_level', 'courses', 'department_id, level_id, year_id'),
+        CreateIndex('idx_courses_faculty_level', 'courses', 'faculty_id, level_id'),
+        CreateIndex('idx_courses_active_code', 'courses', 'is_active, code'),
+    ], client=True),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def _ensure_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    ''')
+
+
+def get_schema_version(conn):
+    """Return the highest applied migration, or 0 for a new or pre-versioning database"""
+    try:
+        row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def pending_migrations(conn, target=None, client=False):
+    current = get_schema_version(conn)
+    target = LATEST_VERSION if target is None else target
+    return [m for m in MIGRATIONS if current < m.version <= target and (m.client or not client)]
+
+
+def plan(conn, target=None, client=False):
+    """Dry run: estimated cost of every pending step without changing anything"""
+    report = []
+    for migration in pending_migrations(conn, target, client):
+        steps = [step.estimate(conn) for step in migration.steps]
+        report.append({
+            'version': migration.version,
+            'description': migration.description,
+            'steps': steps,
+            'rows_touched': sum(step['rows'] for step in steps),
+        })
+    return report
+
+
+def migrate(conn, target=None, batch_size=DEFAULT_BATCH_SIZE, dry_run=False, client=False):
+    """Apply pending migrations in order and return the list of applied versions
+
+    Schema steps of a migration run in one transaction; Backfill steps commit
+    after every batch. A migration is only recorded once all its steps have
+    completed, and every step is idempotent, so an interrupted run is safe to
+    repeat. client=True applies only the client migrations (app database).
+    """
+    if dry_run:
+        return plan(conn, target, client)
+
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # explicit transaction control below
+    applied = []
+    try:
+        _ensure_version_table(conn)
+        for migration in pending_migrations(conn, target, client):
+            started = time.time()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for step in migration.steps:
+                    if isinstance(step, (Backfill, ChangeLogBackfill)):
+                        conn.execute('COMMIT')
+                        step.apply(conn, batch_size)
+                        conn.execute('BEGIN IMMEDIATE')
+                    else:
+                        step.apply(conn, batch_size)
+                conn.execute('INSERT INTO schema_version (version, applied_at) VALUES (?, ?)',
+                             (migration.version, datetime.now().isoformat()))
+                conn.execute('COMMIT')
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+            applied.append(migration.version)
+            print(f"   ✅ Migration {migration.version}: {migration.description} "
+                  f"({time.time() - started:.2f}s)")
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
+
+
+def print_plan(report):
+    if not report:
+        print("✅ Database schema is up to date")
+        return
+    for migration in report:
+        print(f"📋 Migration {migration['version']}: {migration['description']} "
+              f"(~{migration['rows_touched']} rows)")
+        for step in migration['steps']:
+            print(f"   [{step['kind']:8}] {step['step']} ~{step['rows']} rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply VelocityVer schema migrations')
+    parser.add_argument('--db', default='velocityver.db', help='SQLite database path')
+    parser.add_argument('--target', type=int, help='stop after this migration version')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='rows per committed batch for backfills')
+    parser.add_argument('--dry-run', action='store_true', help='report estimated cost without applying')
+    parser.add_argument('--client', action='store_true',
+                        help="apply only the client migrations (the app's bundled database)")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        print(f"🗄️  {args.db}: schema version {get_schema_version(conn)}, latest {LATEST_VERSION}")
+        if args.dry_run:
+            print_plan(plan(conn, args.target, args.client))
+        else:
+            migrate(conn, args.target, args.batch_size, client=args.client)
+            print(f"✅ Schema version {get_schema_version(conn)}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
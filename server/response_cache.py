@@ -0,0 +1,73 @@
+"""
+In-process cache of encoded API responses
+
+Callers put the data version in the key, usually the change-log cursor
+(change_log.current_cursor). Every write to a synced table moves the cursor,
+in this process or any other, so a stale entry is simply never looked up
+again and ages out of the LRU; there is nothing to invalidate. The price is
+one cursor read per request, and any synced write makes every entry stale.
+
+Each entry keeps its encoded body, its mimetype and a strong ETag so
+unchanged responses can be answered with 304 Not Modified.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class CachedResponse:
+    __slots__ = ('body', 'etag', 'mimetype')
+
+    def __init__(self, body, etag, mimetype):
+        self.body = body
+        self.etag = etag
+        self.mimetype = mimetype
+
+
+class ResponseCache:
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key):
+        """Return the cached entry for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, mimetype='application/json'):
+        """Store an encoded body; key must hold the data version read before
+        building it, so a write that raced the build is not hidden"""
+        entry = CachedResponse(body, hashlib.sha1(body).hexdigest(), mimetype)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,284 @@
+"""
+Full-text search over files, announcements, courses and users
+
+Text is extracted from each uploaded file in the background (job kind
+'index_file', enqueued by the upload endpoint) and stored in the files_fts
+FTS5 table together with the file's name and description. Announcements,
+courses and users have external-content FTS5 indexes that triggers keep in
+step with their tables (migration 9).
+
+Searches are ranked with BM25 (name-like columns weigh more than body text)
+and scoped to what the searching user may see: admins see everything,
+lecturers the files of the courses they teach, students the files of the
+courses they are enrolled in (see scope_for_user()).
+"""
+
+import json
+import os
+import re
+from datetime import datetime
+
+import text_extraction
+
+# bm25() column weights for files_fts (name, description, content)
+FILE_WEIGHTS = (10.0, 5.0, 1.0)
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+ADMIN_ROLES = ('role_admin', 'role_super_admin')
+SEARCH_TYPES = ('files', 'announcements', 'courses', 'users')
+
+# Columns returned for user matches; password hashes and emails never are
+_USER_COLUMNS = ('id', 'username', 'first_name', 'last_name', 'role_id', 'department_id', 'profile_picture')
+
+
+def build_match_query(text, prefix=False):
+    """Turn free text into an FTS5 query that matches all words
+
+    Every word is quoted, so FTS5 operators and punctuation typed by users
+    cannot cause syntax errors. With prefix, each word also matches longer
+    words starting with it. Returns None when there is nothing to search.
+    """
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    star = '*' if prefix else ''
+    return ' '.join(f'"{word}"{star}' for word in words)
+
+
+def _set_document(conn, file_row, status, extractor=None, content='', error=None):
+    doc = conn.execute('SELECT doc_id FROM file_search_docs WHERE file_id = ?',
+                       (file_row['id'],)).fetchone()
+    if doc is None:
+        doc_id = conn.execute('''
+            INSERT INTO file_search_docs (file_id, course_id, status, indexed_at)
+            VALUES (?, ?, ?, ?)
+        ''', (file_row['id'], file_row['course_id'], status, datetime.now().isoformat())).lastrowid
+    else:
+        doc_id = doc['doc_id']
+        conn.execute('DELETE FROM files_fts WHERE rowid = ?', (doc_id,))
+
+    conn.execute('''
+        UPDATE file_search_docs
+        SET course_id = ?, status = ?, extractor = ?, char_count = ?, error = ?, indexed_at = ?
+        WHERE doc_id = ?
+    ''', (file_row['course_id'], status, extractor, len(content), error,
+          datetime.now().isoformat(), doc_id))
+    conn.execute('INSERT INTO files_fts (rowid, name, description, content) VALUES (?, ?, ?, ?)',
+                 (doc_id, file_row['original_name'] or file_row['name'],
+                  file_row['description'] or '', content))
+
+
+def index_file(conn, file_id):
+    """Extract and (re)index one file; returns the resulting status
+
+    Files that cannot be read are still indexed by name and description.
+    Extraction happens before the write transaction is opened. Caller commits.
+    """
+    file_row = conn.execute('SELECT * FROM files WHERE id = ?', (file_id,)).fetchone()
+    if file_row is None:
+        return 'missing'
+
+    path = file_row['file_path']
+    content, extractor, error = '', None, None
+    if not text_extraction.can_extract(path):
+        status = 'unsupported'
+    elif not os.path.exists(path):
+        status, error = 'missing_file', f'{path} not found'
+    else:
+        try:
+            content, extractor = text_extraction.extract_text(path)
+            status = 'indexed'
+        except Exception as e:
+            status, error = 'error', f'{type(e).__name__}: {e}'
+
+    _set_document(conn, file_row, status, extractor, content, error)
+    return status
+
+
+def unindexed_file_ids(conn):
+    """Files with no search document yet, or changed since they were indexed"""
+    return [row[0] for row in conn.execute('''
+        SELECT f.id FROM files f
+        LEFT JOIN file_search_docs d ON d.file_id = f.id
+        WHERE d.doc_id IS NULL OR d.indexed_at < f.updated_at
+    ''')]
+
+
+class SearchScope:
+    """What one user may find
+
+    course_ids is None for unrestricted access (admins), otherwise the ids of
+    the courses the user teaches or is enrolled in.
+    """
+
+    def __init__(self, user_id=None, role_id=None, role_name=None, course_ids=None):
+        self.user_id = user_id
+        self.role_id = role_id
+        self.role_name = role_name
+        self.course_ids = course_ids
+
+    @property
+    def is_admin(self):
+        return self.role_id in ADMIN_ROLES
+
+    @property
+    def types(self):
+        # Anonymous callers can only browse the course catalogue
+        return SEARCH_TYPES if self.user_id else ('courses',)
+
+
+def scope_for_user(conn, user_id):
+    """SearchScope for user_id; an unknown or missing user only sees courses"""
+    user = None
+    if user_id:
+        user = conn.execute('''
+            SELECT u.id, u.role_id, r.name AS role_name
+            FROM users u JOIN roles r ON r.id = u.role_id
+            WHERE u.id = ? AND u.is_active = 1
+        ''', (user_id,)).fetchone()
+    if user is None:
+        return SearchScope()
+    if user['role_id'] in ADMIN_ROLES:
+        return SearchScope(user['id'], user['role_id'], user['role_name'])
+    if user['role_id'] == 'role_lecturer':
+        course_ids = [row[0] for row in conn.execute(
+            'SELECT id FROM courses WHERE lecturer_id = ?', (user['id'],))]
+    else:
+        course_ids = [row[0] for row in conn.execute(
+            'SELECT course_id FROM user_courses WHERE user_id = ?', (user['id'],))]
+    return SearchScope(user['id'], user['role_id'], user['role_name'], course_ids)
+
+
+def _weights(values):
+    return ', '.join(str(weight) for weight in values)
+
+
+def _files_query(scope, course_ids):
+    query = f'''
+        SELECT f.id, f.name, f.original_name, f.course_id, f.mime_type, f.file_size,
+               f.description, f.uploaded_by, f.created_at,
+               snippet(files_fts, 2, '[', ']', '…', 12) AS snippet,
+               bm25(files_fts, {_weights(FILE_WEIGHTS)}) AS score
+        FROM files_fts
+        JOIN file_search_docs d ON d.doc_id = files_fts.rowid
+        JOIN files f ON f.id = d.file_id
+        WHERE files_fts MATCH ?
+    '''
+    params = []
+    for ids in (scope.course_ids, course_ids):
+        if ids is not None:
+            query += ' AND d.course_id IN (SELECT value FROM json_each(?))'
+            params.append(json.dumps(ids))
+    return query, params
+
+
+_TARGETS_COURSE = '''EXISTS (SELECT 1 FROM json_each(?) c
+                   WHERE ',' || a.target_courses || ',' LIKE '%,' || c.value || ',%')'''
+
+
+def _announcements_query(scope, course_ids):
+    query = '''
+        SELECT a.id, a.title, a.author_id, a.target_roles, a.target_courses, a.created_at,
+               snippet(announcements_fts, 1, '[', ']', '…', 12) AS snippet,
+               bm25(announcements_fts, 5.0, 1.0) AS score
+        FROM announcements_fts
+        JOIN announcements a ON a.rowid = announcements_fts.rowid
+        WHERE announcements_fts MATCH ? AND a.is_active = 1
+    '''
+    params = []
+    if not scope.is_admin:
+        # Aimed at the user's role (or everyone) and one of their courses
+        # (or every course); authors always find their own
+        query += f'''
+            AND (a.author_id = ? OR (
+                (COALESCE(a.target_roles, '') = '' OR ',' || a.target_roles || ',' LIKE '%,' || ? || ',%')
+                AND (COALESCE(a.target_courses, '') = '' OR {_TARGETS_COURSE})
+            ))
+        '''
+        params.extend([scope.user_id, scope.role_name, json.dumps(scope.course_ids)])
+    if course_ids is not None:
+        query += f' AND {_TARGETS_COURSE}'
+        params.append(json.dumps(course_ids))
+    return query, params
+
+
+def _courses_query(scope, course_ids):
+    query = '''
+        SELECT c.id, c.name, c.code, c.description, c.department_id, c.faculty_id,
+               c.level_id, c.year_id, c.lecturer_id,
+               snippet(courses_fts, 2, '[', ']', '…', 12) AS snippet,
+               bm25(courses_fts, 10.0, 10.0, 1.0) AS score
+        FROM courses_fts
+        JOIN courses c ON c.rowid = courses_fts.rowid
+        WHERE courses_fts MATCH ? AND c.is_active = 1
+    '''
+    params = []
+    if course_ids is not None:
+        query += ' AND c.id IN (SELECT value FROM json_each(?))'
+        params.append(json.dumps(course_ids))
+    return query, params
+
+
+_MEMBERS = '''u.id IN (SELECT user_id FROM user_courses
+                     WHERE course_id IN (SELECT value FROM json_each(?)))'''
+_TEACHERS = '''u.id IN (SELECT lecturer_id FROM courses
+                      WHERE id IN (SELECT value FROM json_each(?)))'''
+
+
+def _users_query(scope, course_ids):
+    columns = ', '.join(f'u.{column}' for column in _USER_COLUMNS)
+    query = f'''
+        SELECT {columns}, NULL AS snippet, bm25(users_fts, 5.0, 3.0, 3.0, 1.0) AS score
+        FROM users_fts
+        JOIN users u ON u.rowid = users_fts.rowid
+        WHERE users_fts MATCH ? AND u.is_active = 1
+    '''
+    params = []
+    if scope.role_id == 'role_lecturer':
+        # Staff, plus the students in the courses they teach
+        query += f" AND (u.role_id != 'role_student' OR {_MEMBERS})"
+        params.append(json.dumps(scope.course_ids))
+    elif not scope.is_admin:
+        # Students find the lecturers of their courses
+        query += f' AND {_TEACHERS}'
+        params.append(json.dumps(scope.course_ids))
+    if course_ids is not None:
+        query += f' AND ({_MEMBERS} OR {_TEACHERS})'
+        params.extend([json.dumps(course_ids)] * 2)
+    return query, params
+
+
+_QUERY_BUILDERS = {
+    'files': _files_query,
+    'announcements': _announcements_query,
+    'courses': _courses_query,
+    'users': _users_query,
+}
+
+
+def search(conn, text, scope, types=None, limit=DEFAULT_LIMIT, offset=0, course_ids=None, prefix=True):
+    """Ranked matches per entity type visible to scope
+
+    Returns {type: {'items': [...], 'has_more': bool}} for every requested
+    type the scope allows. course_ids narrows results to those courses.
+    """
+    match = build_match_query(text, prefix)
+    types = [search_type for search_type in (types or SEARCH_TYPES) if search_type in scope.types]
+    limit = max(1, min(limit, MAX_LIMIT))
+    results = {}
+    for search_type in types:
+        if match is None:
+            results[search_type] = {'items': [], 'has_more': False}
+            continue
+        query, params = _QUERY_BUILDERS[search_type](scope, course_ids)
+        rows = conn.execute(query + ' ORDER BY score LIMIT ? OFFSET ?',
+                            [match, *params, limit + 1, max(offset, 0)]).fetchall()
+        results[search_type] = {'items': [dict(row) for row in rows[:limit]],
+                                'has_more': len(rows) > limit}
+    return results
+
+
+def stats(conn):
+    rows = conn.execute('SELECT status, COUNT(*) AS count FROM file_search_docs GROUP BY status')
+    return {row['status']: row['count'] for row in rows}
@@ -0,0 +1,53 @@
+"""
+Login sessions
+
+/api/auth/login returns a random session token, which clients send as
+`Authorization: Bearer <token>`. Only the token's SHA-256 is stored (the
+sessions table, migration 14), so a copy of the database cannot be used to
+sign in. A session ends at logout, after SESSION_DAYS, or as soon as its
+user is deactivated. Expired rows are removed by purge_expired().
+"""
+
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+
+SESSION_DAYS = 30
+
+
+def _digest(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def create(conn, user_id, now=None):
+    """Start a session for user_id and return its token; caller commits"""
+    now = now or datetime.now()
+    token = secrets.token_urlsafe(32)
+    conn.execute('''
+        INSERT INTO sessions (token_hash, user_id, created_at, expires_at) VALUES (?, ?, ?, ?)
+    ''', (_digest(token), user_id, now.isoformat(), (now + timedelta(days=SESSION_DAYS)).isoformat()))
+    return token
+
+
+def user_id_for(conn, token):
+    """Id of the active user the token belongs to, or None"""
+    if not token:
+        return None
+    row = conn.execute('''
+        SELECT s.user_id FROM sessions s JOIN users u ON u.id = s.user_id
+        WHERE s.token_hash = ? AND s.expires_at > ? AND u.is_active = 1
+    ''', (_digest(token), datetime.now().isoformat())).fetchone()
+    return row[0] if row else None
+
+
+def revoke(conn, token):
+    """End the session; True if it existed. Caller commits."""
+    if not token:
+        return False
+    return conn.execute('DELETE FROM sessions WHERE token_hash = ?', (_digest(token),)).rowcount > 0
+
+
+def purge_expired(conn, now=None):
+    """Delete expired sessions; returns the number removed. Caller commits."""
+    now = (now or datetime.now()).isoformat()
+    return conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,)).rowcount
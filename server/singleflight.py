@@ -0,0 +1,97 @@
+"""
+Coalescing of identical concurrent computations
+
+When many clients ask for the same thing at once (a lecture starts and every
+device syncs the course), SingleFlight.do() lets the first request for a key
+run the query and encoding while identical requests that arrive before it
+finishes wait for it and get the same result. Keys include the data version
+(change-log cursor or response-cache version), so a request never receives a
+result computed from older data than it could have read itself.
+
+Nothing is kept once a computation finishes; caching is response_cache's
+job. stats() reports how many requests were served by another request's
+computation (the coalescing ratio), in total and per route.
+"""
+
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.max_waiters = 0
+        self._routes = {}
+
+    def do(self, key, fn, label=None):
+        """Return fn(), sharing one call among concurrent callers with the same key
+
+        If fn raises, every caller waiting on that call gets the exception.
+        """
+        with self._lock:
+            self.requests += 1
+            route = self._routes.setdefault(label, [0, 0]) if label else None
+            if route:
+                route[0] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+                if route:
+                    route[1] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'errors': self.errors,
+                'in_flight': len(self._calls),
+                'max_waiters': self.max_waiters,
+                'coalescing_ratio': round(self.coalesced / self.requests, 4) if self.requests else 0.0,
+                'routes': {
+                    label: {'requests': requests, 'coalesced': coalesced,
+                            'coalescing_ratio': round(coalesced / requests, 4)}
+                    for label, (requests, coalesced) in self._routes.items()
+                },
+            }
@@ -0,0 +1,82 @@
+"""
+Wire formats for the sync endpoints
+
+The default JSON format sends every row as an object, repeating each column
+name (id, created_at, updated_at, last_sync, ...) on every row. Two compact
+alternatives send the column names once followed by row tuples:
+
+    {"<key>": {"columns": ["id", "name", ...], "rows": [["r1", "A", ...], ...]}}
+
+- columnar: the structure above as JSON
+- msgpack:  the same structure as MessagePack (needs the optional `msgpack`
+            package; falls back to JSON when it is not installed)
+
+Clients opt in with ?format=columnar|msgpack or an Accept header that names
+application/vnd.velocityver.columnar+json or application/msgpack. Wildcards
+(*/*, application/*) do not count as opting in. Anything else gets the
+original JSON, so existing clients are unaffected.
+"""
+
+import row_json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = 'json'
+COLUMNAR = 'columnar'
+MSGPACK = 'msgpack'
+
+COLUMNAR_MIMETYPE = 'application/vnd.velocityver.columnar+json'
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+def available_formats():
+    formats = [JSON, COLUMNAR]
+    if msgpack is not None:
+        formats.append(MSGPACK)
+    return formats
+
+
+def _listed_quality(accept, mimetypes):
+    """Quality of the Accept entries naming one of mimetypes exactly (0 if none)"""
+    return max((quality for value, quality in accept if value.lower() in mimetypes), default=0)
+
+
+def negotiate_format(request):
+    """Pick the sync format from ?format= or the Accept header (JSON by default)
+
+    A compact format is only chosen when the Accept header names it, with a
+    quality no lower than an explicit application/json.
+    """
+    requested = request.args.get('format', '').lower()
+    if requested in available_formats():
+        return requested
+    accept = request.accept_mimetypes
+    candidates = [(_listed_quality(accept, (COLUMNAR_MIMETYPE,)), COLUMNAR)]
+    if msgpack is not None:
+        candidates.insert(0, (_listed_quality(accept, MSGPACK_MIMETYPES), MSGPACK))
+    quality, fmt = max(candidates, key=lambda candidate: candidate[0])
+    if quality and quality >= _listed_quality(accept, ('application/json',)):
+        return fmt
+    return JSON
+
+
+def columnar_payload(key, columns, rows, extra=None):
+    payload = {key: {'columns': list(columns), 'rows': [list(row) for row in rows]}}
+    if extra:
+        payload.update(extra)
+    return payload
+
+
+def encode_rows(key, columns, rows, fmt, extra=None):
+    """Encode rows in a compact format; returns (body, mimetype)
+
+    The JSON default is produced by the caller (encode_sync_body) so its
+    output matches what clients already receive.
+    """
+    payload = columnar_payload(key, columns, rows, extra)
+    if fmt == MSGPACK:
+        return msgpack.packb(payload, use_bin_type=True), MSGPACK_MIMETYPES[0]
+    return row_json.dumps(payload), COLUMNAR_MIMETYPE
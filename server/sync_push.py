@@ -0,0 +1,374 @@
+"""
+Batched upload of a device's offline changes
+
+POST /api/sync/push takes the device's queued operations in one request:
+
+    {"operations": [
+        {"key": "dev1-42", "table": "announcements", "op": "create",
+         "id": "<client-generated id>", "data": {"title": ..., "content": ...}},
+        {"key": "dev1-43", "table": "users", "op": "update", "id": "<user id>",
+         "data": {"first_name": ...}},
+        {"key": "dev1-44", "table": "courses", "op": "delete", "id": "<course id>"}
+    ]}
+
+All operations run in one write transaction; each runs in its own
+savepoint, so a rejected or failing operation (bad data, a constraint or
+other database error) is rolled back on its own and reported in its result
+while the others are kept. Results come back in request order.
+
+`key` is an idempotency key chosen by the device. The result of every
+successful operation is stored under (caller, key), and the stored result is
+returned (with "replayed": true) if the same key is pushed again. A device
+that lost the response to a push can therefore just push its queue again.
+
+Supported operations (deletes are soft deletes where the table has is_active):
+
+    users          create, update, delete   admins; anyone may update themselves
+    courses        create, update, delete   admins
+    announcements  create, update, delete   admins and lecturers, own announcements
+    messages       create                   participants of the room, sent as the caller
+    user_courses   create, delete           admins and the lecturer of the course
+"""
+
+import json
+import sqlite3
+import uuid
+
+from werkzeug.security import generate_password_hash
+
+import chat_service
+import enrollment_service
+
+MAX_OPERATIONS = 500
+
+USER_FIELDS = ('username', 'email', 'first_name', 'last_name', 'level_id', 'year_id',
+               'department_id', 'faculty_id', 'profile_picture', 'is_active')
+STUDENT_USER_FIELDS = ('first_name', 'last_name', 'profile_picture')
+COURSE_FIELDS = ('name', 'code', 'description', 'level_id', 'year_id', 'department_id',
+                 'faculty_id', 'lecturer_id', 'is_active')
+ANNOUNCEMENT_FIELDS = ('title', 'content', 'target_roles', 'target_courses', 'is_active')
+
+
+class PushError(Exception):
+    def __init__(self, message, code=400):
+        super().__init__(message)
+        self.code = code
+
+
+def _require(data, fields):
+    for field in fields:
+        if data.get(field) in (None, ''):
+            raise PushError(f'{field} is required')
+
+
+def _require_admin(scope):
+    if not scope.is_admin:
+        raise PushError('Only admins can do this', 403)
+
+
+def _joined(value):
+    # Target lists arrive as JSON arrays from the app, strings from older clients
+    return ','.join(value) if isinstance(value, list) else value
+
+
+def _update(conn, table, record_id, data, fields, now, extra=None):
+    values = {field: _joined(data[field]) for field in fields if field in data}
+    values.update(extra or {})
+    if not values:
+        raise PushError('No valid fields to update')
+    values['updated_at'] = now
+    assignments = ', '.join(f'{column} = ?' for column in values)
+    updated = conn.execute(f'UPDATE {table} SET {assignments} WHERE id = ?',
+                           (*values.values(), record_id)).rowcount
+    if not updated:
+        raise PushError(f'{table} record not found', 404)
+    return {'status': 'updated', 'id': record_id}
+
+
+def _soft_delete(conn, table, record_id, now):
+    deleted = conn.execute(f'UPDATE {table} SET is_active = 0, updated_at = ? WHERE id = ?',
+                           (now, record_id)).rowcount
+    if not deleted:
+        raise PushError(f'{table} record not found', 404)
+    return {'status': 'deleted', 'id': record_id}
+
+
+# users
+
+def _create_user(conn, scope, record_id, data, now):
+    _require_admin(scope)
+    _require(data, ('username', 'email', 'role_id', 'first_name', 'last_name'))
+    if not data.get('_password_hash'):
+        raise PushError('password is required')
+    conn.execute('''
+        INSERT INTO users (id, username, email, password_hash, role_id, first_name, last_name,
+                           level_id, year_id, department_id, faculty_id, profile_picture, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (record_id, data['username'], data['email'], data['_password_hash'], data['role_id'],
+          data['first_name'], data['last_name'], data.get('level_id'), data.get('year_id'),
+          data.get('department_id'), data.get('faculty_id'),
+          data.get('profile_picture') or 'default_avatar.png', now, now))
+    chat_service.provision_staff_rooms(conn, record_id, now)
+    return {'status': 'created', 'id': record_id}
+
+
+def _update_user(conn, scope, record_id, data, now):
+    if not scope.is_admin and record_id != scope.user_id:
+        raise PushError('You can only update your own account', 403)
+    fields = STUDENT_USER_FIELDS if scope.role_id == 'role_student' else USER_FIELDS
+    extra = {'password_hash': data['_password_hash']} if data.get('_password_hash') else None
+    return _update(conn, 'users', record_id, data, fields, now, extra)
+
+
+def _delete_user(conn, scope, record_id, data, now):
+    _require_admin(scope)
+    return _soft_delete(conn, 'users', record_id, now)
+
+
+# courses
+
+def _create_course(conn, scope, record_id, data, now):
+    _require_admin(scope)
+    _require(data, ('name', 'code', 'level_id', 'year_id', 'department_id', 'faculty_id'))
+    conn.execute('''
+        INSERT INTO courses (id, name, code, description, level_id, year_id, department_id,
+                             faculty_id, lecturer_id, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (record_id, data['name'], data['code'], data.get('description'), data['level_id'],
+          data['year_id'], data['department_id'], data['faculty_id'], data.get('lecturer_id'), now, now))
+    return {'status': 'created', 'id': record_id}
+
+
+def _update_course(conn, scope, record_id, data, now):
+    _require_admin(scope)
+    return _update(conn, 'courses', record_id, data, COURSE_FIELDS, now)
+
+
+def _delete_course(conn, scope, record_id, data, now):
+    _require_admin(scope)
+    return _soft_delete(conn, 'courses', record_id, now)
+
+
+# announcements
+
+def _require_author(conn, scope, record_id):
+    if scope.role_id not in ('role_admin', 'role_super_admin', 'role_lecturer'):
+        raise PushError('Only admins and lecturers can manage announcements', 403)
+    if scope.is_admin or record_id is None:
+        return
+    row = conn.execute('SELECT author_id FROM announcements WHERE id = ?', (record_id,)).fetchone()
+    if row is not None and row['author_id'] != scope.user_id:
+        raise PushError('You can only change your own announcements', 403)
+
+
+def _create_announcement(conn, scope, record_id, data, now):
+    _require_author(conn, scope, None)
+    _require(data, ('title', 'content'))
+    conn.execute('''
+        INSERT INTO announcements (id, title, content, author_id, target_roles, target_courses, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (record_id, data['title'], data['content'], scope.user_id,
+          _joined(data.get('target_roles') or ''), _joined(data.get('target_courses') or ''), now, now))
+    return {'status': 'created', 'id': record_id}
+
+
+def _update_announcement(conn, scope, record_id, data, now):
+    _require_author(conn, scope, record_id)
+    return _update(conn, 'announcements', record_id, data, ANNOUNCEMENT_FIELDS, now)
+
+
+def _delete_announcement(conn, scope, record_id, data, now):
+    _require_author(conn, scope, record_id)
+    return _soft_delete(conn, 'announcements', record_id, now)
+
+
+# messages
+
+def _create_message(conn, scope, record_id, data, now):
+    if not data.get('content') and not data.get('file_id'):
+        raise PushError('content is required')
+    if data.get('chat_room_id') and not chat_service.is_participant(conn, data['chat_room_id'], scope.user_id):
+        raise PushError('You are not a participant of this chat room', 403)
+    conn.execute('''
+        INSERT INTO messages (id, content, sender_id, receiver_id, chat_room_id,
+                              message_type, file_id, file_name, file_url, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (record_id, data.get('content', ''), scope.user_id, data.get('receiver_id'),
+          data.get('chat_room_id'), data.get('message_type', 'text'), data.get('file_id'),
+          data.get('file_name'), data.get('file_url'), data.get('created_at') or now, now))
+    return {'status': 'created', 'id': record_id}
+
+
+# user_courses
+
+def _require_course_manager(conn, scope, course_id):
+    if scope.is_admin:
+        return
+    row = conn.execute('SELECT lecturer_id FROM courses WHERE id = ?', (course_id,)).fetchone()
+    if row is None or row['lecturer_id'] != scope.user_id:
+        raise PushError('Only admins and the course lecturer can change enrollments', 403)
+
+
+def _create_enrollment(conn, scope, record_id, data, now):
+    student_id = data.get('user_id') or data.get('student_id')
+    _require({'user_id': student_id, 'course_id': data.get('course_id')}, ('user_id', 'course_id'))
+    _require_course_manager(conn, scope, data['course_id'])
+    try:
+        result = enrollment_service.enroll(conn, student_id, data['course_id'], now)
+    except enrollment_service.CourseNotFound:
+        raise PushError('Course not found', 404)
+    if result['status'] in ('not_found', 'not_student'):
+        raise PushError('Student not found', 404)
+    if result['status'] == 'already_enrolled':
+        # The device's intent is already the server state
+        return {'status': 'unchanged', 'id': None}
+    return {'status': 'created', 'id': result['id']}
+
+
+def _delete_enrollment(conn, scope, record_id, data, now):
+    row = conn.execute('SELECT user_id, course_id FROM user_courses WHERE id = ?', (record_id,)).fetchone()
+    student_id = row['user_id'] if row else data.get('user_id') or data.get('student_id')
+    course_id = row['course_id'] if row else data.get('course_id')
+    if not student_id or not course_id:
+        return {'status': 'unchanged', 'id': record_id}
+    _require_course_manager(conn, scope, course_id)
+    try:
+        result = enrollment_service.unenroll(conn, student_id, course_id)
+    except enrollment_service.CourseNotFound:
+        raise PushError('Course not found', 404)
+    status = 'deleted' if result['status'] == 'unenrolled' else 'unchanged'
+    return {'status': status, 'id': record_id}
+
+
+HANDLERS = {
+    ('users', 'create'): _create_user,
+    ('users', 'update'): _update_user,
+    ('users', 'delete'): _delete_user,
+    ('courses', 'create'): _create_course,
+    ('courses', 'update'): _update_course,
+    ('courses', 'delete'): _delete_course,
+    ('announcements', 'create'): _create_announcement,
+    ('announcements', 'update'): _update_announcement,
+    ('announcements', 'delete'): _delete_announcement,
+    ('messages', 'create'): _create_message,
+    ('user_courses', 'create'): _create_enrollment,
+    ('user_courses', 'delete'): _delete_enrollment,
+}
+
+
+def _may_set_password(scope, op):
+    """Whether the handler would accept a password from this operation"""
+    if op.get('table') != 'users':
+        return False
+    if op.get('op') == 'create':
+        return scope.is_admin
+    if op.get('op') == 'update':
+        return scope.is_admin or (op.get('id') or op['data'].get('id')) == scope.user_id
+    return False
+
+
+def prepare(conn, scope, operations):
+    """Validate the batch shape and hash passwords before the write transaction
+
+    Hashing is slow, so only passwords of operations that will be applied are
+    hashed: not those scope may not set, and not replays of a stored key.
+    Passwords are dropped either way.
+    The handlers still check authorization inside the transaction.
+
+    Raises PushError for a malformed batch.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise PushError('operations must be a non-empty list')
+    if len(operations) > MAX_OPERATIONS:
+        raise PushError(f'At most {MAX_OPERATIONS} operations per push', 413)
+    for op in operations:
+        if not isinstance(op, dict):
+            raise PushError('Every operation must be an object')
+        data = op.get('data') or {}
+        if not isinstance(data, dict):
+            raise PushError('Operation data must be an object')
+        op['data'] = data
+
+    keys = {str(op['key']) for op in operations if op.get('key') and op['data'].get('password')}
+    stored = set()
+    if keys:
+        placeholders = ', '.join('?' for _ in keys)
+        stored.update(row['key'] for row in conn.execute(
+            f'SELECT key FROM sync_push_keys WHERE user_id = ? AND key IN ({placeholders})',
+            (scope.user_id, *keys)))
+    for op in operations:
+        password = op['data'].get('password')
+        if password is None:
+            continue
+        data = dict(op['data'])
+        del data['password']
+        replay = op.get('key') and str(op['key']) in stored
+        if password and not replay and _may_set_password(scope, op):
+            data['_password_hash'] = generate_password_hash(password)
+        op['data'] = data
+    return operations
+
+
+def _apply(conn, scope, op, now):
+    table, action = op.get('table'), op.get('op')
+    handler = HANDLERS.get((table, action))
+    if handler is None:
+        return {'status': 'error', 'code': 400, 'error': f"Unsupported operation '{action}' on '{table}'"}
+    record_id = op.get('id') or op['data'].get('id')
+    if record_id is None and action == 'create':
+        record_id = str(uuid.uuid4())
+    if record_id is None and table != 'user_courses':
+        return {'status': 'error', 'code': 400, 'error': 'id is required'}
+
+    conn.execute('SAVEPOINT push_op')
+    try:
+        result = handler(conn, scope, record_id, op['data'], now)
+    except PushError as e:
+        conn.execute('ROLLBACK TO push_op')
+        result = {'status': 'error', 'code': e.code, 'error': str(e)}
+    except sqlite3.IntegrityError as e:
+        conn.execute('ROLLBACK TO push_op')
+        result = {'status': 'error', 'code': 409, 'error': f'Conflicts with existing data: {e}'}
+    except sqlite3.Error as e:
+        conn.execute('ROLLBACK TO push_op')
+        result = {'status': 'error', 'code': 500, 'error': f'Database error: {e}'}
+    except (TypeError, ValueError, KeyError) as e:
+        conn.execute('ROLLBACK TO push_op')
+        result = {'status': 'error', 'code': 400, 'error': f'Invalid operation data: {e}'}
+    conn.execute('RELEASE push_op')
+    return result
+
+
+def apply_operations(conn, scope, operations, now):
+    """Apply prepared operations for scope's user; returns one result per operation
+
+    Opens and commits its own transaction.
+    """
+    results = []
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for index, op in enumerate(operations):
+            key = op.get('key')
+            stored = None
+            if key:
+                stored = conn.execute('SELECT result FROM sync_push_keys WHERE user_id = ? AND key = ?',
+                                      (scope.user_id, str(key))).fetchone()
+            if stored is not None:
+                result = dict(json.loads(stored['result']), replayed=True)
+            else:
+                result = _apply(conn, scope, op, now)
+                if key and result['status'] != 'error':
+                    conn.execute('''
+                        INSERT INTO sync_push_keys (user_id, key, result, created_at) VALUES (?, ?, ?, ?)
+                    ''', (scope.user_id, str(key), json.dumps(result), now))
+            results.append(dict(result, index=index, key=key))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return results
+
+
+def purge_keys(conn, before):
+    """Forget idempotency keys stored before the given ISO time; caller commits"""
+    return conn.execute('DELETE FROM sync_push_keys WHERE created_at < ?', (before,)).rowcount
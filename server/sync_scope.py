@@ -0,0 +1,120 @@
+"""
+Per-user visibility for the sync endpoints
+
+Devices identify themselves with `Authorization: Bearer <token>`, the
+session token returned by /api/auth/login (see sessions.py). Each synced
+table is then narrowed to what that user can see, so a student's sync grows
+with their own courses rather than with the institution:
+
+    table          admin     lecturer                        student
+    users          all       self, staff, their students     self, their lecturers
+    courses        all       courses they teach              enrolled courses
+    files          all       files of those courses          files of those courses
+    announcements  all       authored, or targeted at their role/courses
+    user_courses   all       enrollments in their courses    own enrollments
+
+Reference tables (roles, faculties, ...) are public. password_hash is never
+sent, and non-admins only get the email address of their own account.
+Requests without a valid session token get no rows of the scoped tables.
+"""
+
+import json
+
+import sessions
+from search_index import scope_for_user
+
+PUBLIC_TABLES = {'roles', 'faculties', 'departments', 'levels', 'years'}
+SCOPED_TABLES = ('users', 'courses', 'files', 'announcements', 'user_courses')
+
+# User columns every authenticated user may see of the users visible to them
+USER_PUBLIC_COLUMNS = ('id', 'username', 'role_id', 'first_name', 'last_name', 'level_id', 'year_id',
+                       'department_id', 'faculty_id', 'profile_picture', 'is_active',
+                       'created_at', 'updated_at', 'change_seq')
+USER_ADMIN_COLUMNS = USER_PUBLIC_COLUMNS + ('email', 'last_sync')
+
+_IN_COURSES = 'IN (SELECT value FROM json_each(?))'
+
+
+def bearer_token(request):
+    header = request.headers.get('Authorization', '')
+    if header[:7].lower() == 'bearer ':
+        return header[7:].strip() or None
+    return None
+
+
+def caller_id(conn, request):
+    """Id of the active user whose session token the request carries, or None"""
+    return sessions.user_id_for(conn, bearer_token(request))
+
+
+class SyncScope:
+    def __init__(self, search_scope):
+        self.user_id = search_scope.user_id
+        self.role_id = search_scope.role_id
+        self.role_name = search_scope.role_name
+        self.course_ids = search_scope.course_ids
+        self.is_admin = search_scope.is_admin
+
+    @property
+    def authenticated(self):
+        return self.user_id is not None
+
+    @property
+    def is_lecturer(self):
+        return self.role_id == 'role_lecturer'
+
+    def _courses(self):
+        return json.dumps(self.course_ids or [])
+
+    def columns(self, table, fields=None):
+        """(select list, params) for table, optionally only the given fields
+
+        fields must already be valid column names of table; users columns the
+        caller may not see raise ValueError.
+        """
+        if table != 'users':
+            return (', '.join(fields) if fields else '*'), []
+        visible = USER_ADMIN_COLUMNS if self.is_admin else USER_PUBLIC_COLUMNS + ('email',)
+        fields = fields or visible
+        hidden = [field for field in fields if field not in visible]
+        if hidden:
+            raise ValueError(f"Unknown or hidden users fields: {', '.join(hidden)}")
+        if self.is_admin or 'email' not in fields:
+            return ', '.join(fields), []
+        expressions = ['CASE WHEN id = ? THEN email END AS email' if field == 'email' else field
+                       for field in fields]
+        return ', '.join(expressions), [self.user_id]
+
+    def filter(self, table):
+        """(condition or None, params) restricting table to the visible rows"""
+        if self.is_admin or table in PUBLIC_TABLES:
+            return None, []
+        if table == 'users':
+            if self.is_lecturer:
+                return (f"(id = ? OR role_id != 'role_student' OR id IN "
+                        f"(SELECT user_id FROM user_courses WHERE course_id {_IN_COURSES}))",
+                        [self.user_id, self._courses()])
+            return (f'(id = ? OR id IN (SELECT lecturer_id FROM courses WHERE id {_IN_COURSES}))',
+                    [self.user_id, self._courses()])
+        if table == 'courses':
+            return f'id {_IN_COURSES}', [self._courses()]
+        if table == 'files':
+            return f'course_id {_IN_COURSES}', [self._courses()]
+        if table == 'announcements':
+            return (f'''(author_id = ? OR (
+                        (COALESCE(target_roles, '') = '' OR ',' || target_roles || ',' LIKE '%,' || ? || ',%')
+                        AND (COALESCE(target_courses, '') = '' OR EXISTS (
+                            SELECT 1 FROM json_each(?) c
+                            WHERE ',' || target_courses || ',' LIKE '%,' || c.value || ',%'))
+                    ))''', [self.user_id, self.role_name, self._courses()])
+        if table == 'user_courses':
+            if self.is_lecturer:
+                return f'course_id {_IN_COURSES}', [self._courses()]
+            return 'user_id = ?', [self.user_id]
+        # Anything else is not synced to non-admins
+        return '0', []
+
+
+def scope_for_request(conn, request):
+    """SyncScope of the caller (not authenticated without a valid session token)"""
+    return SyncScope(scope_for_user(conn, caller_id(conn, request)))
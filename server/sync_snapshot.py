@@ -0,0 +1,130 @@
+"""
+Prebuilt SQLite snapshots for a device's first sync
+
+Instead of paging every synced table through the JSON endpoints, a new
+device downloads one gzip-compressed SQLite file holding exactly the rows
+its user may see (sync_scope.py) and then continues with delta sync from
+the cursor stored in the snapshot.
+
+The snapshot is built with ATTACH + CREATE TABLE ... AS SELECT inside one
+read transaction, so its rows and cursor always match. Snapshots are cached
+per scope (user, role and course set): a cached file is reused for up to
+MAX_AGE seconds even if data changed since, which is safe because the
+client catches up from the snapshot's own cursor. A change of scope (a new
+enrollment, a new course to teach) produces a different key and a fresh
+build.
+
+Each snapshot contains the synced tables plus a snapshot_info table
+(key/value: user_id, cursor, built_at, schema_version).
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import change_log
+import migrations
+
+MAX_AGE = 3600
+# Snapshots of scopes nobody asked for in this long are deleted
+PURGE_AGE = 86400
+
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+
+def scope_key(scope):
+    """Cache key for everything that decides the content of a snapshot"""
+    course_ids = sorted(scope.course_ids) if scope.course_ids is not None else None
+    raw = json.dumps([scope.user_id, scope.role_id, course_ids])
+    return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+
+def _lock_for(key):
+    with _build_locks_guard:
+        return _build_locks.setdefault(key, threading.Lock())
+
+
+def build_snapshot(conn, scope, path):
+    """Write the scope's rows to a new SQLite file at path; returns the cursor"""
+    if os.path.exists(path):
+        os.remove(path)
+    conn.execute('ATTACH DATABASE ? AS snapshot', (path,))
+    try:
+        conn.execute('PRAGMA snapshot.journal_mode = OFF')
+        conn.execute('BEGIN')
+        cursor = change_log.current_cursor(conn)
+        for table in migrations.SYNCED_TABLES:
+            columns, params = scope.columns(table)
+            condition, condition_params = scope.filter(table)
+            query = f'CREATE TABLE snapshot.{table} AS SELECT {columns} FROM main.{table}'
+            if condition:
+                query += f' WHERE {condition}'
+            conn.execute(query, [*params, *condition_params])
+            conn.execute(f'CREATE UNIQUE INDEX snapshot.idx_{table}_id ON {table} (id)')
+        conn.execute('CREATE TABLE snapshot.snapshot_info (key TEXT PRIMARY KEY, value TEXT)')
+        conn.executemany('INSERT INTO snapshot.snapshot_info (key, value) VALUES (?, ?)', [
+            ('user_id', scope.user_id),
+            ('cursor', str(cursor)),
+            ('built_at', datetime.now().isoformat()),
+            ('schema_version', str(migrations.get_schema_version(conn))),
+        ])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute('DETACH DATABASE snapshot')
+    return cursor
+
+
+def _purge(folder):
+    cutoff = time.time() - PURGE_AGE
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if os.path.getmtime(path) < cutoff:
+            os.remove(path)
+
+
+def get_snapshot(connect, scope, folder, max_age=MAX_AGE):
+    """Path of an up-to-date gzip snapshot for scope and its metadata dict
+
+    Builds the snapshot if there is no cached one younger than max_age.
+    """
+    os.makedirs(folder, exist_ok=True)
+    key = scope_key(scope)
+    path = os.path.join(folder, f'{key}.db.gz')
+    meta_path = os.path.join(folder, f'{key}.json')
+
+    with _lock_for(key):
+        if os.path.exists(path) and os.path.exists(meta_path):
+            with open(meta_path) as handle:
+                meta = json.load(handle)
+            if time.time() - meta['built'] < max_age:
+                return path, meta
+
+        started = time.perf_counter()
+        raw_path = os.path.join(folder, f'{key}.building.db')
+        conn = connect()
+        try:
+            cursor = build_snapshot(conn, scope, raw_path)
+        finally:
+            conn.close()
+        with open(raw_path, 'rb') as source, gzip.open(f'{path}.tmp', 'wb', compresslevel=6) as target:
+            shutil.copyfileobj(source, target)
+        meta = {'cursor': cursor, 'built': time.time(), 'built_at': datetime.now().isoformat(),
+                'raw_size': os.path.getsize(raw_path), 'size': os.path.getsize(f'{path}.tmp')}
+        os.remove(raw_path)
+        os.replace(f'{path}.tmp', path)
+        with open(f'{meta_path}.tmp', 'w') as handle:
+            json.dump(meta, handle)
+        os.replace(f'{meta_path}.tmp', meta_path)
+        print(f"📦 Built sync snapshot for {scope.user_id}: {meta['size']} bytes "
+              f"(cursor {cursor}, {time.perf_counter() - started:.2f}s)")
+        _purge(folder)
+    return path, meta
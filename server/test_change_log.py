@@ -0,0 +1,82 @@
+"""
+Tests for change_log.py: the sequence-based change feed and tombstone pruning
+"""
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import change_log
+import migrations
+
+NOW = '2024-01-01T00:00:00'
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'changes.db'))
+    conn.row_factory = sqlite3.Row
+    migrations.migrate(conn)
+    yield conn
+    conn.close()
+
+
+def _add_role(conn, role_id):
+    conn.execute('''
+        INSERT INTO roles (id, name, permissions, created_at, updated_at) VALUES (?, ?, '', ?, ?)
+    ''', (role_id, role_id, NOW, NOW))
+
+
+def test_changes_after_cursor(conn):
+    _add_role(conn, 'role_a')
+    cursor = change_log.current_cursor(conn)
+    _add_role(conn, 'role_b')
+    conn.execute("DELETE FROM roles WHERE id = 'role_a'")
+
+    changes = change_log.fetch_changes(conn, cursor)
+
+    assert [row['id'] for row in changes['tables']['roles']['upserts']] == ['role_b']
+    assert changes['tables']['roles']['deletes'] == ['role_a']
+    assert changes['cursor'] == change_log.current_cursor(conn)
+    assert not changes['full_resync']
+
+
+def test_changes_are_paged(conn):
+    for number in range(3):
+        _add_role(conn, f'role_{number}')
+
+    first = change_log.fetch_changes(conn, 0, limit=2)
+    rest = change_log.fetch_changes(conn, first['cursor'], limit=2)
+
+    assert first['has_more'] and not rest['has_more']
+    assert len(first['tables']['roles']['upserts']) == 2
+    assert [row['id'] for row in rest['tables']['roles']['upserts']] == ['role_2']
+
+
+def test_prune_old_tombstones_forces_full_resync_for_stale_cursors(conn):
+    _add_role(conn, 'role_old')
+    stale_cursor = change_log.current_cursor(conn)
+    conn.execute("DELETE FROM roles WHERE id = 'role_old'")
+    conn.execute("UPDATE sync_metadata SET updated_at = '2000-01-01T00:00:00' WHERE id = 'roles:role_old'")
+    recent_cursor = change_log.current_cursor(conn)
+    _add_role(conn, 'role_new')
+    conn.execute("DELETE FROM roles WHERE id = 'role_new'")
+
+    assert change_log.prune_tombstones_before(conn, '2020-01-01T00:00:00') == 1
+
+    assert change_log.fetch_changes(conn, stale_cursor)['full_resync']
+    recent = change_log.fetch_changes(conn, recent_cursor)
+    assert not recent['full_resync']
+    assert recent['tables']['roles']['deletes'] == ['role_new']
+
+
+def test_prune_without_old_tombstones_changes_nothing(conn):
+    _add_role(conn, 'role_a')
+    conn.execute("DELETE FROM roles WHERE id = 'role_a'")
+
+    assert change_log.prune_tombstones_before(conn, '2000-01-01T00:00:00') == 0
+    assert not change_log.fetch_changes(conn, 1)['full_resync']
@@ -0,0 +1,118 @@
+"""
+Tests for job_queue.py: leases, requeueing and unique enqueue
+"""
+
+import os
+import sqlite3
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import migrations
+from job_queue import JobQueue, QUEUED, RUNNING, SUCCEEDED
+
+
+@pytest.fixture
+def queue(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    conn = sqlite3.connect(path)
+    migrations.migrate(conn)
+    conn.close()
+
+    def connect():
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    queue = JobQueue(connect, workers=0)
+    queue.handler('noop')(lambda job: {'ok': True})
+    queue.owner = 'test-host:1:abc'
+    yield queue
+    queue.stop()
+
+
+def _set(queue, job_id, **fields):
+    assignments = ', '.join(f'{column} = ?' for column in fields)
+    queue._execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+
+def test_requeues_only_expired_leases(queue):
+    live = queue.enqueue('noop')
+    expired = queue.enqueue('noop')
+    unleased = queue.enqueue('noop')
+    _set(queue, live, status=RUNNING, claimed_by='other:2:def', lease_expires_at=time.time() + 60)
+    _set(queue, expired, status=RUNNING, claimed_by='gone:3:fed', lease_expires_at=time.time() - 1)
+    _set(queue, unleased, status=RUNNING)
+
+    assert queue.requeue_expired() == 2
+    assert queue.get(live)['status'] == RUNNING
+    assert queue.get(expired)['status'] == QUEUED
+    assert queue.get(expired)['claimed_by'] is None
+    assert queue.get(unleased)['status'] == QUEUED
+
+
+def test_start_leaves_jobs_of_live_processes_running(queue):
+    job_id = queue.enqueue('noop')
+    _set(queue, job_id, status=RUNNING, claimed_by='other:2:def', lease_expires_at=time.time() + 60)
+
+    queue.start()
+
+    assert queue.get(job_id)['status'] == RUNNING
+
+
+def test_claim_leases_job_to_owner(queue):
+    job_id = queue.enqueue('noop')
+
+    row = queue._claim()
+
+    assert row['id'] == job_id
+    assert row['claimed_by'] == queue.owner
+    assert row['lease_expires_at'] > time.time()
+
+
+def test_outcome_not_recorded_after_lease_lost(queue):
+    job_id = queue.enqueue('noop')
+    row = queue._claim()
+    _set(queue, job_id, claimed_by='other:2:def')
+
+    queue._run(row)
+
+    assert queue.get(job_id)['status'] == RUNNING
+
+
+def test_run_records_success(queue):
+    job_id = queue.enqueue('noop')
+
+    queue._run(queue._claim())
+
+    job = queue.get(job_id)
+    assert job['status'] == SUCCEEDED
+    assert job['result'] == {'ok': True}
+    assert job['lease_expires_at'] is None
+
+
+def test_unique_enqueue_skips_queued_or_running_duplicates(queue):
+    first = queue.enqueue('noop', unique=True)
+    assert first is not None
+    assert queue.enqueue('noop', unique=True) is None
+    assert queue.enqueue('noop', {'other': 'payload'}, unique=True) is not None
+
+    _set(queue, first, status=RUNNING)
+    assert queue.enqueue('noop', unique=True) is None
+
+    _set(queue, first, status=SUCCEEDED)
+    assert queue.enqueue('noop', unique=True) is not None
+
+
+def test_running_job_can_reschedule_itself(queue):
+    rescheduled = []
+    queue.handler('recurring')(lambda job: rescheduled.append(queue.enqueue('recurring', unique=True)))
+    queue.enqueue('recurring', unique=True)
+
+    queue._run(queue._claim())
+
+    assert rescheduled[0] is not None
+    assert queue.list(QUEUED, 'recurring')[0]['id'] == rescheduled[0]
@@ -0,0 +1,67 @@
+"""
+Tests for list_query.py: parsing list parameters into SQL pieces
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import list_query
+from list_query import ListQueryError
+
+
+def test_plain_requests_are_not_lists():
+    assert list_query.parse('users', {}) is None
+    assert list_query.parse('users', {'since': '2024-01-01', 'user_id': 'u1'}) is None
+
+
+def test_unknown_params_ignored_without_list_params():
+    assert list_query.parse('users', {'foo': '1', '_': '1700000000'}) is None
+
+
+def test_unknown_params_rejected_with_list_params():
+    with pytest.raises(ListQueryError, match='foo'):
+        list_query.parse('users', {'foo': '1', 'limit': '10'})
+    with pytest.raises(ListQueryError, match='lecturer_id'):
+        list_query.parse('users', {'department_id': 'd1', 'lecturer_id': 'u1'})
+
+
+def test_filters_are_bound_parameters():
+    page = list_query.parse('courses', {'level_id': 'level_100', 'department_id': 'd1,d2'})
+
+    assert page.conditions == ['level_id = ?', 'department_id IN (?, ?)']
+    assert page.params == ['level_100', 'd1', 'd2']
+    assert page.limit is None
+
+
+def test_role_name_lookup_is_case_insensitive():
+    page = list_query.parse('users', {'role': 'Student'})
+
+    assert page.conditions == ['role_id IN (SELECT id FROM roles WHERE LOWER(name) IN (?))']
+    assert page.params == ['student']
+
+
+def test_sort_with_default_and_descending():
+    assert list_query.parse('courses', {'limit': '5'}).order_by == 'code, id'
+    page = list_query.parse('users', {'sort': '-created_at,last_name'})
+    assert page.order_by == 'created_at DESC, last_name, id'
+    with pytest.raises(ListQueryError, match='password_hash'):
+        list_query.parse('users', {'sort': 'password_hash'})
+
+
+def test_fields_always_include_id():
+    assert list_query.parse('courses', {'fields': 'name,code'}).fields == ['id', 'name', 'code']
+    with pytest.raises(ListQueryError, match='password_hash'):
+        list_query.parse('users', {'fields': 'username,password_hash'})
+
+
+def test_paging_values():
+    page = list_query.parse('users', {'limit': '5000', 'offset': '20'})
+    assert (page.limit, page.offset) == (list_query.MAX_LIMIT, 20)
+    assert list_query.parse('users', {'offset': '10'}).limit == list_query.DEFAULT_LIMIT
+    for args in ({'limit': 'ten'}, {'offset': '-1'}):
+        with pytest.raises(ListQueryError):
+            list_query.parse('users', args)
@@ -0,0 +1,53 @@
+"""
+Tests for migrations.py: the client (app database) and server migration sets
+"""
+
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import migrations
+
+
+def _names(conn, kind):
+    return {row[0] for row in conn.execute('SELECT name FROM sqlite_master WHERE type = ?', (kind,))}
+
+
+def test_client_database_gets_only_client_migrations(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'app.db'))
+
+    applied = migrations.migrate(conn, client=True)
+
+    assert applied == [m.version for m in migrations.MIGRATIONS if m.client]
+    tables = _names(conn, 'table')
+    assert {'users', 'courses', 'enrollments', 'sync_metadata'} <= tables
+    assert not tables & {'jobs', 'downloads', 'sessions', 'sync_sequence', 'files_fts'}
+    # Nothing on the app side may write into its upload queue behind its back
+    triggers = [row[0] for row in conn.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger'")]
+    assert not [sql for sql in triggers if 'sync_metadata' in sql]
+
+
+def test_client_writes_do_not_enter_the_sync_queue(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'app.db'))
+    migrations.migrate(conn, client=True)
+
+    conn.execute('''
+        INSERT INTO roles (id, name, permissions, created_at, updated_at)
+        VALUES ('role_student', 'Student', '', '2024-01-01', '2024-01-01')
+    ''')
+
+    assert conn.execute('SELECT COUNT(*) FROM sync_metadata').fetchone()[0] == 0
+
+
+def test_server_database_gets_every_migration(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'server.db'))
+
+    client = sqlite3.connect(str(tmp_path / 'app.db'))
+    migrations.migrate(client, client=True)
+
+    assert migrations.migrate(conn) == [m.version for m in migrations.MIGRATIONS]
+    assert migrations.get_schema_version(conn) == migrations.LATEST_VERSION
+    assert _names(client, 'table') <= _names(conn, 'table') | _names(conn, 'view')
+    assert migrations.migrate(conn) == []
@@ -0,0 +1,100 @@
+"""
+Tests for search_index.py: file indexing and role-scoped ranked search
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import search_index
+
+
+@pytest.fixture
+def conn(campus, tmp_path):
+    (tmp_path / 'entropy.txt').write_text('Entropy always increases in an isolated system', encoding='utf-8')
+    conn = campus()
+    for file_id in search_index.unindexed_file_ids(conn):
+        search_index.index_file(conn, file_id)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _ids(results, search_type):
+    return [item['id'] for item in results[search_type]['items']]
+
+
+def test_build_match_query_quotes_words():
+    assert search_index.build_match_query('heat "transfer" OR') == '"heat" "transfer" "OR"'
+    assert search_index.build_match_query('therm', prefix=True) == '"therm"*'
+    assert search_index.build_match_query(' -- ') is None
+
+
+def test_index_file_records_status(conn):
+    assert search_index.stats(conn) == {'indexed': 1, 'missing_file': 1}
+    assert search_index.unindexed_file_ids(conn) == []
+    conn.execute("UPDATE files SET updated_at = '2999-01-01' WHERE id = 'file_thermo'")
+    assert search_index.unindexed_file_ids(conn) == ['file_thermo']
+    assert search_index.index_file(conn, 'file_gone') == 'missing'
+
+
+def test_file_contents_are_searchable(conn):
+    scope = search_index.scope_for_user(conn, 'user_admin')
+
+    results = search_index.search(conn, 'isolated', scope, types=['files'])
+
+    assert _ids(results, 'files') == ['file_thermo']
+    assert '[isolated]' in results['files']['items'][0]['snippet']
+
+
+def test_prefix_search_and_paging(conn):
+    scope = search_index.scope_for_user(conn, 'user_admin')
+
+    results = search_index.search(conn, 'thermo', scope, types=['courses'], limit=1)
+
+    assert _ids(results, 'courses') == ['course_thermo']
+    assert not results['courses']['has_more']
+    assert search_index.search(conn, 'thermo', scope, types=['courses'], prefix=False)['courses']['items'] == []
+
+
+def test_students_only_find_their_courses_files(conn):
+    student = search_index.scope_for_user(conn, 'user_stud1')
+    other = search_index.scope_for_user(conn, 'user_stud2')
+
+    assert _ids(search_index.search(conn, 'entropy', student, types=['files']), 'files') == ['file_thermo']
+    assert _ids(search_index.search(conn, 'entropy', other, types=['files']), 'files') == []
+    assert _ids(search_index.search(conn, 'kirchhoff', other, types=['files']), 'files') == ['file_circuit']
+
+
+def test_announcements_follow_course_targets(conn):
+    enrolled = search_index.scope_for_user(conn, 'user_stud1')
+    other = search_index.scope_for_user(conn, 'user_stud2')
+
+    assert _ids(search_index.search(conn, 'quiz', enrolled, types=['announcements']),
+                'announcements') == ['ann_thermo']
+    assert _ids(search_index.search(conn, 'quiz', other, types=['announcements']), 'announcements') == []
+    assert _ids(search_index.search(conn, 'library', other, types=['announcements']),
+                'announcements') == ['ann_all']
+
+
+def test_user_search_is_scoped(conn):
+    lecturer = search_index.scope_for_user(conn, 'user_lect1')
+    student = search_index.scope_for_user(conn, 'user_stud1')
+
+    assert _ids(search_index.search(conn, 'sade', lecturer, types=['users']), 'users') == ['user_stud1']
+    assert _ids(search_index.search(conn, 'tayo', lecturer, types=['users']), 'users') == []
+    assert _ids(search_index.search(conn, 'lola', student, types=['users']), 'users') == ['user_lect1']
+    assert _ids(search_index.search(conn, 'kunle', student, types=['users']), 'users') == []
+    assert 'email' not in search_index.search(conn, 'sade', lecturer, types=['users'])['users']['items'][0]
+
+
+def test_anonymous_callers_only_search_courses(conn):
+    scope = search_index.scope_for_user(conn, None)
+
+    results = search_index.search(conn, 'entropy thermodynamics', scope)
+
+    assert list(results) == ['courses']
+    assert search_index.scope_for_user(conn, 'user_nobody').user_id is None
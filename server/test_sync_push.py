@@ -0,0 +1,124 @@
+"""
+Tests for sync_push.py: batched operations, authorization and idempotency keys
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import sync_push
+from search_index import scope_for_user
+from sync_scope import SyncScope
+
+NOW = '2024-02-01T00:00:00'
+
+
+@pytest.fixture
+def conn(campus):
+    conn = campus()
+    yield conn
+    conn.close()
+
+
+def _push(conn, user_id, operations):
+    scope = SyncScope(scope_for_user(conn, user_id))
+    return sync_push.apply_operations(conn, scope, sync_push.prepare(conn, scope, operations), NOW)
+
+
+def _announcement(key, title='Lab moved'):
+    return {'key': key, 'table': 'announcements', 'op': 'create', 'id': f'ann_{key}',
+            'data': {'title': title, 'content': 'Room 2', 'target_courses': ['course_thermo']}}
+
+
+def test_operations_apply_in_order(conn):
+    results = _push(conn, 'user_lect1', [
+        _announcement('k1'),
+        {'key': 'k2', 'table': 'announcements', 'op': 'update', 'id': 'ann_k1', 'data': {'title': 'Lab moved again'}},
+    ])
+
+    assert [(r['index'], r['status']) for r in results] == [(0, 'created'), (1, 'updated')]
+    row = conn.execute("SELECT title, author_id, target_courses FROM announcements WHERE id = 'ann_k1'").fetchone()
+    assert tuple(row) == ('Lab moved again', 'user_lect1', 'course_thermo')
+
+
+def test_repeated_keys_are_replayed_not_reapplied(conn):
+    first = _push(conn, 'user_lect1', [_announcement('k1')])
+    conn.execute("DELETE FROM announcements WHERE id = 'ann_k1'")
+    conn.commit()
+
+    again = _push(conn, 'user_lect1', [_announcement('k1')])
+
+    assert first[0]['status'] == 'created' and 'replayed' not in first[0]
+    assert again[0]['status'] == 'created' and again[0]['replayed'] is True
+    assert conn.execute("SELECT COUNT(*) FROM announcements WHERE id = 'ann_k1'").fetchone()[0] == 0
+
+
+def test_keys_are_per_user(conn):
+    _push(conn, 'user_lect1', [_announcement('k1')])
+
+    results = _push(conn, 'user_lect2', [dict(_announcement('k1'), id='ann_other')])
+
+    assert 'replayed' not in results[0]
+    assert conn.execute("SELECT author_id FROM announcements WHERE id = 'ann_other'").fetchone()[0] == 'user_lect2'
+
+
+def test_failed_operations_are_isolated_and_not_stored(conn):
+    results = _push(conn, 'user_stud1', [
+        {'key': 'k1', 'table': 'courses', 'op': 'update', 'id': 'course_thermo', 'data': {'name': 'Hacked'}},
+        {'key': 'k2', 'table': 'users', 'op': 'update', 'id': 'user_stud1', 'data': {'first_name': 'Sadia'}},
+        {'key': 'k3', 'table': 'users', 'op': 'update', 'id': 'user_stud1', 'data': {'first_name': {'a': 1}}},
+        {'key': 'k4', 'table': 'files', 'op': 'delete', 'id': 'file_thermo'},
+    ])
+
+    assert [(r['status'], r.get('code')) for r in results] == [
+        ('error', 403), ('updated', None), ('error', 500), ('error', 400)]
+    assert conn.execute("SELECT name FROM courses WHERE id = 'course_thermo'").fetchone()[0] == 'Thermodynamics'
+    assert conn.execute("SELECT first_name FROM users WHERE id = 'user_stud1'").fetchone()[0] == 'Sadia'
+    stored = [row[0] for row in conn.execute('SELECT key FROM sync_push_keys ORDER BY key')]
+    assert stored == ['k2']
+
+
+def test_bad_operation_data_is_reported(conn):
+    results = _push(conn, 'user_lect1', [
+        dict(_announcement('k1'), data={'title': 'x', 'content': 'y', 'target_roles': [1, 2]}),
+        _announcement('k2'),
+    ])
+
+    assert results[0]['status'] == 'error' and results[0]['code'] == 400
+    assert results[1]['status'] == 'created'
+
+
+def test_lecturers_only_enroll_into_their_courses(conn):
+    results = _push(conn, 'user_lect1', [
+        {'key': 'k1', 'table': 'user_courses', 'op': 'create',
+         'data': {'user_id': 'user_stud2', 'course_id': 'course_thermo'}},
+        {'key': 'k2', 'table': 'user_courses', 'op': 'create',
+         'data': {'user_id': 'user_stud1', 'course_id': 'course_circuit'}},
+        {'key': 'k3', 'table': 'user_courses', 'op': 'create',
+         'data': {'user_id': 'user_stud1', 'course_id': 'course_thermo'}},
+    ])
+
+    assert [r['status'] for r in results] == ['created', 'error', 'unchanged']
+    assert results[1]['code'] == 403
+
+
+def test_passwords_are_only_hashed_when_they_may_be_set(conn):
+    scope = SyncScope(scope_for_user(conn, 'user_stud1'))
+
+    own, other = sync_push.prepare(conn, scope, [
+        {'table': 'users', 'op': 'update', 'id': 'user_stud1', 'data': {'password': 'new-secret'}},
+        {'table': 'users', 'op': 'update', 'id': 'user_stud2', 'data': {'password': 'new-secret'}},
+    ])
+
+    assert 'password' not in own['data'] and own['data']['_password_hash']
+    assert other['data'] == {}
+
+
+def test_malformed_batches_are_rejected(conn):
+    scope = SyncScope(scope_for_user(conn, 'user_admin'))
+    for operations in (None, [], ['not an object'], [{'table': 'users', 'data': 'text'}]):
+        with pytest.raises(sync_push.PushError):
+            sync_push.prepare(conn, scope, operations)
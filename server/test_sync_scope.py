@@ -0,0 +1,119 @@
+"""
+Tests for sync_scope.py and sessions.py: who the caller is and which rows they may sync
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import change_log
+import sessions
+import sync_scope
+
+
+class FakeRequest:
+    def __init__(self, token=None):
+        self.headers = {'Authorization': f'Bearer {token}'} if token else {}
+
+
+@pytest.fixture
+def conn(campus):
+    conn = campus()
+    yield conn
+    conn.close()
+
+
+def _scope(conn, user_id):
+    token = sessions.create(conn, user_id)
+    return sync_scope.scope_for_request(conn, FakeRequest(token))
+
+
+def _visible(conn, scope, table):
+    columns, params = scope.columns(table)
+    condition, condition_params = scope.filter(table)
+    query = f'SELECT {columns} FROM {table}'
+    if condition:
+        query += f' WHERE {condition}'
+    return {row['id']: dict(row) for row in conn.execute(query, [*params, *condition_params])}
+
+
+def test_session_tokens_identify_the_caller(conn):
+    token = sessions.create(conn, 'user_stud1')
+
+    assert sync_scope.caller_id(conn, FakeRequest(token)) == 'user_stud1'
+    assert sync_scope.caller_id(conn, FakeRequest('user_stud1')) is None
+    assert sync_scope.caller_id(conn, FakeRequest()) is None
+    assert conn.execute('SELECT COUNT(*) FROM sessions WHERE token_hash = ?', (token,)).fetchone()[0] == 0
+
+
+def test_sessions_end_on_logout_expiry_and_deactivation(conn):
+    revoked = sessions.create(conn, 'user_stud1')
+    expired = sessions.create(conn, 'user_stud1', now=datetime.now() - timedelta(days=sessions.SESSION_DAYS + 1))
+    deactivated = sessions.create(conn, 'user_stud2')
+
+    assert sessions.revoke(conn, revoked)
+    conn.execute("UPDATE users SET is_active = 0 WHERE id = 'user_stud2'")
+
+    for token in (revoked, expired, deactivated):
+        assert sessions.user_id_for(conn, token) is None
+    assert sessions.purge_expired(conn) == 1
+
+
+def test_anonymous_callers_see_only_public_tables(conn):
+    scope = sync_scope.scope_for_request(conn, FakeRequest())
+
+    assert not scope.authenticated
+    assert _visible(conn, scope, 'courses') == {}
+    assert _visible(conn, scope, 'users') == {}
+    assert len(_visible(conn, scope, 'roles')) == 3
+
+
+def test_admins_see_everything(conn):
+    scope = _scope(conn, 'user_admin')
+
+    assert len(_visible(conn, scope, 'users')) == 5
+    assert len(_visible(conn, scope, 'courses')) == 2
+    assert 'password_hash' not in next(iter(_visible(conn, scope, 'users').values()))
+    assert _visible(conn, scope, 'users')['user_stud1']['email'] == 'stud1@example.com'
+
+
+def test_students_see_their_courses_and_lecturers(conn):
+    scope = _scope(conn, 'user_stud1')
+
+    assert set(_visible(conn, scope, 'courses')) == {'course_thermo'}
+    assert set(_visible(conn, scope, 'files')) == {'file_thermo'}
+    assert set(_visible(conn, scope, 'user_courses')) == {'uc_1'}
+    assert set(_visible(conn, scope, 'announcements')) == {'ann_thermo', 'ann_all'}
+    users = _visible(conn, scope, 'users')
+    assert set(users) == {'user_stud1', 'user_lect1'}
+    assert users['user_stud1']['email'] == 'stud1@example.com'
+    assert users['user_lect1']['email'] is None
+
+
+def test_lecturers_see_the_courses_they_teach_and_their_students(conn):
+    scope = _scope(conn, 'user_lect1')
+
+    assert set(_visible(conn, scope, 'courses')) == {'course_thermo'}
+    assert set(_visible(conn, scope, 'user_courses')) == {'uc_1'}
+    assert set(_visible(conn, scope, 'users')) == {'user_admin', 'user_lect1', 'user_lect2', 'user_stud1'}
+
+
+def test_hidden_user_columns_are_rejected(conn):
+    scope = _scope(conn, 'user_stud1')
+
+    with pytest.raises(ValueError):
+        scope.columns('users', ['id', 'last_sync'])
+
+
+def test_enrollment_changes_reach_the_change_log(conn):
+    cursor = change_log.current_cursor(conn)
+
+    conn.execute("DELETE FROM user_courses WHERE id = 'uc_1'")
+    changes = change_log.fetch_changes(conn, cursor, scope=_scope(conn, 'user_stud1'))
+
+    assert 'course_thermo' in changes['tables']['courses']['deletes']
+    assert 'file_thermo' in changes['tables']['files']['deletes']
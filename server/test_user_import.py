@@ -0,0 +1,129 @@
+"""
+Tests for user_import.py: file parsing, row validation and the error report
+"""
+
+import os
+import sqlite3
+import sys
+
+import pytest
+from werkzeug.security import check_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import migrations
+from user_import import ImportFileError, UserImporter, iter_records
+
+NOW = '2024-01-01T00:00:00'
+HEADER = 'username,email,first_name,last_name,role_id,level_id,password\n'
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'import.db'))
+    conn.row_factory = sqlite3.Row
+    migrations.migrate(conn)
+    conn.execute("INSERT INTO roles (id, name, permissions, created_at, updated_at) "
+                 "VALUES ('role_student', 'Student', '', ?, ?)", (NOW, NOW))
+    conn.execute("INSERT INTO levels (id, name, created_at, updated_at) "
+                 "VALUES ('level_100', '100 Level', ?, ?)", (NOW, NOW))
+    conn.execute('''
+        INSERT INTO users (id, username, email, password_hash, role_id, first_name, last_name,
+                           created_at, updated_at)
+        VALUES ('user_taken', 'Taken', 'Taken@example.com', 'x', 'role_student', 'T', 'U', ?, ?)
+    ''', (NOW, NOW))
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _csv(tmp_path, body, name='users.csv'):
+    path = tmp_path / name
+    path.write_text(HEADER + body, encoding='utf-8')
+    return str(path)
+
+
+def _import(conn, path):
+    importer = UserImporter(conn, batch_size=2, workers=1, default_password_hash='default-hash')
+    return importer, importer.run(path)
+
+
+def test_valid_rows_are_imported(conn, tmp_path):
+    path = _csv(tmp_path, 'ada,ada@example.com,Ada,Obi,role_student,level_100,secret1\n'
+                          'bola,bola@example.com,Bola,Ade,role_student,,\n')
+
+    importer, stats = _import(conn, path)
+
+    assert (stats['processed'], stats['imported'], stats['failed']) == (2, 2, 0)
+    rows = {row['username']: row for row in conn.execute('SELECT * FROM users')}
+    assert check_password_hash(rows['ada']['password_hash'], 'secret1')
+    assert rows['bola']['password_hash'] == 'default-hash'
+    assert rows['ada']['level_id'] == 'level_100' and rows['bola']['level_id'] is None
+
+
+def test_invalid_rows_are_reported_and_skipped(conn, tmp_path):
+    path = _csv(tmp_path, ',x@example.com,No,Name,role_student,,\n'
+                          'bad,not-an-email,Bad,Email,role_student,,\n'
+                          'role,role@example.com,No,Role,role_ghost,,\n'
+                          'level,level@example.com,No,Level,role_student,level_900,\n'
+                          'dup,dup@example.com,Dup,One,role_student,,\n'
+                          'DUP,dup2@example.com,Dup,Two,role_student,,\n'
+                          'fresh,TAKEN@example.com,Email,Taken,role_student,,\n'
+                          'TAKEN,new@example.com,Name,Taken,role_student,,\n')
+
+    importer, stats = _import(conn, path)
+
+    assert (stats['processed'], stats['imported'], stats['failed']) == (8, 1, 7)
+    errors = {error['row']: error['error'] for error in importer.errors}
+    assert errors == {
+        2: 'username is required',
+        3: 'email is invalid',
+        4: "unknown role_id 'role_ghost'",
+        5: "unknown level_id 'level_900'",
+        7: 'username appears earlier in the file',
+        8: 'email already exists',
+        9: 'username already exists',
+    }
+    assert conn.execute("SELECT COUNT(*) FROM users WHERE username = 'dup'").fetchone()[0] == 1
+    report = importer.errors_csv().splitlines()
+    assert report[0] == 'row,username,email,error'
+    assert report[1] == '2,,x@example.com,username is required'
+
+
+def test_password_required_without_default(conn, tmp_path):
+    path = _csv(tmp_path, 'nopass,nopass@example.com,No,Pass,role_student,,\n')
+
+    importer = UserImporter(conn, workers=1)
+    stats = importer.run(path)
+
+    assert stats['imported'] == 0
+    assert importer.errors[0]['error'] == 'password is required'
+
+
+def test_file_level_errors(tmp_path):
+    missing = tmp_path / 'missing.csv'
+    missing.write_text('username,email\nada,ada@example.com\n', encoding='utf-8')
+    with pytest.raises(ImportFileError, match='first_name, last_name, role_id'):
+        list(iter_records(str(missing)))
+
+    with pytest.raises(ImportFileError, match='Unsupported'):
+        list(iter_records(str(tmp_path / 'users.txt')))
+
+    empty = tmp_path / 'empty.csv'
+    empty.write_text('', encoding='utf-8')
+    with pytest.raises(ImportFileError, match='empty'):
+        list(iter_records(str(empty)))
+
+
+def test_records_skip_blank_rows_and_unknown_columns(tmp_path):
+    path = tmp_path / 'users.csv'
+    path.write_text('Username, Email ,first_name,last_name,role_id,notes\n'
+                    'ada,ada@example.com,Ada,Obi,role_student,ignored\n'
+                    ',,,,,\n'
+                    'bola,bola@example.com,Bola,Ade,role_student,\n', encoding='utf-8')
+
+    records = list(iter_records(str(path)))
+
+    assert [row for row, _ in records] == [2, 4]
+    assert records[0][1] == {'username': 'ada', 'email': 'ada@example.com', 'first_name': 'Ada',
+                             'last_name': 'Obi', 'role_id': 'role_student'}
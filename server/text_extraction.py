@@ -0,0 +1,171 @@
+"""
+Plain-text extraction from uploaded course files
+
+Office Open XML files (docx, pptx, xlsx) are zip archives of XML parts, so
+they are read with the standard library. PDFs use the optional `pypdf`
+package when it is installed; otherwise a basic built-in reader pulls the
+text operators out of the page streams, which covers most PDFs exported
+from word processors but not scanned documents.
+
+    text, extractor = extract_text(path)
+
+raises UnsupportedFileType for anything else. Output is capped at
+MAX_CHARS characters.
+"""
+
+import csv
+import os
+import re
+import zipfile
+import zlib
+from xml.etree import ElementTree
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+MAX_CHARS = 1_000_000
+
+
+class UnsupportedFileType(Exception):
+    pass
+
+
+def _cap(parts):
+    text = '\n'.join(part for part in parts if part)
+    return text[:MAX_CHARS]
+
+
+def _xml_text(data, text_tag, break_tag):
+    """Text of every <text_tag> element, with a newline after each <break_tag>"""
+    parts = []
+    for element in ElementTree.fromstring(data).iter():
+        tag = element.tag.rsplit('}', 1)[-1]
+        if tag == text_tag and element.text:
+            parts.append(element.text)
+        elif tag == break_tag:
+            parts.append('\n')
+    return ''.join(parts)
+
+
+def _extract_txt(path):
+    with open(path, encoding='utf-8', errors='replace') as handle:
+        return handle.read(MAX_CHARS)
+
+
+def _extract_csv(path):
+    parts = []
+    size = 0
+    with open(path, newline='', encoding='utf-8', errors='replace') as handle:
+        for row in csv.reader(handle):
+            line = ' '.join(cell for cell in row if cell)
+            parts.append(line)
+            size += len(line)
+            if size >= MAX_CHARS:
+                break
+    return _cap(parts)
+
+
+def _extract_docx(path):
+    with zipfile.ZipFile(path) as archive:
+        names = ['word/document.xml'] + sorted(
+            name for name in archive.namelist()
+            if re.match(r'word/(header|footer|footnotes)\d*\.xml$', name)
+        )
+        return _cap(_xml_text(archive.read(name), 't', 'p')
+                    for name in names if name in archive.namelist())
+
+
+def _extract_pptx(path):
+    with zipfile.ZipFile(path) as archive:
+        slides = sorted(
+            (name for name in archive.namelist() if re.match(r'ppt/(slides/slide|notesSlides/notesSlide)\d+\.xml$', name)),
+            key=lambda name: (name.startswith('ppt/notesSlides'), int(re.search(r'(\d+)\.xml$', name).group(1)))
+        )
+        return _cap(_xml_text(archive.read(name), 't', 'p') for name in slides)
+
+
+def _extract_xlsx(path):
+    with zipfile.ZipFile(path) as archive:
+        names = archive.namelist()
+        parts = []
+        # Cell text lives in the shared string table; numbers are not worth indexing
+        if 'xl/sharedStrings.xml' in names:
+            parts.append(_xml_text(archive.read('xl/sharedStrings.xml'), 't', 'si'))
+        for name in sorted(n for n in names if re.match(r'xl/worksheets/sheet\d+\.xml$', n)):
+            # Inline strings are stored in the sheet itself
+            parts.append(_xml_text(archive.read(name), 't', 'row'))
+        return _cap(parts)
+
+
+_PDF_STREAM = re.compile(rb'stream\r?\n(.*?)\r?\nendstream', re.S)
+_PDF_TEXT = re.compile(rb'\((?:\\.|[^\\)])*\)\s*Tj|\[(?:\\.|[^\]])*\]\s*TJ|T\*|ET')
+_PDF_STRING = re.compile(rb'\(((?:\\.|[^\\)])*)\)')
+_PDF_ESCAPES = {b'n': b'\n', b'r': b'', b't': b' ', b'(': b'(', b')': b')', b'\\': b'\\'}
+
+
+def _pdf_unescape(raw):
+    raw = re.sub(rb'\\([0-7]{1,3})', lambda m: bytes([int(m.group(1), 8) & 0xFF]), raw)
+    return re.sub(rb'\\(.)', lambda m: _PDF_ESCAPES.get(m.group(1), m.group(1)), raw)
+
+
+def _extract_pdf_builtin(path):
+    with open(path, 'rb') as handle:
+        data = handle.read()
+    parts = []
+    for match in _PDF_STREAM.finditer(data):
+        stream = match.group(1)
+        try:
+            stream = zlib.decompress(stream)
+        except zlib.error:
+            pass
+        for operator in _PDF_TEXT.finditer(stream):
+            token = operator.group(0)
+            if token in (b'T*', b'ET'):
+                parts.append('\n')
+                continue
+            for string in _PDF_STRING.findall(token):
+                parts.append(_pdf_unescape(string).decode('latin-1'))
+    return _cap([''.join(parts)])
+
+
+def _extract_pdf(path):
+    if pypdf is None:
+        return _extract_pdf_builtin(path)
+    reader = pypdf.PdfReader(path)
+    parts = []
+    size = 0
+    for page in reader.pages:
+        text = page.extract_text() or ''
+        parts.append(text)
+        size += len(text)
+        if size >= MAX_CHARS:
+            break
+    return _cap(parts)
+
+
+EXTRACTORS = {
+    '.txt': _extract_txt,
+    '.csv': _extract_csv,
+    '.docx': _extract_docx,
+    '.pptx': _extract_pptx,
+    '.xlsx': _extract_xlsx,
+    '.pdf': _extract_pdf,
+}
+
+
+def can_extract(path):
+    return os.path.splitext(path)[1].lower() in EXTRACTORS
+
+
+def extract_text(path):
+    """Return (text, extractor name) for a supported file"""
+    extension = os.path.splitext(path)[1].lower()
+    extractor = EXTRACTORS.get(extension)
+    if extractor is None:
+        raise UnsupportedFileType(extension)
+    name = extension[1:]
+    if extension == '.pdf':
+        name = 'pypdf' if pypdf is not None else 'pdf-builtin'
+    return extractor(path), name
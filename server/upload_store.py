@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Sharded upload storage with cached per-course manifests
+
+Uploaded files used to be written flat into uploads/<course_id>/, and every
+listing ran os.listdir plus a stat per file. Now:
+
+- New files go to uploads/<course_id>/<shard>/<name>, where <shard> is the
+  first two hex digits of the SHA-1 of the name. That keeps directories
+  small (256 shards per course). Download URLs are still
+  /uploads/<course_id>/<name>, and files in the old flat layout are still
+  found.
+- Each course has a manifest, manifests/<course_id>.json, with the name,
+  relative path, size, SHA-256 and mtime of every file. Uploads and deletes
+  update it, so a listing is served from memory or from one small file read.
+  The copy in memory is reused while the manifest file's mtime is unchanged.
+- The manifest also records the mtimes of the course folder and its shards.
+  At most every RESCAN_INTERVAL seconds a listing compares them with the
+  folders, and if files were copied in or removed outside the API the
+  folder is scanned again. A missing manifest is built the same way.
+  Scans only stat files; new files are listed with "sha256": null and
+  hashed later by hash_missing(), which the app runs on its job queue
+  (the hash_later callback).
+
+Move existing flat files into shards (and update their paths in the
+database) with:
+
+    python upload_store.py --uploads uploads --db velocityver.db
+
+Add --rebuild to scan and hash every course folder again instead.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from werkzeug.security import safe_join
+
+SHARD_LENGTH = 2
+RESCAN_INTERVAL = 30
+
+
+def shard_for(name):
+    return hashlib.sha1(name.encode('utf-8')).hexdigest()[:SHARD_LENGTH]
+
+
+def _is_shard(name):
+    return len(name) == SHARD_LENGTH and all(c in '0123456789abcdef' for c in name)
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _entry(course_dir, relative_path, stat=None, digest=True):
+    path = os.path.join(course_dir, relative_path)
+    stat = stat or os.stat(path)
+    return {
+        'name': os.path.basename(relative_path),
+        'path': relative_path.replace(os.sep, '/'),
+        'size': stat.st_size,
+        'sha256': file_digest(path) if digest else None,
+        'mtime': stat.st_mtime,
+    }
+
+
+class _Manifest:
+    __slots__ = ('mtime', 'files', 'dirs', 'checked')
+
+    def __init__(self, mtime, files, dirs, checked):
+        self.mtime = mtime
+        self.files = files
+        self.dirs = dirs
+        self.checked = checked
+
+
+class UploadStore:
+    def __init__(self, root, manifest_folder, hash_later=None, rescan_interval=RESCAN_INTERVAL):
+        self.root = root
+        self.manifest_folder = manifest_folder
+        # Called with a course id whose manifest has files without a hash;
+        # expected to run hash_missing(course_id) soon. Without it listings
+        # hash them in place.
+        self.hash_later = hash_later
+        self.rescan_interval = rescan_interval
+        # course_id -> _Manifest
+        self._manifests = {}
+        # course_id -> when hashing was last requested; another process may
+        # run the job, so a request older than rescan_interval is repeated
+        self._pending = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock_for(self, course_id):
+        with self._locks_guard:
+            return self._locks.setdefault(course_id, threading.Lock())
+
+    def course_dir(self, course_id):
+        return safe_join(self.root, course_id)
+
+    def path_for(self, course_id, name):
+        """Where a new upload called name is stored (the shard is created)"""
+        shard_dir = safe_join(self.root, course_id, shard_for(name))
+        if shard_dir is None or safe_join(shard_dir, name) is None:
+            raise ValueError(f"Invalid upload location: {course_id}/{name}")
+        os.makedirs(shard_dir, exist_ok=True)
+        return os.path.join(shard_dir, name)
+
+    def resolve(self, course_id, name):
+        """Path of the stored file, in the sharded or the old flat layout, or None"""
+        for path in (safe_join(self.root, course_id, shard_for(name), name),
+                     safe_join(self.root, course_id, name)):
+            if path is not None and os.path.isfile(path):
+                return path
+        return None
+
+    def _manifest_path(self, course_id):
+        return safe_join(self.manifest_folder, f'{course_id}.json')
+
+    def _dir_mtimes(self, course_id):
+        """{'.' or shard: mtime_ns} of the course folder and its shards"""
+        course_dir = self.course_dir(course_id)
+        if course_dir is None or not os.path.isdir(course_dir):
+            return {}
+        dirs = {'.': os.stat(course_dir).st_mtime_ns}
+        for item in os.scandir(course_dir):
+            if item.is_dir() and _is_shard(item.name):
+                dirs[item.name] = item.stat().st_mtime_ns
+        return dirs
+
+    def _scan(self, course_id, previous=None):
+        """({name: entry}, dir mtimes) from the course folder
+
+        Hashes are kept from previous for files whose size and mtime did not
+        change; other files get "sha256": None.
+        """
+        course_dir = self.course_dir(course_id)
+        previous = previous or {}
+        files = {}
+        dirs = self._dir_mtimes(course_id)
+        if not dirs:
+            return files, dirs
+
+        def entry(relative_path, item):
+            new = _entry(course_dir, relative_path, item.stat(), digest=False)
+            old = previous.get(item.name)
+            if old and old['path'] == new['path'] and old['size'] == new['size'] and old['mtime'] == new['mtime']:
+                new['sha256'] = old['sha256']
+            return new
+
+        flat = []
+        for item in os.scandir(course_dir):
+            if item.is_file():
+                flat.append(item)
+            elif item.is_dir() and _is_shard(item.name):
+                for sharded in os.scandir(item.path):
+                    if sharded.is_file():
+                        files[sharded.name] = entry(os.path.join(item.name, sharded.name), sharded)
+        # A sharded copy wins over a flat file of the same name
+        for item in flat:
+            if item.name not in files:
+                files[item.name] = entry(item.name, item)
+        return files, dirs
+
+    def _save(self, course_id, files, dirs=None):
+        path = self._manifest_path(course_id)
+        if path is None:
+            return
+        if dirs is None:
+            dirs = self._dir_mtimes(course_id)
+        os.makedirs(self.manifest_folder, exist_ok=True)
+        with open(f'{path}.tmp', 'w') as handle:
+            json.dump({'course_id': course_id, 'built_at': datetime.now().isoformat(),
+                       'dirs': dirs, 'files': files}, handle)
+        os.replace(f'{path}.tmp', path)
+        self._manifests[course_id] = _Manifest(os.stat(path).st_mtime_ns, files, dirs, time.monotonic())
+
+    def _rescan(self, course_id, previous):
+        started = time.perf_counter()
+        files, dirs = self._scan(course_id, previous)
+        self._save(course_id, files, dirs)
+        unhashed = sum(1 for entry in files.values() if entry['sha256'] is None)
+        print(f"🗂️  Scanned uploads of {course_id}: {len(files)} files, {unhashed} to hash "
+              f"({time.perf_counter() - started:.2f}s)")
+        if unhashed:
+            self._request_hashing(course_id)
+        return files
+
+    def _request_hashing(self, course_id):
+        if self.hash_later is None:
+            return
+        now = time.monotonic()
+        with self._locks_guard:
+            if now - self._pending.get(course_id, -self.rescan_interval) < self.rescan_interval:
+                return
+            self._pending[course_id] = now
+        self.hash_later(course_id)
+
+    def _load(self, course_id):
+        """{name: entry} of the course, from memory, the manifest file or a scan"""
+        path = self._manifest_path(course_id)
+        if path is None:
+            return {}
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return self._rescan(course_id, None)
+        cached = self._manifests.get(course_id)
+        if cached is None or cached.mtime != mtime:
+            with open(path) as handle:
+                manifest = json.load(handle)
+            # Manifests written before dirs were recorded are scanned once
+            cached = _Manifest(mtime, manifest['files'], manifest.get('dirs'), time.monotonic())
+            self._manifests[course_id] = cached
+            if cached.dirs is None:
+                return self._rescan(course_id, cached.files)
+            if any(entry['sha256'] is None for entry in cached.files.values()):
+                self._request_hashing(course_id)
+        elif time.monotonic() - cached.checked < self.rescan_interval:
+            return cached.files
+        cached.checked = time.monotonic()
+        if self._dir_mtimes(course_id) != cached.dirs:
+            return self._rescan(course_id, cached.files)
+        return cached.files
+
+    def manifest(self, course_id):
+        """{name: {name, path, size, sha256, mtime}} for the files of a course.
+        The dict is shared; do not modify it. sha256 is None until hashed."""
+        with self._lock_for(course_id):
+            files = self._load(course_id)
+        if self.hash_later is None and any(entry['sha256'] is None for entry in files.values()):
+            self.hash_missing(course_id)
+            with self._lock_for(course_id):
+                files = self._load(course_id)
+        return files
+
+    def hash_missing(self, course_id):
+        """Fill in the SHA-256 of every listed file that has none; returns how
+        many were hashed. The files are read without holding the course lock."""
+        with self._locks_guard:
+            self._pending.pop(course_id, None)
+        with self._lock_for(course_id):
+            todo = [dict(entry) for entry in self._load(course_id).values() if entry['sha256'] is None]
+        course_dir = self.course_dir(course_id)
+        digests = {}
+        for entry in todo:
+            try:
+                digests[entry['name']] = file_digest(os.path.join(course_dir, entry['path']))
+            except FileNotFoundError:
+                continue
+        if not digests:
+            return 0
+        with self._lock_for(course_id):
+            files = dict(self._load(course_id))
+            hashed = 0
+            for entry in todo:
+                current = files.get(entry['name'])
+                if entry['name'] in digests and current == entry:
+                    files[entry['name']] = dict(current, sha256=digests[entry['name']])
+                    hashed += 1
+            if hashed:
+                self._save(course_id, files, self._manifests[course_id].dirs)
+        return hashed
+
+    def add(self, course_id, name):
+        """Record a file just stored at path_for(course_id, name)"""
+        with self._lock_for(course_id):
+            files = dict(self._load(course_id))
+            path = self.resolve(course_id, name)
+            if path is not None:
+                files[name] = _entry(self.course_dir(course_id),
+                                     os.path.relpath(path, self.course_dir(course_id)))
+            self._save(course_id, files)
+            return files.get(name)
+
+    def delete(self, course_id, name):
+        """Remove the stored file and its manifest entry; True if a file was removed"""
+        with self._lock_for(course_id):
+            files = dict(self._load(course_id))
+            path = self.resolve(course_id, name)
+            if path is not None:
+                os.remove(path)
+            files.pop(name, None)
+            self._save(course_id, files)
+            return path is not None
+
+    def rebuild(self, course_id):
+        """Scan and hash the course folder again, ignoring the manifest"""
+        with self._lock_for(course_id):
+            files, dirs = self._scan(course_id)
+            self._save(course_id, files, dirs)
+        self.hash_missing(course_id)
+        with self._lock_for(course_id):
+            return self._load(course_id)
+
+    def relayout(self, conn=None):
+        """Move flat files into their shards and rebuild the manifests
+
+        With conn, files.file_path/server_path pointing at a moved file are
+        updated too (the caller commits). Returns the number of files moved.
+        """
+        moved = 0
+        if not os.path.isdir(self.root):
+            return moved
+        for course in os.scandir(self.root):
+            if not course.is_dir():
+                continue
+            with self._lock_for(course.name):
+                for item in os.scandir(course.path):
+                    if not item.is_file():
+                        continue
+                    target = self.path_for(course.name, item.name)
+                    os.replace(item.path, target)
+                    if conn is not None:
+                        conn.execute('UPDATE files SET file_path = ? WHERE file_path = ?', (target, item.path))
+                        conn.execute('UPDATE files SET server_path = ? WHERE server_path = ?', (target, item.path))
+                    moved += 1
+                self._save(course.name, *self._scan(course.name))
+            self.hash_missing(course.name)
+        return moved
+
+    def course_ids(self):
+        if not os.path.isdir(self.root):
+            return []
+        return [item.name for item in os.scandir(self.root) if item.is_dir()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move flat uploads into the sharded layout')
+    parser.add_argument('--uploads', default='uploads', help='Upload folder')
+    parser.add_argument('--manifests', default='manifests', help='Manifest folder')
+    parser.add_argument('--db', help='SQLite database whose file paths should be updated')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Only rebuild every course manifest from its folder')
+    args = parser.parse_args()
+
+    store = UploadStore(args.uploads, args.manifests)
+    if args.rebuild:
+        for course_id in store.course_ids():
+            files = store.rebuild(course_id)
+            print(f"🗂️  {course_id}: {len(files)} files")
+        return
+    conn = sqlite3.connect(args.db) if args.db else None
+    try:
+        moved = store.relayout(conn)
+        if conn is not None:
+            conn.commit()
+    finally:
+        if conn is not None:
+            conn.close()
+    print(f"✅ Moved {moved} files into shards under {args.uploads}")
+
+
+if __name__ == '__main__':
+    main()
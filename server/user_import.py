@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Bulk user import from CSV or XLSX
+
+The file is parsed as a stream and processed in chunks:
+  1. validate the chunk (required columns, known role/level/year/department/
+     faculty ids, usernames and emails unique within the file and the database)
+  2. hash the initial passwords in a thread pool; password hashing is the
+     slow part of creating a user, and hashlib releases the GIL while it
+     hashes, so the threads run in parallel
+  3. insert the valid rows with executemany in one transaction per chunk
+
+Progress is reported after every chunk, and rejected rows are written to an
+error CSV (row number, username, email, error) that can be fixed and
+re-imported on its own.
+
+Expected columns (header names are case-insensitive):
+    username, email, first_name, last_name, role_id   required
+    password                                          optional if a default password is given
+    level_id, year_id, department_id, faculty_id, profile_picture
+
+Usage:
+    python user_import.py students.csv --db velocityver.db [--errors errors.csv]
+        [--default-password changeme] [--batch-size 500] [--workers 4]
+
+XLSX files need the optional `openpyxl` package.
+"""
+
+import argparse
+import csv
+import io
+import os
+import sqlite3
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from werkzeug.security import generate_password_hash
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+DEFAULT_BATCH_SIZE = 500
+REQUIRED_COLUMNS = ('username', 'email', 'first_name', 'last_name', 'role_id')
+OPTIONAL_COLUMNS = ('password', 'level_id', 'year_id', 'department_id', 'faculty_id', 'profile_picture')
+ERROR_COLUMNS = ('row', 'username', 'email', 'error')
+# Values per IN (...) lookup, well below SQLite's bound-parameter limit
+_LOOKUP_CHUNK = 500
+
+# Optional reference columns and the table their ids must exist in
+_REFERENCE_COLUMNS = {
+    'level_id': 'levels',
+    'year_id': 'years',
+    'department_id': 'departments',
+    'faculty_id': 'faculties',
+}
+
+
+class ImportFileError(Exception):
+    """The file as a whole cannot be imported (format, missing columns)"""
+
+
+def _normalise_header(header):
+    return [str(name or '').strip().lower() for name in header]
+
+
+def _iter_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as handle:
+        reader = csv.reader(handle)
+        header = next(reader, None)
+        if header is None:
+            return
+        yield _normalise_header(header)
+        for values in reader:
+            yield values
+
+
+def _iter_xlsx(path):
+    if openpyxl is None:
+        raise ImportFileError('XLSX import needs the openpyxl package (pip install openpyxl)')
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        yield _normalise_header(header)
+        for values in rows:
+            yield ['' if value is None else str(value) for value in values]
+    finally:
+        workbook.close()
+
+
+def iter_records(path):
+    """Yield (row_number, record dict) from a CSV or XLSX file, one row at a time
+
+    Row numbers are spreadsheet row numbers (the header is row 1). Blank rows
+    are skipped.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        rows = _iter_csv(path)
+    elif extension in ('.xlsx', '.xlsm'):
+        rows = _iter_xlsx(path)
+    else:
+        raise ImportFileError(f"Unsupported file type '{extension}' (expected .csv or .xlsx)")
+
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError('File is empty')
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ImportFileError(f"Missing required columns: {', '.join(missing)}")
+
+    for row_number, values in enumerate(rows, start=2):
+        record = {column: str(value).strip() for column, value in zip(header, values)
+                  if column in REQUIRED_COLUMNS or column in OPTIONAL_COLUMNS}
+        if any(record.values()):
+            yield row_number, record
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class UserImporter:
+    """Runs one import against an open connection; see run()"""
+
+    def __init__(self, conn, batch_size=DEFAULT_BATCH_SIZE, workers=None,
+                 default_password=None, default_password_hash=None, progress=None):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        # Rows without a password share the default password's hash; callers
+        # that queue the import pass the hash so the password is never stored
+        if default_password and not default_password_hash:
+            default_password_hash = generate_password_hash(default_password)
+        self.default_password_hash = default_password_hash
+        self.progress = progress
+        self.errors = []
+        self.stats = {'processed': 0, 'imported': 0, 'failed': 0, 'elapsed': 0.0}
+        self._seen_usernames = set()
+        self._seen_emails = set()
+        self._reference_ids = {
+            table: {row[0] for row in conn.execute(f'SELECT id FROM {table}')}
+            for table in set(_REFERENCE_COLUMNS.values()) | {'roles'}
+        }
+
+    def _reject(self, row_number, record, error):
+        self.errors.append({'row': row_number, 'username': record.get('username', ''),
+                            'email': record.get('email', ''), 'error': error})
+
+    def _validate_record(self, record):
+        for column in REQUIRED_COLUMNS:
+            if not record.get(column):
+                return f'{column} is required'
+        if '@' not in record['email']:
+            return 'email is invalid'
+        if not record.get('password') and not self.default_password_hash:
+            return 'password is required'
+        if record['role_id'] not in self._reference_ids['roles']:
+            return f"unknown role_id '{record['role_id']}'"
+        for column, table in _REFERENCE_COLUMNS.items():
+            if record.get(column) and record[column] not in self._reference_ids[table]:
+                return f"unknown {column} '{record[column]}'"
+        if record['username'].lower() in self._seen_usernames:
+            return 'username appears earlier in the file'
+        if record['email'].lower() in self._seen_emails:
+            return 'email appears earlier in the file'
+        return None
+
+    def _existing(self, column, values):
+        """Values of users.<column> already taken (values are lowercase)
+
+        Each lookup is a search of the LOWER(<column>) index of migration 6.
+        """
+        taken = set()
+        for start in range(0, len(values), _LOOKUP_CHUNK):
+            chunk = values[start:start + _LOOKUP_CHUNK]
+            placeholders = ', '.join('?' for _ in chunk)
+            taken.update(row[0] for row in self.conn.execute(
+                f'SELECT LOWER({column}) FROM users WHERE LOWER({column}) IN ({placeholders})', chunk))
+        return taken
+
+    def _validate_chunk(self, chunk):
+        valid = []
+        for row_number, record in chunk:
+            error = self._validate_record(record)
+            if error:
+                self._reject(row_number, record, error)
+                continue
+            self._seen_usernames.add(record['username'].lower())
+            self._seen_emails.add(record['email'].lower())
+            valid.append((row_number, record))
+
+        taken_usernames = self._existing('username', [r['username'].lower() for _, r in valid])
+        taken_emails = self._existing('email', [r['email'].lower() for _, r in valid])
+        accepted = []
+        for row_number, record in valid:
+            if record['username'].lower() in taken_usernames:
+                self._reject(row_number, record, 'username already exists')
+            elif record['email'].lower() in taken_emails:
+                self._reject(row_number, record, 'email already exists')
+            else:
+                accepted.append((row_number, record))
+        return accepted
+
+    def _hash_passwords(self, pool, records):
+        passwords = [record['password'] for _, record in records if record.get('password')]
+        if pool is None:
+            hashes = [generate_password_hash(password) for password in passwords]
+        else:
+            hashes = list(pool.map(generate_password_hash, passwords))
+        hashes = iter(hashes)
+        return [next(hashes) if record.get('password') else self.default_password_hash
+                for _, record in records]
+
+    def _insert(self, records, hashes):
+        now = datetime.now().isoformat()
+        rows = [(str(uuid.uuid4()), record['username'], record['email'], password_hash,
+                 record['role_id'], record['first_name'], record['last_name'],
+                 record.get('level_id') or None, record.get('year_id') or None,
+                 record.get('department_id') or None, record.get('faculty_id') or None,
+                 record.get('profile_picture') or 'default_avatar.png', now, now)
+                for (_, record), password_hash in zip(records, hashes)]
+        sql = '''
+            INSERT INTO users (id, username, email, password_hash, role_id, first_name, last_name,
+                               level_id, year_id, department_id, faculty_id, profile_picture,
+                               created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        '''
+        try:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self.conn.executemany(sql, rows)
+            self.conn.commit()
+            return len(rows)
+        except sqlite3.IntegrityError:
+            # Someone else created one of these users since the chunk was
+            # validated; retry row by row so only the conflicting rows fail
+            self.conn.rollback()
+
+        imported = 0
+        self.conn.execute('BEGIN IMMEDIATE')
+        for (row_number, record), row in zip(records, rows):
+            try:
+                self.conn.execute(sql, row)
+                imported += 1
+            except sqlite3.IntegrityError:
+                self._reject(row_number, record, 'username or email already exists')
+        self.conn.commit()
+        return imported
+
+    def _report(self, started):
+        self.stats['failed'] = len(self.errors)
+        self.stats['elapsed'] = round(time.perf_counter() - started, 2)
+        if self.progress:
+            self.progress(dict(self.stats))
+
+    def run(self, path):
+        """Import every row of path; returns the final stats dict"""
+        started = time.perf_counter()
+        pool = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        try:
+            for chunk in _chunks(iter_records(path), self.batch_size):
+                records = self._validate_chunk(chunk)
+                if records:
+                    hashes = self._hash_passwords(pool, records)
+                    self.stats['imported'] += self._insert(records, hashes)
+                self.stats['processed'] += len(chunk)
+                self._report(started)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return dict(self.stats)
+
+    def write_errors(self, target):
+        """Write rejected rows as CSV to a path or text stream"""
+        handle = open(target, 'w', newline='', encoding='utf-8') if isinstance(target, str) else target
+        try:
+            writer = csv.DictWriter(handle, fieldnames=ERROR_COLUMNS)
+            writer.writeheader()
+            writer.writerows(sorted(self.errors, key=lambda error: error['row']))
+        finally:
+            if isinstance(target, str):
+                handle.close()
+
+    def errors_csv(self):
+        buffer = io.StringIO()
+        self.write_errors(buffer)
+        return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import users from CSV or XLSX')
+    parser.add_argument('file', help='CSV or XLSX file to import')
+    parser.add_argument('--db', default='velocityver.db', help='SQLite database path')
+    parser.add_argument('--errors', help='Where to write rejected rows (default: <file>.errors.csv)')
+    parser.add_argument('--default-password', help='Initial password for rows without one')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=None, help='Password hashing threads')
+    args = parser.parse_args()
+
+    # Make sure the schema is current before importing
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import migrations
+
+    conn = sqlite3.connect(args.db)
+    conn.row_factory = sqlite3.Row
+    migrations.migrate(conn)
+
+    def show(stats):
+        print(f"   ⏳ {stats['processed']} rows processed, {stats['imported']} imported, "
+              f"{stats['failed']} failed ({stats['elapsed']}s)")
+
+    print(f"📥 Importing users from {args.file}...")
+    importer = UserImporter(conn, batch_size=args.batch_size, workers=args.workers,
+                            default_password=args.default_password, progress=show)
+    try:
+        stats = importer.run(args.file)
+    except ImportFileError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    print(f"✅ Imported {stats['imported']} of {stats['processed']} rows in {stats['elapsed']}s")
+    if importer.errors:
+        errors_path = args.errors or f'{args.file}.errors.csv'
+        importer.write_errors(errors_path)
+        print(f"⚠️  {len(importer.errors)} rows rejected, see {errors_path}")
+
+
+if __name__ == '__main__':
+    main()